@@ -0,0 +1,86 @@
+"""
+Compares two benchmark results written by benchmarks.run:
+
+    python -m benchmarks.compare before.json after.json
+
+Exits with 1 when a scenario got slower than --threshold percent at
+the median, or runs more queries per request.
+"""
+import argparse
+import json
+import sys
+
+COLUMNS = (
+    ('p50 ms', lambda result: result['latency_ms']['p50']),
+    ('p99 ms', lambda result: result['latency_ms']['p99']),
+    ('req/s', lambda result: result['throughput']),
+    ('queries', lambda result: result['queries_per_request']['mean']),
+)
+
+
+def _change(before, after):
+    if not before:
+        return ''
+
+    return '{:+.1f}%'.format((after - before) / before * 100)
+
+
+def compare(before, after, threshold):
+    """
+    Prints a table of the scenarios both results have, returns the
+    names of the ones that regressed
+    """
+    regressed = []
+
+    for key in ('rows', 'cache', 'commit'):
+        print('{:<10} {} -> {}'.format(
+            key, before['meta'].get(key), after['meta'].get(key)
+        ))
+    print()
+
+    print('{:<22}'.format('scenario') + ''.join(
+        '{:>26}'.format(title) for title, _ in COLUMNS
+    ))
+
+    for name in sorted(set(before['scenarios']) & set(after['scenarios'])):
+        old, new = before['scenarios'][name], after['scenarios'][name]
+
+        line = '{:<22}'.format(name)
+        for _, value in COLUMNS:
+            line += '{:>26}'.format('{:g} -> {:g} {:>8}'.format(
+                value(old), value(new), _change(value(old), value(new))
+            ))
+        print(line)
+
+        p50 = COLUMNS[0][1]
+        queries = COLUMNS[3][1]
+        if p50(new) > p50(old) * (1 + threshold / 100.0) or \
+                queries(new) > queries(old):
+            regressed.append(name)
+
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed p50 slowdown in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    regressed = compare(before, after, args.threshold)
+    if regressed:
+        print('\nRegressed: {}'.format(', '.join(regressed)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+
+from webapp import seeding
+from webapp.models import db, User, Role
+
+# the account the auth and write scenarios log in with
+USERNAME = 'bench'
+PASSWORD = seeding.PASSWORD
+
+
+def build(rows, seed=0):
+    """
+    Fills the empty database of the current app with rows categories,
+    rows items and one author per hundred categories, plus the poster
+    the scenarios log in as. The same rows and seed always give the
+    same data.
+    """
+    db.create_all()
+    seeding.ensure_roles()
+
+    user = User(USERNAME)
+    user.set_password(PASSWORD)
+    user.roles.append(Role.query.filter_by(name='poster').one())
+    db.session.add(user)
+    db.session.commit()
+
+    seeding.seed(
+        users=max(rows // 100, 1),
+        categories=rows,
+        items=rows,
+        seed=seed
+    )
+
+
+def _schema_version():
+    ddl = ''.join(
+        str(CreateTable(table).compile(dialect=sqlite.dialect()))
+        for table in db.metadata.sorted_tables
+    )
+    return hashlib.sha1(ddl.encode('utf-8')).hexdigest()[:8]
+
+
+def path(rows, seed=0, directory=None):
+    """
+    Where the dataset for rows and seed is kept. The name includes the
+    schema, a model change builds a new dataset.
+    """
+    directory = directory or os.path.join(
+        tempfile.gettempdir(), 'webapp-benchmarks'
+    )
+    return os.path.join(directory, 'dataset-{}-{}-{}.sqlite'.format(
+        rows, seed, _schema_version()
+    ))
+
+
+def prepare(make_app, rows, seed=0, directory=None):
+    """
+    Returns the path of a fresh copy of the dataset for rows and seed,
+    building the dataset first if it isn't there yet. Scenarios write,
+    so every run gets its own copy and starts from the same data.
+    """
+    source = path(rows, seed, directory)
+
+    if not os.path.exists(source):
+        os.makedirs(os.path.dirname(source), exist_ok=True)
+        building = source + '.building'
+        if os.path.exists(building):
+            os.remove(building)
+
+        app = make_app(building)
+        with app.app_context():
+            build(rows, seed)
+            db.session.remove()
+            db.engine.dispose()
+
+        os.rename(building, source)
+
+    fd, copy = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    shutil.copyfile(source, copy)
+
+    return copy
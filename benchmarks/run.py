@@ -0,0 +1,289 @@
+"""
+Drives the busiest pages and api calls through the WSGI app, over a
+seeded dataset, and writes the timings out as JSON:
+
+    python -m benchmarks.run --rows 10000 --output before.json
+    python -m benchmarks.run --rows 10000 --output after.json
+    python -m benchmarks.compare before.json after.json
+
+Datasets are built once per size, seed and schema and kept in the
+temporary directory, building the 1000000 row one takes a while.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from sqlalchemy import event
+
+from webapp import create_app
+from webapp.config import Config
+from webapp.models import db, Item
+from webapp.extensions import admin, rest_api
+from . import dataset
+
+# build(context) returns the arguments for the test client's open()
+Scenario = namedtuple('Scenario', ['name', 'share', 'build'])
+
+
+def _category_id(context):
+    return context.rng.randint(1, context.rows)
+
+
+SCENARIOS = (
+    Scenario('blog.home', 1, lambda context: dict(
+        path='/blog/'
+    )),
+    Scenario('blog.category', 1, lambda context: dict(
+        path='/blog/category/{}'.format(_category_id(context))
+    )),
+    Scenario('blog.item', 1, lambda context: dict(
+        path='/blog/item/{}'.format(context.rng.choice(context.item_names))
+    )),
+    Scenario('api.category.list', 1, lambda context: dict(
+        path='/api/category'
+    )),
+    Scenario('api.category.detail', 1, lambda context: dict(
+        path='/api/category/{}'.format(_category_id(context))
+    )),
+    Scenario('api.category.post', 1, lambda context: dict(
+        path='/api/category',
+        method='POST',
+        data=dict(
+            token=context.token,
+            title='Benchmark {}'.format(context.rng.random()),
+            text='<p>Posted by the benchmark</p>',
+            tags=[context.rng.choice(context.item_names), 'benchmark']
+        )
+    )),
+    # every login is a full bcrypt check, a tenth as many keep the run
+    # short
+    Scenario('api.auth', 0.1, lambda context: dict(
+        path='/api/auth',
+        method='POST',
+        data=dict(username=dataset.USERNAME, password=dataset.PASSWORD)
+    )),
+)
+
+
+class Context(object):
+    def __init__(self, rows, rng, item_names, token):
+        self.rows = rows
+        self.rng = rng
+        self.item_names = item_names
+        self.token = token
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.record)
+
+    def record(self, *args):
+        self.count += 1
+
+
+def make_app(database, cache_type='null'):
+    class BenchmarkConfig(Config):
+        SECRET_KEY = 'benchmark'
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        CACHE_TYPE = cache_type
+        CACHE_NO_NULL_WARNING = True
+        DEBUG_TB_ENABLED = False
+        WTF_CSRF_ENABLED = False
+        MAIL_SUPPRESS_SEND = True
+        METRICS_DIR = None
+
+    # Bug workarounds, the extensions keep the views and resources of
+    # the previous app
+    admin._views = []
+    rest_api.resources = []
+
+    return create_app(BenchmarkConfig)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(q * len(ordered))) - 1, 0)]
+
+
+def run_scenario(client, counter, scenario, context, requests, warmup):
+    for _ in range(warmup):
+        client.open(**scenario.build(context))
+
+    latencies, queries, errors = [], [], 0
+    started = time.perf_counter()
+
+    for _ in range(requests):
+        kwargs = scenario.build(context)
+
+        counter.count = 0
+        start = time.perf_counter()
+        response = client.open(**kwargs)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        queries.append(counter.count)
+
+        if response.status_code >= 400:
+            errors += 1
+
+    elapsed = time.perf_counter() - started
+
+    return dict(
+        requests=requests,
+        errors=errors,
+        seconds=round(elapsed, 4),
+        throughput=round(requests / elapsed, 2),
+        latency_ms=dict(
+            mean=round(sum(latencies) / requests * 1000, 3),
+            p50=round(percentile(latencies, 0.5) * 1000, 3),
+            p90=round(percentile(latencies, 0.9) * 1000, 3),
+            p99=round(percentile(latencies, 0.99) * 1000, 3),
+            max=round(max(latencies) * 1000, 3)
+        ),
+        queries_per_request=dict(
+            mean=round(sum(queries) / requests, 2),
+            max=max(queries)
+        )
+    )
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(
+            ('git',) + args,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows, seed=0, requests=200, warmup=10, cache_type='null',
+        names=None, directory=None):
+    """
+    Runs the scenarios named in names, all of them by default, and
+    returns the results
+    """
+    database = dataset.prepare(
+        lambda path: make_app(path, cache_type), rows, seed, directory
+    )
+
+    try:
+        app = make_app(database, cache_type)
+        client = app.test_client()
+
+        with app.app_context():
+            rng = random.Random(seed)
+            item_names = sorted(set(
+                name for name, in db.session.query(Item.name).filter(
+                    Item.id.in_([rng.randint(1, rows) for _ in range(100)])
+                )
+            ))
+
+            result = client.post('/api/auth', data=dict(
+                username=dataset.USERNAME,
+                password=dataset.PASSWORD
+            ))
+            token = json.loads(result.get_data(as_text=True))['token']
+
+            counter = QueryCounter(db.engine)
+            results = {}
+
+            for scenario in SCENARIOS:
+                if names and scenario.name not in names:
+                    continue
+
+                context = Context(
+                    rows,
+                    random.Random('{}-{}'.format(seed, scenario.name)),
+                    item_names,
+                    token
+                )
+                results[scenario.name] = run_scenario(
+                    client,
+                    counter,
+                    scenario,
+                    context,
+                    max(int(requests * scenario.share), 1),
+                    max(int(warmup * scenario.share), 1)
+                )
+
+            db.session.remove()
+    finally:
+        os.remove(database)
+
+    return dict(
+        meta=dict(
+            commit=_git('rev-parse', 'HEAD'),
+            dirty=bool(_git('status', '--porcelain', '--untracked-files=no')),
+            date=datetime.datetime.utcnow().isoformat() + 'Z',
+            python=platform.python_version(),
+            platform=platform.platform(),
+            rows=rows,
+            seed=seed,
+            requests=requests,
+            cache=cache_type
+        ),
+        scenarios=results
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='categories and items in the dataset, '
+                             'e.g. 10000, 100000 or 1000000')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='untimed requests per scenario')
+    parser.add_argument('--cache', default='null',
+                        help="CACHE_TYPE, 'null' times the uncached path")
+    parser.add_argument('--scenario', action='append', dest='names',
+                        choices=[scenario.name for scenario in SCENARIOS],
+                        help='run only this scenario, can be repeated')
+    parser.add_argument('--data-dir', help='where datasets are kept')
+    parser.add_argument('--output', help='file to write, default stdout')
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.rows,
+        args.seed,
+        args.requests,
+        args.warmup,
+        args.cache,
+        args.names,
+        args.data_dir
+    )
+
+    document = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+    else:
+        print(document)
+
+    failed = [
+        name for name, result in results['scenarios'].items()
+        if result['errors']
+    ]
+    if failed:
+        print('Requests failed in: {}'.format(', '.join(failed)),
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
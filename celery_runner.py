@@ -4,6 +4,8 @@ from celery import Celery
 
 from utils.loadenvironment import load_environment
 from webapp import create_app
+from webapp.metrics import metrics
+from webapp.routing import use_replica
 
 load_environment()
 
@@ -21,7 +23,8 @@ def make_celery(app):
         abstract = True
 
         def __call__(self, *args, **kwargs):
-            with app.app_context():
+            with app.app_context(), metrics.task_run(self), \
+                    use_replica(getattr(self, 'read_only', False)):
                 return TaskBase.__call__(self, *args, **kwargs)
 
     celery.Task = ContextTask
@@ -30,6 +33,8 @@ def make_celery(app):
 
 
 env = os.environ.get('WEBAPP_ENV', 'dev')
-flask_app = create_app(f'webapp.config.{env.capitalize()}Config')
+flask_app = create_app(
+    f'webapp.config.{env.capitalize()}Config', profile='worker'
+)
 
 celery = make_celery(flask_app)
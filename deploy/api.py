@@ -0,0 +1,4 @@
+from webapp import create_app
+
+# run by uwsgi-api.ini, nginx sends /api/ here
+app = create_app('webapp.config.ApiConfig')
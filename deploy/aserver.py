@@ -0,0 +1,7 @@
+from aiohttp import web
+
+from webapp.asyncapi import make_app
+
+app = make_app('webapp.config.ProdConfig')
+
+web.run_app(app, host='127.0.0.1', port=8082)
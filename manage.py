@@ -1,3 +1,5 @@
+import subprocess
+import sys
 from os import getenv
 
 from flask_assets import ManageAssets
@@ -12,7 +14,12 @@ from webapp.models import db, User, Role, Item, Category
 load_environment()
 # default to dev config
 env = getenv('WEBAPP_ENV', 'dev')
-app = create_app(f'webapp.config.{env.capitalize()}Config')
+# only the commands that serve or list the site need all of it
+WEB_COMMANDS = ('server', 'show-urls', 'assets', 'shell')
+profile = getenv('WEBAPP_PROFILE') or (
+    'web' if set(sys.argv[1:2]) & set(WEB_COMMANDS) else 'cli'
+)
+app = create_app(f'webapp.config.{env.capitalize()}Config', profile=profile)
 
 migrate = Migrate(app, db)
 
@@ -61,5 +68,142 @@ def setup_db():
         pass
 
 
+@manager.command
+def advise_indexes():
+    """ Runs EXPLAIN on the hot queries and reports full table scans """
+    from webapp.explain import explain_hot_queries, UnsupportedDatabase
+
+    try:
+        results = explain_hot_queries()
+    except UnsupportedDatabase as e:
+        print(e)
+        return 1
+
+    missing = 0
+    for result in results:
+        if result.full_scans:
+            missing += 1
+            print("SCAN  {}: {}".format(
+                result.name, ", ".join(result.full_scans)
+            ))
+            for line in result.plan:
+                print("      " + line)
+        else:
+            print("ok    " + result.name)
+
+    if missing:
+        print("{} queries read a whole table".format(missing))
+        return 1
+
+
+@manager.command
+def reindex_search():
+    """ Rebuilds the full text search index from the database """
+    from webapp.search import reindex, SearchUnavailable
+
+    try:
+        reindex(db.session.connection())
+    except SearchUnavailable as e:
+        print(e)
+        return 1
+
+    db.session.commit()
+
+
+@manager.command
+def task_stats():
+    """ Summarizes queue wait, run time, retries and failures per task """
+    from webapp.metrics import metrics, quantile
+
+    if not metrics.directory:
+        print("Set METRICS_DIR for the web and celery processes first")
+        return 1
+
+    counters, histograms = metrics.collect()
+
+    runs = {}
+    for (name, labels), value in counters.items():
+        if name == 'webapp_tasks_total':
+            labels = dict(labels)
+            runs.setdefault(labels['task'], {})[labels['state']] = value
+
+    def timing(metric, task):
+        histogram = histograms.get((metric, (('task', task),)))
+        if not histogram or not histogram[-1]:
+            return "-"
+
+        p95 = quantile(metric, histogram, 0.95)
+        return "{:.2f}s / {}".format(
+            histogram[-2] / histogram[-1],
+            "<={:g}s".format(p95) if p95 is not None else "longer"
+        )
+
+    print("{:<40} {:>7} {:>7} {:>7}  {:<20} {:<20}".format(
+        "task", "ok", "retry", "failed",
+        "queued (avg / p95)", "ran (avg / p95)"
+    ))
+    for task in sorted(runs):
+        states = runs[task]
+        print("{:<40} {:>7} {:>7} {:>7}  {:<20} {:<20}".format(
+            task,
+            int(states.get('success', 0)),
+            int(states.get('retry', 0)),
+            int(states.get('failure', 0)),
+            timing('webapp_task_queue_seconds', task),
+            timing('webapp_task_run_seconds', task)
+        ))
+
+
+@manager.option('-u', '--users', type=int, default=10000)
+@manager.option('-c', '--categories', type=int, default=100000)
+@manager.option('-i', '--items', type=int, default=100000)
+@manager.option('-s', '--seed', type=int, default=0)
+def seed(users, categories, items, seed):
+    """ Bulk inserts generated users, categories and items """
+    from webapp.seeding import seed as seed_database, PASSWORD
+
+    def progress(table, done, total):
+        print("{:<10} {:>10} / {}".format(table, done, total or "?"))
+
+    db.create_all()
+    seed_database(users, categories, items, seed, progress=progress)
+    print("Seeded users log in with the password '{}'".format(PASSWORD))
+
+
+STARTUP_SCRIPT = """
+import json
+from webapp import create_app
+
+app = create_app({config!r}, profile={profile!r})
+print(json.dumps(list(app.extensions['startup_times'].items())))
+"""
+
+
+@manager.option('-r', '--repeat', type=int, default=3)
+def startup_profile(repeat):
+    """ Times importing webapp and setting up every profile, cold """
+    import json
+    from webapp import PROFILES
+
+    config = f'webapp.config.{env.capitalize()}Config'
+
+    for name in sorted(PROFILES):
+        # a new interpreter every time, nothing is imported yet
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.check_output([
+                sys.executable,
+                '-c',
+                STARTUP_SCRIPT.format(config=config, profile=name)
+            ])
+            runs.append(json.loads(output.decode().splitlines()[-1]))
+
+        print("{} (best of {})".format(name, repeat))
+        for i, (part, _) in enumerate(runs[0]):
+            print("    {:<16} {:>8.1f} ms".format(
+                part, min(run[i][1] for run in runs) * 1000
+            ))
+
+
 if __name__ == "__main__":
     manager.run()
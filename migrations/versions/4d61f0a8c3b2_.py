@@ -0,0 +1,58 @@
+"""full text search index
+
+Revision ID: 4d61f0a8c3b2
+Revises: e2a7c9d14f38
+Create Date: 2026-10-18 18:05:11.672940
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4d61f0a8c3b2'
+down_revision = 'e2a7c9d14f38'
+branch_labels = None
+depends_on = None
+
+# the index as of this revision, a document id is the row id times 8
+# plus 0 for a category and 1 for an item. Copied here rather than
+# imported from webapp.search, which can change after this revision.
+UPGRADE = {
+    # an fts5 virtual table
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, tokenize = 'porter unicode61')",
+        "INSERT INTO search_index (rowid, title, body) "
+        "SELECT id * 8 + 0, title, text_plain FROM category",
+        "INSERT INTO search_index (rowid, title, body) "
+        "SELECT id * 8 + 1, name, text_plain FROM item",
+    ],
+    # a tsvector column with a GIN index
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS search_index ("
+        "doc_id BIGINT PRIMARY KEY, title TEXT, body TEXT, "
+        "document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_search_index_document "
+        "ON search_index USING GIN (document)",
+        "INSERT INTO search_index (doc_id, title, body, document) "
+        "SELECT id * 8 + 0, title, text_plain, "
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(text_plain, '')), 'B') "
+        "FROM category",
+        "INSERT INTO search_index (doc_id, title, body, document) "
+        "SELECT id * 8 + 1, name, text_plain, "
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(text_plain, '')), 'B') "
+        "FROM item",
+    ],
+}
+
+
+def upgrade():
+    # other databases search with LIKE, there is nothing to create
+    for statement in UPGRADE.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name in UPGRADE:
+        op.execute("DROP TABLE IF EXISTS search_index")
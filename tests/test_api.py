@@ -0,0 +1,311 @@
+import datetime
+import json
+import time
+import unittest
+from unittest import mock
+
+import bcrypt
+from sqlalchemy import event
+
+from webapp import create_app
+from webapp.models import db, User, Role, Category, Item
+from webapp.extensions import admin, rest_api
+from webapp.tokens import auth_tokens, Serializer
+
+
+class TestCategoryApi(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        # tokens are kept per process, and every test's user gets id 1
+        auth_tokens.verified.clear()
+        auth_tokens.revoked.clear()
+
+        app = create_app('webapp.config.TestConfig')
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        default = Role("default")
+        db.session.add(default)
+        db.session.commit()
+
+        self.user = User("author")
+        self.user.set_password("password")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def add_categories(self, count):
+        start = datetime.datetime(2017, 1, 1)
+
+        for i in range(count):
+            category = Category("Category {}".format(i))
+            category.text = "<p>Text {}</p>".format(i)
+            category.publish_date = start + datetime.timedelta(hours=i)
+            category.user = self.user
+            category.tags = [Item("tag {}".format(i)), Item("other")]
+            db.session.add(category)
+        db.session.commit()
+        db.session.remove()
+
+    def get_token(self):
+        result = self.client.post('/api/auth', data=dict(
+            username="author",
+            password="password"
+        ))
+        self.assertEqual(result.status_code, 200)
+
+        return json.loads(result.data.decode('utf-8'))['token']
+
+    def record_queries(self, method, url, **kwargs):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            result = getattr(self.client, method)(url, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        return result, statements
+
+    def count_queries(self, url):
+        result, statements = self.record_queries('get', url)
+        self.assertEqual(result.status_code, 200)
+
+        return len(statements), json.loads(result.data.decode('utf-8'))
+
+    def test_list_query_count_is_constant(self):
+        """ Tests that marshalling a page does not lazy load per row """
+
+        self.add_categories(3)
+        small_count, small = self.count_queries('/api/category')
+
+        self.add_categories(40)
+        full_count, full = self.count_queries('/api/category')
+
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(full), 30)
+        self.assertEqual(small_count, full_count)
+
+        self.assertEqual(full[0]['author'], "author")
+        self.assertEqual(len(full[0]['tags']), 2)
+
+    def test_detail(self):
+        """ Tests the detail view and its query count """
+
+        self.add_categories(1)
+        category = Category.query.one()
+
+        count, data = self.count_queries(
+            '/api/category/{}'.format(category.id)
+        )
+
+        self.assertEqual(data['title'], "Category 0")
+        self.assertEqual(data['text'], "Text 0")
+        self.assertEqual(
+            sorted(tag['title'] for tag in data['tags']),
+            ["other", "tag 0"]
+        )
+        self.assertLessEqual(count, 2)
+
+    def test_token_writes_skip_user_lookup(self):
+        """ Tests that a known token authorizes a write without loading the user """
+
+        token = self.get_token()
+        data = dict(token=token, title="Posted", text="<p>Body</p>")
+
+        result = self.client.post('/api/category', data=data)
+        self.assertEqual(result.status_code, 201)
+
+        result, statements = self.record_queries(
+            'post', '/api/category', data=data
+        )
+        self.assertEqual(result.status_code, 201)
+        self.assertFalse([s for s in statements if 'user.username' in s])
+
+        self.assertEqual(
+            Category.query.filter_by(title="Posted").first().user.username,
+            "author"
+        )
+
+    def test_tags_stay_with_their_category(self):
+        """ Tests that tagging a post never takes the tag off another one """
+
+        token = self.get_token()
+
+        for title in ("First", "Second"):
+            result = self.client.post('/api/category', data=dict(
+                token=token, title=title, text="Body", tags="python"
+            ))
+            self.assertEqual(result.status_code, 201)
+
+        result = self.client.put('/api/category/1', data=dict(
+            token=token, tags=["python", "flask"]
+        ))
+        self.assertEqual(result.status_code, 201)
+
+        first = Category.query.filter_by(title="First").one()
+        second = Category.query.filter_by(title="Second").one()
+        self.assertEqual(
+            sorted(tag.name for tag in first.tags), ["flask", "python"]
+        )
+        self.assertEqual([tag.name for tag in second.tags], ["python"])
+
+    def test_revoked_token_is_rejected(self):
+        """ Tests that a revoked token can no longer write """
+
+        token = self.get_token()
+        data = dict(token=token, title="Posted", text="Body")
+
+        result = self.client.post('/api/category', data=data)
+        self.assertEqual(result.status_code, 201)
+
+        result = self.client.delete('/api/auth', data=dict(token=token))
+        self.assertEqual(result.status_code, 204)
+
+        result = self.client.post('/api/category', data=data)
+        self.assertEqual(result.status_code, 401)
+
+        result = self.client.post(
+            '/api/category',
+            data=dict(token="not a token", title="Posted", text="Body")
+        )
+        self.assertEqual(result.status_code, 401)
+
+    def test_tokens_of_the_same_second_are_apart(self):
+        """ Tests that revoking a token leaves a twin login alone """
+
+        now = int(time.time())
+
+        with db.app.app_context():
+            with mock.patch.object(Serializer, 'now', return_value=now):
+                first = auth_tokens.generate(1)
+                second = auth_tokens.generate(1)
+
+            self.assertNotEqual(first, second)
+
+            auth_tokens.revoke(first)
+            self.assertIsNone(auth_tokens.verify(first))
+            self.assertIsNotNone(auth_tokens.verify(second))
+
+    def test_tokens_end_with_the_password(self):
+        """ Tests that a new password or deleting the user revokes tokens """
+
+        data = dict(token=self.get_token(), title="Posted", text="Body")
+
+        user = User.query.filter_by(username="author").one()
+        user.set_password("changed")
+        db.session.commit()
+        db.session.remove()
+
+        result = self.client.post('/api/category', data=data)
+        self.assertEqual(result.status_code, 401)
+
+        other = User("other")
+        other.set_password("password")
+        db.session.add(other)
+        db.session.commit()
+
+        result = self.client.post('/api/auth', data=dict(
+            username="other",
+            password="password"
+        ))
+        data['token'] = json.loads(result.data.decode('utf-8'))['token']
+
+        db.session.delete(other)
+        db.session.commit()
+        db.session.remove()
+
+        result = self.client.post('/api/category', data=data)
+        self.assertEqual(result.status_code, 401)
+        self.assertEqual(Category.query.count(), 0)
+
+    def test_login_right_after_revocation(self):
+        """ Tests that a token from just after a new password is valid """
+
+        old = self.get_token()
+
+        user = User.query.filter_by(username="author").one()
+        user.set_password("changed")
+        db.session.commit()
+        db.session.remove()
+
+        result = self.client.post('/api/auth', data=dict(
+            username="author",
+            password="changed"
+        ))
+        new = json.loads(result.data.decode('utf-8'))['token']
+
+        result = self.client.post('/api/category', data=dict(
+            token=old, title="Old", text="Body"
+        ))
+        self.assertEqual(result.status_code, 401)
+
+        result = self.client.post('/api/category', data=dict(
+            token=new, title="New", text="Body"
+        ))
+        self.assertEqual(result.status_code, 201)
+
+    def test_login_rehashes_old_work_factor(self):
+        """ Tests that logging in upgrades a hash made with another cost """
+
+        user = User.query.filter_by(username="author").one()
+        self.assertTrue(user.password.startswith('$2b$04$'))
+
+        user.password = bcrypt.hashpw(
+            b"password", bcrypt.gensalt(5)
+        ).decode('utf-8')
+        db.session.commit()
+        db.session.remove()
+
+        self.get_token()
+
+        user = User.query.filter_by(username="author").one()
+        self.assertTrue(user.password.startswith('$2b$04$'))
+        self.assertTrue(user.check_password("password"))
+        self.assertFalse(user.check_password("wrong"))
+
+    def test_plain_text_is_precomputed(self):
+        """ Tests that text_plain and excerpt follow writes to text """
+
+        category = Category("Long")
+        category.text = "<p>" + "word " * 200 + "</p>"
+
+        self.assertNotIn("<p>", category.text_plain)
+        self.assertTrue(category.excerpt.endswith("..."))
+        self.assertLessEqual(len(category.excerpt), 500)
+
+        category.text = "<b>short</b>"
+        self.assertEqual(category.text_plain, "short")
+        self.assertEqual(category.excerpt, "short")
+
+    def test_cursor_headers(self):
+        """ Tests that the list returns a next cursor to follow """
+
+        self.add_categories(35)
+
+        result = self.client.get('/api/category')
+        cursor = result.headers['X-Next-Cursor']
+        self.assertIn('rel="next"', result.headers['Link'])
+        self.assertIn('ETag', result.headers)
+
+        result = self.client.get('/api/category?cursor=' + cursor)
+        data = json.loads(result.data.decode('utf-8'))
+        self.assertEqual(len(data), 5)
+        self.assertNotIn('X-Next-Cursor', result.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+import json
+import shutil
+import tempfile
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webapp import create_app, asyncapi
+from webapp.caching import invalidate
+from webapp.config import TestConfig
+from webapp.models import db, User, Role, Category, Item
+from webapp.extensions import admin, rest_api
+
+
+class TestAsyncApi(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        self.directory = directory = tempfile.mkdtemp()
+
+        class Config(TestConfig):
+            # both servers have to see the same tag versions
+            CACHE_TYPE = 'filesystem'
+            CACHE_DIR = directory
+
+        self.config = Config
+
+        app = create_app(self.config)
+        self.app = app
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        db.session.add(Role("default"))
+        db.session.commit()
+
+        start = datetime.datetime(2017, 1, 1)
+        for name in ("author", "other"):
+            user = User(name)
+            db.session.add(user)
+
+            for i in range(40):
+                category = Category("Category {} {}".format(name, i))
+                category.text = "<p>Text {}</p>".format(i)
+                category.publish_date = start + datetime.timedelta(
+                    hours=i, microseconds=i % 2
+                )
+                category.user = user
+                category.tags = [Item("tag {}".format(i)), Item("other")]
+                db.session.add(category)
+        db.session.commit()
+        db.session.remove()
+
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(self.directory)
+
+    def fetch_all(self, urls, headers=None, read=None):
+        """ Gets every url from the async server, in order """
+        async def read_json(response):
+            return (
+                response.status,
+                await response.json(),
+                response.headers.get('X-Next-Cursor'),
+                response.headers.get('Link')
+            )
+
+        async def fetch():
+            client = TestClient(
+                TestServer(asyncapi.make_app(self.config), loop=self.loop),
+                loop=self.loop
+            )
+            await client.start_server()
+
+            results = []
+            try:
+                for url in urls:
+                    response = await client.get(url, headers=headers)
+                    results.append(await (read or read_json)(response))
+            finally:
+                await client.close()
+
+            return results
+
+        return self.loop.run_until_complete(fetch())
+
+    def fetch_validators(self, url, headers=None):
+        """ Gets the status, ETag and Last-Modified of an async read """
+        async def read(response):
+            return (
+                response.status,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
+
+        result, = self.fetch_all([url], headers, read)
+        return result
+
+    def fetch_sync(self, url, headers=None):
+        response = self.client.get(url, headers=headers)
+
+        return (
+            response.status_code,
+            json.loads(response.data.decode('utf-8')),
+            response.headers.get('X-Next-Cursor'),
+            response.headers.get('Link')
+        )
+
+    def test_same_as_category_api(self):
+        """ Tests that the async reads answer like CategoryApi """
+
+        first = self.fetch_sync('/api/category')
+        urls = [
+            '/api/category',
+            '/api/category?cursor=' + first[2],
+            '/api/category?user=other',
+            '/api/category?page=2',
+            '/api/category/3',
+        ]
+
+        for url, result in zip(urls, self.fetch_all(urls)):
+            self.assertEqual(result, self.fetch_sync(url), url)
+
+        self.assertEqual(len(first[1]), 30)
+        self.assertEqual(
+            [tag['title'] for tag in first[1][0]['tags']],
+            ['tag 39', 'other']
+        )
+
+    def test_errors(self):
+        """ Tests unknown categories, users and cursors """
+
+        urls = [
+            '/api/category/999',
+            '/api/category?user=nobody',
+            '/api/category?cursor=nonsense',
+            '/api/category?page=9',
+        ]
+        statuses = [result[0] for result in self.fetch_all(urls)]
+
+        self.assertEqual(statuses, [404, 404, 400, 404])
+
+    def test_headers(self):
+        """ Tests that the arguments can come as headers """
+
+        result, = self.fetch_all(['/api/category'], {'user': 'author'})
+
+        self.assertEqual(len(result[1]), 30)
+        self.assertTrue(all(
+            category['author'] == 'author' for category in result[1]
+        ))
+
+    def test_conditional(self):
+        """ Tests that the async reads revalidate like CategoryApi """
+
+        for url in ('/api/category', '/api/category/3'):
+            response = self.client.get(url)
+            etag = response.headers['ETag']
+
+            self.assertEqual(
+                self.fetch_validators(url),
+                (200, etag, response.headers.get('Last-Modified'))
+            )
+            self.assertEqual(
+                self.fetch_validators(url, {'If-None-Match': etag})[:2],
+                (304, etag)
+            )
+
+            # the sync server takes the async ETag as well
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+        with self.app.app_context():
+            invalidate('Item')
+
+        status, new_etag, _ = self.fetch_validators(
+            '/api/category/3',
+            {'If-None-Match': etag}
+        )
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_etag, etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
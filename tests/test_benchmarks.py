@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import compare, dataset, run
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run_and_compare(self):
+        """ Tests a small run end to end, and comparing it with itself """
+
+        names = ['blog.home', 'blog.item', 'api.category.post']
+        results = run.run(
+            rows=50,
+            requests=3,
+            warmup=1,
+            names=names,
+            directory=self.directory
+        )
+
+        self.assertEqual(sorted(results['scenarios']), sorted(names))
+        for result in results['scenarios'].values():
+            self.assertEqual(result['errors'], 0)
+            self.assertEqual(result['requests'], 3)
+            self.assertGreater(result['queries_per_request']['mean'], 0)
+        self.assertEqual(results['meta']['rows'], 50)
+
+        self.assertEqual(compare.compare(results, results, 10), [])
+
+        slower = json.loads(json.dumps(results))
+        slower['scenarios']['blog.home']['queries_per_request']['mean'] += 1
+        self.assertEqual(
+            compare.compare(results, slower, 10),
+            ['blog.home']
+        )
+
+    def test_dataset_is_reused(self):
+        """ Tests that a dataset is built once and every run gets a copy """
+
+        make_app = run.make_app
+
+        first = dataset.prepare(make_app, 20, directory=self.directory)
+        source = dataset.path(20, directory=self.directory)
+        with open(source, 'rb') as f:
+            built = f.read()
+
+        second = dataset.prepare(make_app, 20, directory=self.directory)
+
+        self.assertNotEqual(first, second)
+        with open(second, 'rb') as f:
+            self.assertEqual(f.read(), built)
+
+        os.remove(first)
+        os.remove(second)
+
+
+if __name__ == '__main__':
+    unittest.main()
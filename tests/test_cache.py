@@ -0,0 +1,242 @@
+import datetime
+import unittest
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.models import db, User, Role, Category, Item
+from webapp.caching import stale_while_revalidate, tag_versions
+from webapp.extensions import admin, rest_api, cache
+
+
+class CachedTestConfig(TestConfig):
+    CACHE_TYPE = 'simple'
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(CachedTestConfig)
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        cache.clear()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def add_category(self, title):
+        category = Category(title)
+        category.text = "Text for " + title
+        category.publish_date = datetime.datetime.now()
+        db.session.add(category)
+        db.session.commit()
+
+        return category
+
+    def test_home_is_cached(self):
+        """ Tests that a cached page survives writes the ORM never saw """
+
+        self.add_category("First")
+        self.client.get('/blog/')
+
+        db.session.execute(
+            "UPDATE category SET title = 'Renamed' WHERE title = 'First'"
+        )
+        db.session.commit()
+
+        result = self.client.get('/blog/')
+        self.assertIn("First", result.data.decode('utf-8'))
+
+    def test_commit_invalidates_tagged_pages(self):
+        """ Tests that committing a Category expires the pages showing it """
+
+        first = self.add_category("First")
+        result = self.client.get('/blog/category/{}'.format(first.id))
+        self.assertIn("First", result.data.decode('utf-8'))
+
+        self.add_category("Second")
+
+        result = self.client.get('/blog/')
+        self.assertIn("Second", result.data.decode('utf-8'))
+
+        first.title = "Renamed"
+        db.session.commit()
+
+        result = self.client.get('/blog/category/{}'.format(first.id))
+        self.assertIn("Renamed", result.data.decode('utf-8'))
+
+    def test_moved_item_invalidates_both_categories(self):
+        """ Tests that moving an item expires the category it left """
+
+        first = self.add_category("First")
+        second = self.add_category("Second")
+
+        item = Item("hammer")
+        item.category_id = first.id
+        db.session.add(item)
+        db.session.commit()
+
+        def versions():
+            return tag_versions([
+                'Category:{}'.format(first.id),
+                'Category:{}'.format(second.id)
+            ])
+
+        # by id, as the admin form would
+        before = versions()
+        item.category_id = second.id
+        db.session.commit()
+        after = versions()
+        self.assertNotEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+
+        # and through the relationship, not loaded beforehand
+        db.session.expire(item)
+        item.category = first
+        db.session.commit()
+        moved_back = versions()
+        self.assertNotEqual(after[0], moved_back[0])
+        self.assertNotEqual(after[1], moved_back[1])
+
+    def test_query_args_are_part_of_the_key(self):
+        """ Tests that /blog/item/?item_id= caches each item separately """
+
+        for name in ("apple", "pear"):
+            category = self.add_category("Category of " + name)
+            item = Item()
+            item.name = name
+            item.text = "About " + name
+            item.category_id = category.id
+            db.session.add(item)
+        db.session.commit()
+
+        apple = Item.query.filter_by(name="apple").one()
+        pear = Item.query.filter_by(name="pear").one()
+
+        result = self.client.get('/blog/item/?item_id={}'.format(apple.id))
+        self.assertIn("Text for Category of apple", result.data.decode('utf-8'))
+
+        result = self.client.get(
+            '/blog/item/?item_id={}&utm_source=x'.format(pear.id)
+        )
+        self.assertIn("Text for Category of pear", result.data.decode('utf-8'))
+
+    def test_unrelated_query_args_share_an_entry(self):
+        """ Tests that query args a view does not read are ignored """
+
+        self.add_category("First")
+        self.client.get('/blog/?utm_source=x')
+
+        keys = [
+            key for key in cache.cache._cache if key.startswith('view/')
+        ]
+        self.client.get('/blog/?utm_source=y')
+
+        self.assertEqual(
+            [key for key in cache.cache._cache if key.startswith('view/')],
+            keys
+        )
+
+    def test_conditional_get(self):
+        """ Tests that a matching If-None-Match gets a 304 until a write """
+
+        self.add_category("First")
+
+        result = self.client.get('/blog/')
+        self.assertEqual(result.status_code, 200)
+        etag = result.headers['ETag']
+
+        result = self.client.get('/blog/', headers={'If-None-Match': etag})
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.data, b'')
+
+        result = self.client.get(
+            '/blog/?cursor=x',
+            headers={'If-None-Match': etag}
+        )
+        self.assertEqual(result.status_code, 200)
+
+        self.add_category("Second")
+
+        result = self.client.get('/blog/', headers={'If-None-Match': etag})
+        self.assertEqual(result.status_code, 200)
+        self.assertNotEqual(result.headers['ETag'], etag)
+
+    def test_api_etag_follows_authors(self):
+        """ Tests that renaming an author changes the API's ETag """
+
+        db.session.add(Role("default"))
+        user = User("before")
+        db.session.add(user)
+        category = self.add_category("First")
+        category.user = user
+        db.session.commit()
+
+        result = self.client.get('/api/category')
+        etag = result.headers['ETag']
+
+        user.username = "after"
+        db.session.commit()
+
+        result = self.client.get(
+            '/api/category',
+            headers={'If-None-Match': etag}
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(b'"after"', result.data)
+
+    def test_stale_while_revalidate(self):
+        """ Tests that only the lock holder recomputes a stale value """
+
+        calls = []
+
+        @stale_while_revalidate(grace=60, background=False)
+        @cache.cached(timeout=60, key_prefix='swr-test')
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(compute(), 1)
+        self.assertEqual(compute(), 1)
+
+        # make the entry stale while another worker holds the lock
+        cache.set('swr-test/swr', (0, 1))
+        cache.set('swr-test/swr-lock', True)
+
+        self.assertEqual(compute(), 1)
+        self.assertEqual(len(calls), 1)
+
+        cache.delete('swr-test/swr-lock')
+
+        self.assertEqual(compute(), 2)
+        self.assertEqual(compute(), 2)
+        self.assertIsNone(cache.get('swr-test/swr-lock'))
+
+    def test_rollback_keeps_cache(self):
+        """ Tests that rolled back writes do not invalidate anything """
+
+        self.add_category("First")
+        self.client.get('/blog/')
+        key = cache.get('tag-version/Category')
+
+        category = Category("Never committed")
+        db.session.add(category)
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual(cache.get('tag-version/Category'), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import datetime
+import email
+import io
+import socketserver
+import threading
+import unittest
+from unittest import mock
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.digest import send_digest, send_streamed, week_range
+from webapp.models import db, Category
+from webapp.tasks import digest
+from webapp.extensions import admin, rest_api, mail
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough of an SMTP server to receive mail, every message is
+    kept on the server as (recipients, data)
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        recipients = []
+        self.reply('220 localhost')
+
+        for line in self.rfile:
+            line = line.decode('ascii').strip()
+            command = line.upper()
+
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('MAIL'):
+                recipients = []
+                self.reply('250 OK')
+            elif command.startswith('RCPT'):
+                recipients.append(line.split(':', 1)[1].strip('<> '))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    if data_line.startswith(b'.'):
+                        data_line = data_line[1:]
+                    data.append(data_line)
+                self.server.messages.append((recipients, b''.join(data)))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ('127.0.0.1', 0), SMTPHandler
+        )
+        self.connections = 0
+        self.messages = []
+
+
+class TestDigest(unittest.TestCase):
+    def setUp(self):
+        self.smtp = SMTPServer()
+        thread = threading.Thread(target=self.smtp.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        class DigestTestConfig(TestConfig):
+            MAIL_SERVER = '127.0.0.1'
+            MAIL_PORT = self.smtp.server_address[1]
+            MAIL_SUPPRESS_SEND = False
+            DIGEST_RECIPIENTS = [
+                'reader{}@example.com'.format(i) for i in range(5)
+            ]
+            DIGEST_BATCH_SIZE = 2
+            DIGEST_CHUNK_SIZE = 2
+
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        self.app = create_app(DigestTestConfig)
+
+        # Bug workaround
+        db.app = self.app
+
+        db.create_all()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+        self.smtp.shutdown()
+        self.smtp.server_close()
+
+    def add_category(self, title, text):
+        category = Category(title)
+        category.text = text
+        category.publish_date = datetime.datetime.now()
+        db.session.add(category)
+
+    def test_batches_share_a_connection(self):
+        """ Tests that every batch of readers goes over one connection """
+
+        for i in range(5):
+            self.add_category("Category {}".format(i), "<p>Text</p>")
+        db.session.commit()
+
+        start, end = week_range()
+        sent = send_digest(self.app.config['DIGEST_RECIPIENTS'], start, end)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(
+            [recipients for recipients, _ in self.smtp.messages],
+            [
+                ['reader0@example.com', 'reader1@example.com'],
+                ['reader2@example.com', 'reader3@example.com'],
+                ['reader4@example.com']
+            ]
+        )
+
+        message = email.message_from_bytes(self.smtp.messages[0][1])
+        self.assertEqual(message['Subject'], "Weekly Digest")
+        body = message.get_payload(decode=True).decode('utf-8')
+        for i in range(5):
+            self.assertIn("Category {}".format(i), body)
+        self.assertIn('http://localhost:5000/blog/category/', body)
+
+    def test_resume_and_empty_week(self):
+        """ Tests resuming at a batch and skipping a week without posts """
+
+        start, end = week_range()
+        recipients = self.app.config['DIGEST_RECIPIENTS']
+
+        self.assertEqual(send_digest(recipients, start, end), 0)
+        self.assertEqual(self.smtp.connections, 0)
+
+        self.add_category("Dots", "<p>Text</p>")
+        db.session.commit()
+
+        self.assertEqual(send_digest(recipients, start, end, 2), 1)
+        self.assertEqual(
+            [recipients for recipients, _ in self.smtp.messages],
+            [['reader4@example.com']]
+        )
+        message = email.message_from_bytes(self.smtp.messages[0][1])
+        self.assertIn(
+            "Dots",
+            message.get_payload(decode=True).decode('utf-8')
+        )
+
+    def test_lines_starting_with_a_dot(self):
+        """ Tests that a line with just a dot doesn't end the message """
+
+        message = io.BytesIO(b'Subject: Dots\n\n.\n..\nend\n')
+
+        with mail.connect() as connection:
+            send_streamed(
+                connection.host,
+                'from@example.com',
+                ['reader@example.com'],
+                message
+            )
+
+        self.assertEqual(
+            self.smtp.messages[0][1],
+            b'Subject: Dots\r\n\r\n.\r\n..\r\nend\r\n'
+        )
+
+    def test_retries_without_a_connection(self):
+        """ Tests that the task is retried when the server can't be reached """
+
+        self.add_category("Category", "<p>Text</p>")
+        db.session.commit()
+
+        refused = ConnectionRefusedError("connection refused")
+
+        with mock.patch.object(mail, 'connect', side_effect=refused), \
+                mock.patch.object(digest, 'retry') as retry:
+            digest(first_batch=1)
+
+        retry.assert_called_once_with(
+            exc=refused,
+            kwargs=dict(first_batch=1)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
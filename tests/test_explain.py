@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.models import db
+from webapp import explain
+from webapp.explain import explain_hot_queries, UnsupportedDatabase
+from webapp.extensions import admin, rest_api
+
+
+class TestExplain(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(TestConfig)
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def test_hot_queries_use_indexes(self):
+        """ Tests that none of the hot queries reads a whole table """
+
+        scans = {
+            result.name: result.full_scans
+            for result in explain_hot_queries()
+            if result.full_scans
+        }
+        self.assertEqual(scans, {})
+
+    def test_missing_index_is_reported(self):
+        """ Tests that dropping an index shows up as a full scan """
+
+        db.session.execute('DROP INDEX ix_item_name')
+        db.session.commit()
+
+        results = {
+            result.name: result.full_scans
+            for result in explain_hot_queries()
+        }
+        self.assertEqual(results['item by name'], ['item'])
+        self.assertEqual(results['items of a category'], [])
+
+    def test_unsupported_database(self):
+        """ Tests that a database without a planner gets a clear error """
+
+        with mock.patch.dict(explain.PLANNERS, clear=True):
+            with self.assertRaises(UnsupportedDatabase) as raised:
+                explain_hot_queries()
+
+        self.assertIn("not sqlite", str(raised.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
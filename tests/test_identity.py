@@ -0,0 +1,114 @@
+import pickle
+import unittest
+
+from flask_login import login_required
+from sqlalchemy import event
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.models import db, User, Role
+from webapp.identity import UserSnapshot
+from webapp.extensions import admin, rest_api, cache, admin_permission
+
+
+class CachedTestConfig(TestConfig):
+    CACHE_TYPE = 'simple'
+
+
+class TestIdentity(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(CachedTestConfig)
+
+        @app.route('/admin-only')
+        @login_required
+        @admin_permission.require(http_exception=403)
+        def admin_only():
+            return 'ok'
+
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        cache.clear()
+
+        db.session.add(Role("default"))
+        db.session.add(Role("admin"))
+        db.session.commit()
+
+        user = User("author")
+        user.set_password("password")
+        user.roles.append(Role.query.filter_by(name="admin").one())
+        db.session.add(user)
+        db.session.commit()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def get_admin_page(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            result = self.client.get('/admin-only')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        return result, statements
+
+    def test_snapshot(self):
+        """ Tests that a snapshot is immutable and survives pickling """
+
+        user = User.query.filter_by(username="author").one()
+        snapshot = UserSnapshot.from_user(user)
+
+        self.assertEqual(snapshot.role_names, {"default", "admin"})
+        self.assertEqual(snapshot.get_id(), str(user.id))
+        with self.assertRaises(AttributeError):
+            snapshot.username = "someone else"
+        with self.assertRaises(AttributeError):
+            snapshot.email = "author@example.com"
+
+        copy = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(copy.username, "author")
+        self.assertEqual(copy.role_names, snapshot.role_names)
+
+    def test_authorized_requests_skip_the_database(self):
+        """ Tests that a logged in request is authorized without SQL """
+
+        result = self.client.post('/login', data=dict(
+            username="author",
+            password="password"
+        ))
+        self.assertEqual(result.status_code, 302)
+
+        result, statements = self.get_admin_page()
+        self.assertEqual(result.status_code, 200)
+
+        result, statements = self.get_admin_page()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(statements, [])
+
+        user = User.query.filter_by(username="author").one()
+        user.roles = [Role.query.filter_by(name="default").one()]
+        db.session.commit()
+
+        result, statements = self.get_admin_page()
+        self.assertEqual(result.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+import datetime
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from celery.app.task import Context
+from celery.exceptions import Retry
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.metrics import (
+    metrics,
+    Metrics,
+    dump,
+    quantile,
+    _stamp_enqueued_at
+)
+from webapp.models import db
+from webapp.extensions import admin, rest_api, cache
+
+
+class MetricsTestConfig(TestConfig):
+    CACHE_TYPE = 'simple'
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        class DirectoryTestConfig(MetricsTestConfig):
+            METRICS_DIR = self.directory
+
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        self.config = DirectoryTestConfig
+        app = create_app(DirectoryTestConfig)
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        cache.clear()
+        metrics._reset()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+        metrics.directory = None
+        shutil.rmtree(self.directory)
+
+    def path(self, pid):
+        return os.path.join(self.directory, '{}.metrics'.format(pid))
+
+    def scrape(self):
+        result = self.client.get('/metrics')
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.content_type.startswith('text/plain'))
+
+        samples = {}
+        for line in result.data.decode('utf-8').splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+
+        return samples
+
+    def test_request_breakdown(self):
+        """ Tests that a page's latency, SQL, cache and templates show up """
+
+        self.client.get('/blog/')
+        self.client.get('/blog/')
+        self.client.get('/nowhere')
+
+        samples = self.scrape()
+        home = 'endpoint="blog.home"'
+
+        self.assertEqual(
+            samples['webapp_request_duration_seconds_count'
+                    '{' + home + ',method="GET"}'],
+            2
+        )
+        self.assertEqual(
+            samples['webapp_requests_total'
+                    '{' + home + ',method="GET",status="200"}'],
+            2
+        )
+        self.assertEqual(
+            samples['webapp_requests_total'
+                    '{endpoint="unmatched",method="GET",status="404"}'],
+            1
+        )
+        self.assertGreater(
+            samples['webapp_sql_statements_total{' + home + '}'], 0
+        )
+        self.assertGreater(
+            samples['webapp_cache_hits_total{' + home + '}'], 0
+        )
+        self.assertGreater(
+            samples['webapp_cache_misses_total{' + home + '}'], 0
+        )
+        self.assertEqual(
+            samples['webapp_template_renders_total'
+                    '{' + home + ',template="home.html"}'],
+            1
+        )
+        self.assertIn(
+            'webapp_section_seconds_total{' + home + ',section="sidebar"}',
+            samples
+        )
+        self.assertFalse(
+            any('endpoint="metrics"' in name for name in samples)
+        )
+
+    def test_token(self):
+        """ Tests that a configured token is required to scrape """
+
+        self.client.application.config['METRICS_TOKEN'] = 'secret'
+        try:
+            result = self.client.get('/metrics')
+            self.assertEqual(result.status_code, 401)
+
+            result = self.client.get(
+                '/metrics',
+                headers={'Authorization': 'Bearer wrong'}
+            )
+            self.assertEqual(result.status_code, 401)
+
+            result = self.client.get(
+                '/metrics',
+                headers={'Authorization': 'Bearer secret'}
+            )
+            self.assertEqual(result.status_code, 200)
+        finally:
+            self.client.application.config['METRICS_TOKEN'] = None
+
+    def test_stale_files_are_removed(self):
+        """ Tests that starting up drops the files of ended processes """
+
+        ended = subprocess.Popen([sys.executable, '-c', 'pass'])
+        ended.wait()
+
+        for pid in (ended.pid, os.getpid()):
+            with open(self.path(pid), 'w') as f:
+                dump(Metrics()._snapshot(), f)
+
+        create_app(self.config, profile='cli')
+
+        self.assertFalse(os.path.exists(self.path(ended.pid)))
+        self.assertTrue(os.path.exists(self.path(os.getpid())))
+
+    def test_files_are_not_unpickled(self):
+        """ Tests that a pickle dropped in METRICS_DIR is never loaded """
+
+        marker = os.path.join(self.directory, 'ran')
+
+        class Payload(object):
+            def __reduce__(self):
+                return (open, (marker, 'w'))
+
+        with open(self.path(2), 'wb') as f:
+            pickle.dump(Payload(), f)
+
+        self.scrape()
+        self.assertFalse(os.path.exists(marker))
+
+    def test_processes_are_added_up(self):
+        """ Tests that /metrics reports the files of other workers too """
+
+        self.client.get('/blog/')
+
+        other = Metrics()
+        other.observe(
+            'webapp_request_duration_seconds',
+            (('endpoint', 'blog.home'), ('method', 'GET')),
+            0.2
+        )
+        other.inc('webapp_sql_statements_total',
+                  (('endpoint', 'blog.home'),), 1000)
+        with open(os.path.join(self.directory, '1.metrics'), 'w') as f:
+            dump(other._snapshot(), f)
+
+        samples = self.scrape()
+        labels = '{endpoint="blog.home",method="GET"}'
+
+        self.assertEqual(
+            samples['webapp_request_duration_seconds_count' + labels], 2
+        )
+        self.assertEqual(
+            samples['webapp_request_duration_seconds_bucket'
+                    '{endpoint="blog.home",method="GET",le="+Inf"}'],
+            2
+        )
+        self.assertLessEqual(
+            samples['webapp_request_duration_seconds_bucket'
+                    '{endpoint="blog.home",method="GET",le="0.1"}'],
+            1
+        )
+        self.assertGreater(
+            samples['webapp_sql_statements_total{endpoint="blog.home"}'],
+            1000
+        )
+
+    def test_task_runs(self):
+        """ Tests queue wait, run time and outcome of task runs """
+
+        class Task(object):
+            name = 'webapp.tasks.digest'
+
+            def __init__(self, **request):
+                self.request = Context(request)
+
+        headers = {}
+        _stamp_enqueued_at(headers=headers)
+        enqueued_at = headers['enqueued_at'] - 20
+
+        with metrics.task_run(Task(enqueued_at=enqueued_at)):
+            pass
+
+        with self.assertRaises(Retry):
+            with metrics.task_run(Task(enqueued_at=enqueued_at)):
+                raise Retry()
+
+        # held back by an eta, it only waits from then on
+        eta = datetime.datetime.now(datetime.timezone.utc) - \
+            datetime.timedelta(seconds=2)
+        with self.assertRaises(ValueError):
+            with metrics.task_run(Task(enqueued_at=enqueued_at,
+                                       eta=eta.isoformat())):
+                raise ValueError()
+
+        counters, histograms = metrics.collect()
+        labels = (('task', 'webapp.tasks.digest'),)
+
+        for state in ('success', 'retry', 'failure'):
+            self.assertEqual(
+                counters['webapp_tasks_total', labels + (('state', state),)],
+                1
+            )
+
+        queued = histograms['webapp_task_queue_seconds', labels]
+        self.assertEqual(queued[-1], 3)
+        self.assertEqual(quantile('webapp_task_queue_seconds', queued, 0.3),
+                         5.0)
+        self.assertEqual(quantile('webapp_task_queue_seconds', queued, 1),
+                         30.0)
+        self.assertEqual(histograms['webapp_task_run_seconds', labels][-1], 3)
+
+        # written out at once, a pool process may not get to exit cleanly
+        self.assertIn(
+            '{}.metrics'.format(os.getpid()),
+            os.listdir(self.directory)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import unittest
+
+from webapp import create_app, PROFILES
+from webapp.config import TestConfig
+from webapp.extensions import admin, rest_api
+from webapp.models import db, User, Role
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+    def test_cli_profile(self):
+        """ Tests that the cli profile leaves out the web parts """
+
+        app = create_app(TestConfig, profile='cli')
+
+        self.assertEqual(app.blueprints, {})
+        self.assertNotIn('customview', app.blueprints)
+        self.assertIn('cache', app.extensions)
+        self.assertEqual(
+            list(app.extensions['startup_times']),
+            ['import'] + list(PROFILES['cli']) + ['total']
+        )
+
+    def test_web_profile(self):
+        """ Tests that the config's profile is the default """
+
+        app = create_app(TestConfig)
+
+        self.assertEqual(app.extensions['profile'], 'web')
+        self.assertIn('blog', app.blueprints)
+        self.assertIn('customview', app.blueprints)
+        for name in PROFILES['web']:
+            self.assertGreaterEqual(app.extensions['startup_times'][name], 0)
+
+    def test_api_profile(self):
+        """ Tests that the api profile serves /api/ alone, without sessions """
+
+        app = create_app(TestConfig, profile='api')
+        client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+        try:
+            db.session.add(Role("default"))
+            user = User("author")
+            user.set_password("password")
+            db.session.add(user)
+            db.session.commit()
+
+            self.assertEqual(app.blueprints, {})
+            self.assertEqual(
+                sorted(
+                    rule.rule for rule in app.url_map.iter_rules()
+                    if not rule.rule.startswith(('/api/', '/static/'))
+                ),
+                ['/metrics']
+            )
+
+            result = client.post('/api/auth', data=dict(
+                username="author",
+                password="password"
+            ))
+            self.assertEqual(result.status_code, 200)
+            self.assertNotIn('Set-Cookie', result.headers)
+            token = json.loads(result.data.decode('utf-8'))['token']
+
+            result = client.post('/api/category', data=dict(
+                token=token,
+                title="Title",
+                text="Text"
+            ))
+            self.assertEqual(result.status_code, 201)
+
+            result = client.get('/api/category')
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(client.get('/').status_code, 404)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import datetime
+import smtplib
+import unittest
+from unittest import mock
+
+from flask_mail import Connection
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.models import db, Reminder
+from webapp.tasks import dispatch_reminders, reminder_message
+from webapp.extensions import admin, rest_api, mail
+
+
+class ReminderTestConfig(TestConfig):
+    MAIL_SUPPRESS_SEND = True
+    REMINDER_BATCH_SIZE = 2
+
+
+class TestReminders(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(ReminderTestConfig)
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def add_reminder(self, text, minutes, email="reader@example.com"):
+        reminder = Reminder()
+        reminder.text = text
+        reminder.email = email
+        reminder.date = (
+            datetime.datetime.now() + datetime.timedelta(minutes=minutes)
+        )
+        db.session.add(reminder)
+        db.session.commit()
+
+        return reminder
+
+    def test_due_reminders_are_sent_once(self):
+        """ Tests that every due reminder is mailed exactly once """
+
+        for i in range(5):
+            self.add_reminder("Due {}".format(i), -i)
+        self.add_reminder("Later", 60)
+
+        with mail.record_messages() as outbox:
+            self.assertEqual(dispatch_reminders(), 5)
+            self.assertEqual(dispatch_reminders(), 0)
+
+        self.assertEqual(
+            sorted(msg.body for msg in outbox),
+            ["Due {}".format(i) for i in range(5)]
+        )
+        self.assertEqual(
+            Reminder.query.filter_by(has_been_sent=False).one().text,
+            "Later"
+        )
+
+    def test_claims_do_not_overlap(self):
+        """ Tests that two claims never hand out the same reminder """
+
+        for i in range(3):
+            self.add_reminder("Due {}".format(i), -1)
+
+        first = Reminder.claim(2, 600)
+        second = Reminder.claim(2, 600)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(Reminder.claim(2, 600), [])
+
+        # a claim that was never finished is taken over once stale
+        self.assertEqual(len(Reminder.claim(5, 0)), 3)
+
+    def test_failed_send_releases_the_batch(self):
+        """ Tests that a failing batch keeps what was already sent """
+
+        self.add_reminder("First", -2)
+        self.add_reminder("Second", -1)
+
+        original = Connection.send
+        calls = []
+
+        def send(connection, message):
+            calls.append(message.body)
+            if len(calls) == 2:
+                raise IOError("connection lost")
+            original(connection, message)
+
+        with mock.patch.object(Connection, 'send', send):
+            with self.assertRaises(IOError):
+                dispatch_reminders()
+
+        sent = Reminder.query.filter_by(text="First").one()
+        unsent = Reminder.query.filter_by(text="Second").one()
+        self.assertTrue(sent.has_been_sent)
+        self.assertFalse(unsent.has_been_sent)
+        self.assertIsNone(unsent.claimed_by)
+
+        with mail.record_messages() as outbox:
+            self.assertEqual(dispatch_reminders(), 1)
+        self.assertEqual([msg.body for msg in outbox], ["Second"])
+
+    def test_rejected_reminder_does_not_block_the_rest(self):
+        """ Tests that a refused address is skipped, then given up on """
+
+        self.add_reminder("Bad", -3, email="nobody@invalid")
+        self.add_reminder("First", -2)
+        self.add_reminder("Second", -1)
+
+        original = Connection.send
+        refused = []
+
+        def send(connection, message):
+            if message.recipients == ["nobody@invalid"]:
+                refused.append(message.body)
+                raise smtplib.SMTPRecipientsRefused(
+                    {"nobody@invalid": (550, b"No such user")}
+                )
+            original(connection, message)
+
+        with mock.patch.object(Connection, 'send', send):
+            with mail.record_messages() as outbox:
+                self.assertEqual(dispatch_reminders(), 2)
+
+                for _ in range(10):
+                    self.assertEqual(dispatch_reminders(), 0)
+
+        self.assertEqual(
+            sorted(msg.body for msg in outbox), ["First", "Second"]
+        )
+        self.assertEqual(len(refused), 5)
+
+        bad = Reminder.query.filter_by(text="Bad").one()
+        self.assertFalse(bad.has_been_sent)
+        self.assertEqual(bad.attempts, 5)
+        self.assertIsNone(bad.claimed_by)
+
+    def test_unbuildable_reminder_does_not_block_the_rest(self):
+        """ Tests that a reminder whose message fails counts an attempt """
+
+        self.add_reminder("Bad", -3)
+        self.add_reminder("First", -2)
+        self.add_reminder("Second", -1)
+
+        def message(reminder):
+            if reminder.text == "Bad":
+                raise ValueError("bad header")
+            return reminder_message(reminder)
+
+        with mock.patch('webapp.tasks.reminder_message', message):
+            with mail.record_messages() as outbox:
+                self.assertEqual(dispatch_reminders(), 2)
+
+                for _ in range(10):
+                    self.assertEqual(dispatch_reminders(), 0)
+
+        self.assertEqual(
+            sorted(msg.body for msg in outbox), ["First", "Second"]
+        )
+
+        bad = Reminder.query.filter_by(text="Bad").one()
+        self.assertFalse(bad.has_been_sent)
+        self.assertEqual(bad.attempts, 5)
+        self.assertIsNone(bad.claimed_by)
+
+
+if __name__ == '__main__':
+    unittest.main()
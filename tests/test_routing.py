@@ -0,0 +1,204 @@
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webapp import create_app, asyncapi
+from webapp.caching import invalidate
+from webapp.config import TestConfig
+from webapp.controllers.rest.category import category_tags
+from webapp.models import db, User, Role, Category
+from webapp.extensions import admin, rest_api
+from webapp.routing import STICKY_COOKIE, use_replica
+
+
+class TestRouting(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        self.directory = tempfile.mkdtemp()
+        primary = os.path.join(self.directory, 'primary.sqlite')
+        replica = os.path.join(self.directory, 'replica.sqlite')
+
+        class Config(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + primary
+            SQLALCHEMY_BINDS = {
+                'replica': 'sqlite:///' + replica
+            }
+            # the tag versions decide the routing as well, and the
+            # async server has to see the same ones
+            CACHE_TYPE = 'filesystem'
+            CACHE_DIR = os.path.join(self.directory, 'cache')
+
+        self.config = Config
+
+        self.app = create_app(self.config, profile='api')
+        self.client = self.app.test_client()
+
+        # Bug workaround
+        db.app = self.app
+
+        db.create_all()
+
+        db.session.add(Role("default"))
+        user = User("author")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        db.session.remove()
+
+        # the replica starts out as a copy, then never hears of a write
+        shutil.copyfile(primary, replica)
+
+        self.age_tags()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        db.get_engine(self.app, 'replica').dispose()
+        shutil.rmtree(self.directory)
+
+    def age_tags(self):
+        """ Gives the category tags versions from before the window """
+        a_minute_ago = time.time() - 60
+
+        with mock.patch('webapp.caching.time.time', return_value=a_minute_ago):
+            with self.app.app_context():
+                invalidate(*category_tags)
+
+    def add_category(self):
+        category = Category("On the primary")
+        category.text = "Text"
+        category.publish_date = datetime.datetime(2017, 1, 1)
+        category.user_id = 1
+        db.session.add(category)
+        db.session.commit()
+        db.session.remove()
+
+    def get_categories(self):
+        result = self.client.get('/api/category')
+        self.assertEqual(result.status_code, 200)
+
+        return json.loads(result.data.decode('utf-8'))
+
+    def test_get_reads_replica(self):
+        """ Tests that GET requests read from the replica """
+
+        self.add_category()
+
+        result = self.client.get('/api/category')
+        self.assertEqual(json.loads(result.data.decode('utf-8')), [])
+        self.assertNotIn('Set-Cookie', result.headers)
+
+    def test_sticks_to_primary_after_write(self):
+        """ Tests that a client reads its own writes, and only for a while """
+
+        result = self.client.post('/api/auth', data=dict(
+            username="author",
+            password="password"
+        ))
+        token = json.loads(result.data.decode('utf-8'))['token']
+
+        result = self.client.post('/api/category', data=dict(
+            token=token,
+            title="Title",
+            text="Text"
+        ))
+        self.assertEqual(result.status_code, 201)
+        self.assertIn(STICKY_COOKIE, result.headers['Set-Cookie'])
+
+        self.assertEqual(
+            [category['title'] for category in self.get_categories()],
+            ["Title"]
+        )
+
+        self.client.set_cookie('localhost', STICKY_COOKIE, '0')
+        self.age_tags()
+        self.assertEqual(self.get_categories(), [])
+
+    def test_changed_tags_read_primary(self):
+        """ Tests that nothing new is read from the replica for a while """
+
+        with self.app.app_context():
+            self.add_category()
+
+        # another client, whose ETag or cache entry would hold the
+        # stale read under the new tag versions
+        self.assertEqual(
+            [category['title'] for category in self.get_categories()],
+            ["On the primary"]
+        )
+
+        self.age_tags()
+        self.assertEqual(self.get_categories(), [])
+
+    def test_use_replica(self):
+        """ Tests that tasks read the replica only under use_replica """
+
+        self.add_category()
+
+        with self.app.app_context():
+            self.assertEqual(Category.query.count(), 1)
+            db.session.remove()
+
+            with use_replica():
+                self.assertEqual(Category.query.count(), 0)
+
+                self.add_category()
+                self.assertEqual(Category.query.count(), 0)
+
+                # a session reads its own writes until it ends
+                db.session.add(Category("Flushed"))
+                db.session.flush()
+                self.assertEqual(Category.query.count(), 3)
+                db.session.rollback()
+
+                self.assertEqual(Category.query.count(), 0)
+
+    def test_async_reads_replica(self):
+        """ Tests that the async server routes its reads the same way """
+
+        self.add_category()
+
+        async def fetch(cookies):
+            client = TestClient(
+                TestServer(asyncapi.make_app(self.config), loop=loop),
+                loop=loop
+            )
+            await client.start_server()
+            try:
+                response = await client.get(
+                    '/api/category',
+                    cookies=cookies
+                )
+                return await response.json()
+            finally:
+                await client.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(fetch({})), [])
+
+            sticky = {STICKY_COOKIE: str(time.time() + 5)}
+            self.assertEqual(
+                [
+                    category['title']
+                    for category in loop.run_until_complete(fetch(sticky))
+                ],
+                ["On the primary"]
+            )
+        finally:
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import datetime
+import json
+import unittest
+from unittest import mock
+
+from webapp import create_app
+from webapp.config import TestConfig
+from webapp.controllers.admin import PostView
+from webapp.models import db, Category, Item
+from webapp import search as search_module
+from webapp.search import search, reindex, SearchUnavailable
+from webapp.extensions import admin, rest_api
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(TestConfig)
+        self.client = app.test_client()
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def add_category(self, title, text):
+        category = Category(title)
+        category.text = text
+        category.publish_date = datetime.datetime.now()
+        db.session.add(category)
+        db.session.commit()
+
+        return category
+
+    def test_title_matches_rank_first(self):
+        """ Tests that a match in the title beats one in the body """
+
+        self.add_category("Kitchen", "<p>Pots, pans and a garden hose</p>")
+        self.add_category("Gardening", "<p>Shovels and rakes</p>")
+        self.add_category("Cars", "<p>Wheels</p>")
+
+        results = search("garden")
+
+        self.assertEqual(
+            [hit.instance.title for hit in results.items],
+            ["Gardening", "Kitchen"]
+        )
+        self.assertFalse(results.has_next)
+
+    def test_index_follows_writes(self):
+        """ Tests that inserts, updates and deletes reach the index """
+
+        category = self.add_category("Tools", "<p>Hammers</p>")
+        item = Item("hammer")
+        item.text = "A claw hammer"
+        item.category_id = category.id
+        db.session.add(item)
+        db.session.commit()
+
+        hits = search("hammer").items
+        self.assertEqual(
+            sorted(hit.kind for hit in hits),
+            ["category", "item"]
+        )
+
+        category.text = "<p>Saws</p>"
+        db.session.delete(item)
+        db.session.commit()
+
+        self.assertEqual(search("hammer").items, [])
+        self.assertEqual(search("saw").items[0].instance.id, category.id)
+
+    def test_reindex(self):
+        """ Tests that reindex picks up rows written around the ORM """
+
+        self.add_category("Tools", "<p>Hammers</p>")
+        db.session.execute(
+            "UPDATE category SET text_plain = 'Chisels' WHERE title = 'Tools'"
+        )
+        db.session.commit()
+        self.assertEqual(search("chisel").items, [])
+
+        reindex(db.session.connection())
+        db.session.commit()
+
+        self.assertEqual(len(search("chisel").items), 1)
+
+    def test_user_input_is_not_query_syntax(self):
+        """ Tests that fts operators in the terms are plain words """
+
+        self.add_category("Tools", "<p>Hammers</p>")
+
+        self.assertEqual(len(search('hammer" OR (').items), 0)
+        self.assertEqual(len(search('hammer AND').items), 0)
+        self.assertEqual(len(search('"hammers"').items), 1)
+        self.assertEqual(search('***').items, [])
+
+    def test_blog_search(self):
+        """ Tests the paginated search page """
+
+        for i in range(11):
+            self.add_category("Garden {}".format(i), "<p>Plants</p>")
+
+        result = self.client.get('/blog/search?q=garden')
+        data = result.data.decode('utf-8')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(data.count('<h3>'), 10)
+        self.assertIn('page=2', data)
+
+        result = self.client.get('/blog/search?q=garden&page=2')
+        self.assertEqual(result.data.decode('utf-8').count('<h3>'), 1)
+
+    def test_api_search(self):
+        """ Tests the search endpoint and its kind filter """
+
+        category = self.add_category("Tools", "<p>Hammers</p>")
+        item = Item("hammer")
+        item.text = "A claw hammer"
+        item.category_id = category.id
+        db.session.add(item)
+        db.session.commit()
+
+        result = self.client.get('/api/search?q=hammer')
+        self.assertEqual(result.status_code, 200)
+        hits = json.loads(result.data.decode('utf-8'))
+        self.assertEqual(
+            sorted((hit['kind'], hit['title']) for hit in hits),
+            [("category", "Tools"), ("item", "hammer")]
+        )
+
+        result = self.client.get('/api/search?q=hammer&kind=item')
+        hits = json.loads(result.data.decode('utf-8'))
+        self.assertEqual([hit['kind'] for hit in hits], ["item"])
+
+        result = self.client.get('/api/search')
+        self.assertEqual(result.status_code, 400)
+
+    def test_admin_search_uses_index(self):
+        """ Tests that the admin list search filters through the index """
+
+        self.add_category("Tools", "<p>Hammers</p>")
+        self.add_category("Plants", "<p>Roses</p>")
+
+        view = PostView(Category, db.session)
+        query, _, _, _ = view._apply_search(
+            Category.query, None, {}, {}, "rose"
+        )
+
+        self.assertEqual([c.title for c in query], ["Plants"])
+
+    def test_like_fallback(self):
+        """ Tests writes and search on a database without an index """
+
+        with mock.patch.dict(search_module.DDL, clear=True), \
+                mock.patch.object(search_module, '_unsupported', set()):
+            self.add_category("Kitchen", "<p>Pots and a garden_hose</p>")
+            self.add_category("Gardening", "<p>Shovels</p>")
+            self.add_category("Cars", "<p>Wheels</p>")
+
+            self.assertEqual(
+                [hit.instance.title for hit in search("GARDEN").items],
+                ["Gardening", "Kitchen"]
+            )
+            # LIKE wildcards in the terms are plain characters
+            self.assertEqual(
+                [hit.instance.title for hit in search("garden_").items],
+                ["Kitchen"]
+            )
+            self.assertEqual(search("%").items, [])
+
+            with self.assertRaises(SearchUnavailable):
+                reindex(db.session.connection())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from webapp import create_app, seeding
+from webapp.config import TestConfig
+from webapp.models import db, roles, User, Role, Category, Item
+from webapp.search import search
+from webapp.extensions import admin, rest_api
+
+
+class TestSeeding(unittest.TestCase):
+    def setUp(self):
+        # Bug workarounds
+        admin._views = []
+        rest_api.resources = []
+
+        app = create_app(TestConfig)
+
+        # Bug workaround
+        db.app = app
+
+        db.create_all()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        db.session.remove()
+        db.drop_all()
+
+    def snapshot(self):
+        return (
+            db.session.query(User.username).order_by(User.id).all(),
+            db.session.query(
+                Category.title, Category.user_id, Category.publish_date
+            ).order_by(Category.id).all(),
+            db.session.query(
+                Item.name, Item.category_id
+            ).order_by(Item.id).all(),
+        )
+
+    def test_seed(self):
+        """ Tests counts, chunking, role links and the search index """
+
+        chunks = []
+        seeding.CHUNK_SIZE, chunk_size = 7, seeding.CHUNK_SIZE
+        try:
+            seeding.seed(20, 30, 40, progress=lambda *args: chunks.append(args))
+        finally:
+            seeding.CHUNK_SIZE = chunk_size
+
+        self.assertEqual(User.query.count(), 20)
+        self.assertEqual(Category.query.count(), 30)
+        self.assertEqual(Item.query.count(), 40)
+        self.assertIn(('category', 30, 30), chunks)
+        self.assertIn(('category', 7, 30), chunks)
+
+        default = Role.query.filter_by(name='default').one()
+        self.assertEqual(
+            db.session.query(roles).filter_by(role_id=default.id).count(),
+            20
+        )
+
+        user = User.query.first()
+        self.assertTrue(user.check_password(seeding.PASSWORD))
+
+        category = Category.query.first()
+        self.assertIsNotNone(category.excerpt)
+        word = category.title.split()[0]
+        self.assertTrue(search(word).items)
+
+    def test_seed_is_deterministic(self):
+        """ Tests that a seed gives the same rows, and adds to existing ones """
+
+        seeding.seed(5, 10, 10, seed=3)
+        first = self.snapshot()
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        seeding.seed(5, 10, 10, seed=3)
+        self.assertEqual(self.snapshot(), first)
+
+        seeding.seed(5, 10, 10, seed=3)
+        self.assertEqual(User.query.count(), 10)
+        self.assertEqual(Category.query.count(), 20)
+        self.assertEqual(
+            Category.query.order_by(Category.id.desc()).first().id, 20
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+import unittest
+
+from webapp.shmcache import SharedMemoryCache, HEADER_SIZE, ENTRY
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, slots=16, slot_size=1024, ways=4):
+        return SharedMemoryCache(
+            self.path,
+            size=HEADER_SIZE + slots * (ENTRY.size + slot_size),
+            slot_size=slot_size,
+            ways=ways
+        )
+
+    def test_set_get_delete(self):
+        """ Tests the basic cache operations """
+
+        cache = self.make_cache()
+
+        self.assertIsNone(cache.get('missing'))
+        self.assertTrue(cache.set('key', {'a': [1, 2, 3]}))
+        self.assertEqual(cache.get('key'), {'a': [1, 2, 3]})
+        self.assertTrue(cache.has('key'))
+
+        self.assertTrue(cache.delete('key'))
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.delete('key'))
+
+    def test_expiry(self):
+        """ Tests that entries expire and that a 0 timeout never does """
+
+        cache = self.make_cache()
+
+        cache.set('short', 1, timeout=1)
+        cache.set('forever', 2, timeout=0)
+        self.assertEqual(cache.get('short'), 1)
+
+        time.sleep(1.1)
+
+        self.assertIsNone(cache.get('short'))
+        self.assertEqual(cache.get('forever'), 2)
+
+    def test_add_is_exclusive(self):
+        """ Tests that add only succeeds for absent keys """
+
+        cache = self.make_cache()
+
+        self.assertTrue(cache.add('lock', 1))
+        self.assertFalse(cache.add('lock', 2))
+        self.assertEqual(cache.get('lock'), 1)
+
+    def test_oversized_values_are_skipped(self):
+        """ Tests that values larger than a slot are not stored """
+
+        cache = self.make_cache(slot_size=256)
+
+        cache.set('key', 'small')
+        self.assertFalse(cache.set('key', 'x' * 1024))
+        self.assertIsNone(cache.get('key'))
+
+    def test_lru_eviction(self):
+        """ Tests that a full set evicts its least recently used entry """
+
+        cache = self.make_cache(slots=4, ways=4)
+
+        for i in range(4):
+            cache.set('key{}'.format(i), i)
+
+        # touch key0 so key1 becomes the oldest
+        self.assertEqual(cache.get('key0'), 0)
+        cache.set('key4', 4)
+
+        self.assertIsNone(cache.get('key1'))
+        for i in (0, 2, 3, 4):
+            self.assertEqual(cache.get('key{}'.format(i)), i)
+
+    def test_shared_between_processes(self):
+        """ Tests that a forked worker and its parent see the same data """
+
+        cache = self.make_cache()
+        cache.set('from-parent', 'hello')
+
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                ok = cache.get('from-parent') == 'hello'
+                cache.set('from-child', 'world')
+                cache.inc('counter')
+            finally:
+                os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+        self.assertEqual(cache.get('from-child'), 'world')
+        self.assertEqual(cache.inc('counter'), 2)
+
+        other = self.make_cache()
+        self.assertEqual(other.get('from-parent'), 'hello')
+
+    def test_clear(self):
+        """ Tests that clear drops every entry """
+
+        cache = self.make_cache()
+        cache.set_many({'a': 1, 'b': 2})
+        cache.clear()
+
+        self.assertEqual(cache.get_many('a', 'b'), [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
+import datetime
+import re
 import unittest
 
 from webapp import create_app
-from webapp.models import db, User, Role
+from webapp.models import db, User, Role, Category, Item, PopularItem
 from webapp.extensions import admin, rest_api
 
 
@@ -36,6 +38,72 @@ class TestURLs(unittest.TestCase):
         result = self.client.get('/blog/')
         self.assertEqual(result.status_code, 200)
 
+    def test_blog_home_cursor_pages(self):
+        """ Tests that the cursor links walk every category exactly once """
+
+        start = datetime.datetime(2017, 1, 1)
+        for i in range(25):
+            category = Category("Category {}".format(i))
+            category.text = "Text {}".format(i)
+            # pairs of categories share a publish date to exercise the
+            # id tie breaker
+            category.publish_date = start + datetime.timedelta(days=i // 2)
+            db.session.add(category)
+        db.session.commit()
+
+        seen = []
+        url = '/blog/'
+        while url:
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+
+            body = result.data.decode('utf-8')
+            seen.extend(re.findall(r'<h1>(Category \d+)</h1>', body))
+
+            match = re.search(r'href="([^"]*cursor=[^"]*)" aria-label="Next"', body)
+            url = match.group(1).replace('&amp;', '&') if match else None
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen[0], "Category 24")
+
+    def test_blog_home_legacy_page(self):
+        """ Tests that numbered pages are still served """
+
+        result = self.client.get('/blog/2')
+        self.assertEqual(result.status_code, 200)
+
+        result = self.client.get('/blog/?page=2')
+        self.assertEqual(result.status_code, 200)
+
+    def test_popular_items_snapshot(self):
+        """ Tests that the sidebar shows the ranked, bounded snapshot """
+
+        for i in range(3):
+            category = Category("Category {}".format(i))
+            category.text = "Text"
+            category.publish_date = datetime.datetime.now()
+            db.session.add(category)
+            db.session.flush()
+
+            for name in ["everywhere", "rare {}".format(i)][:i + 1]:
+                item = Item()
+                item.name = name
+                item.text = "Item text"
+                item.category_id = category.id
+                db.session.add(item)
+        db.session.commit()
+
+        self.assertEqual(PopularItem.refresh(2), 2)
+
+        top = PopularItem.top(10)
+        self.assertEqual([p.name for p in top][0], "everywhere")
+        self.assertEqual(top[0].score, 3)
+        self.assertEqual(len(top), 2)
+
+        result = self.client.get('/blog/')
+        self.assertIn("everywhere", result.data.decode('utf-8'))
+
     def test_login(self):
         """ Tests if the login form works correctly """
 
@@ -0,0 +1,35 @@
+from html.parser import HTMLParser
+
+
+class HTMLStripper(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.reset()
+        self.fed = []
+
+    def handle_data(self, d):
+        self.fed.append(d)
+
+    def get_data(self):
+        return ''.join(self.fed)
+
+
+def strip_tags(html: str) -> str:
+    """Returns the text content of an html fragment"""
+    s = HTMLStripper()
+    s.feed(html)
+    s.close()
+
+    return s.get_data()
+
+
+def make_excerpt(text: str, length: int = 500, end: str = '...') -> str:
+    """
+    Shortens text to at most length characters on a word boundary, the
+    same way jinja's truncate filter does
+    """
+    leeway = 5
+    if len(text) <= length + leeway:
+        return text
+
+    return text[:length - len(end)].rsplit(' ', 1)[0] + end
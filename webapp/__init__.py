@@ -1,21 +1,16 @@
-import os
+import time
 
-from flask import Flask
-from flask_login import current_user
-from flask_principal import identity_loaded, UserNeed, RoleNeed
+_import_started = time.perf_counter()
 
-from .controllers.admin import (
-    CustomView,
-    CustomModelView,
-    CustomFileAdmin,
-    PostView
-)
-from .controllers.blog import blog_blueprint
-from .controllers.main import main_blueprint
-from .controllers.rest.auth import AuthApi
-from .controllers.rest.category import CategoryApi
-from .extensions import (
-    bcrypt,
+import os  # noqa: E402
+from collections import OrderedDict  # noqa: E402
+
+from flask import Flask  # noqa: E402
+from flask.sessions import SessionInterface  # noqa: E402
+from flask_login import current_user  # noqa: E402
+from flask_principal import identity_loaded, UserNeed, RoleNeed  # noqa: E402
+
+from .extensions import (  # noqa: E402
     oid,
     login_manager,
     principals,
@@ -29,37 +24,71 @@ from .extensions import (
     admin,
     mail
 )
-from .models import db, User, Role, Item, Category
-from .tasks import on_reminder_save
+from .hashing import password_hasher  # noqa: E402
+from .metrics import metrics  # noqa: E402
+from .models import db, User, Role, Item, Category  # noqa: E402
+from .tokens import auth_tokens  # noqa: E402
 
+IMPORT_TIME = time.perf_counter() - _import_started
 
-def create_app(object_name):
-    """
-    An flask application factory, as explained here:
-    http://flask.pocoo.org/docs/patterns/appfactories/
 
-    Arguments:
-        object_name: the python path of the config object,
-                     e.g. project.config.ProdConfig
-    """
-    app = Flask(__name__)
-    app.config.from_object(object_name)
+def _init_openid(app):
+    oid.init_app(app)
 
-    db.init_app(app)
 
-    bcrypt.init_app(app)
-    oid.init_app(app)
+def _init_login(app):
     login_manager.init_app(app)
+
+
+def _init_principal(app):
     principals.init_app(app)
+
+    @identity_loaded.connect_via(app)
+    def on_identity_loaded(sender, identity):
+        # Set the identity user object
+        identity.user = current_user
+
+        # Add the UserNeed to the identity
+        if hasattr(current_user, 'id'):
+            identity.provides.add(UserNeed(current_user.id))
+
+        # Add each role to the identity
+        if hasattr(current_user, 'role_names'):
+            for role_name in current_user.role_names:
+                identity.provides.add(RoleNeed(role_name))
+
+
+def _init_celery(app):
     celery.init_app(app)
+    metrics.watch_tasks()
+
+
+def _init_debug_toolbar(app):
     debug_toolbar.init_app(app)
+
+
+def _init_cache(app):
     cache.init_app(app)
+
+
+def _init_assets(app):
     assets_env.init_app(app)
-    admin.init_app(app)
-    mail.init_app(app)
 
-    assets_env.register("main_js", main_js)
-    assets_env.register("main_css", main_css)
+    # webassets wants the bundles themselves, not the proxies
+    assets_env.register("main_js", main_js._get_current_object())
+    assets_env.register("main_css", main_css._get_current_object())
+
+
+def _init_admin(app):
+    from .controllers.admin import (
+        CustomView,
+        CustomModelView,
+        CustomFileAdmin,
+        PostView,
+        ItemView
+    )
+
+    admin.init_app(app)
 
     admin.add_view(CustomView(name='Custom'))
     admin.add_view(
@@ -73,12 +102,12 @@ def create_app(object_name):
         )
     )
     admin.add_view(
-        CustomModelView(
+        PostView(
             Category, db.session, category='Models'
         )
     )
     admin.add_view(
-        CustomModelView(
+        ItemView(
             Item, db.session, category='Models'
         )
     )
@@ -91,6 +120,16 @@ def create_app(object_name):
         )
     )
 
+
+def _init_mail(app):
+    mail.init_app(app)
+
+
+def _init_api(app):
+    from .controllers.rest.auth import AuthApi
+    from .controllers.rest.category import CategoryApi
+    from .controllers.rest.search import SearchApi
+
     rest_api.add_resource(
         AuthApi,
         '/api/auth'
@@ -98,25 +137,122 @@ def create_app(object_name):
     rest_api.add_resource(
         CategoryApi,
         '/api/category',
-        '/api/category/<int:post_id>'
+        '/api/category/<int:category_id>'
+    )
+    rest_api.add_resource(
+        SearchApi,
+        '/api/search'
     )
     rest_api.init_app(app)
 
-    @identity_loaded.connect_via(app)
-    def on_identity_loaded(sender, identity):
-        # Set the identity user object
-        identity.user = current_user
 
-        # Add the UserNeed to the identity
-        if hasattr(current_user, 'id'):
-            identity.provides.add(UserNeed(current_user.id))
+class NoSessionInterface(SessionInterface):
+    """
+    Never reads or sets the session cookie, API clients send a token
+    with the requests that need one
+    """
+    def open_session(self, app, request):
+        return self.make_null_session(app)
+
+    def save_session(self, app, session, response):
+        pass
 
-        # Add each role to the identity
-        if hasattr(current_user, 'roles'):
-            for role in current_user.roles:
-                identity.provides.add(RoleNeed(role.name))
 
+def _init_no_sessions(app):
+    app.session_interface = NoSessionInterface()
+
+
+def _init_main(app):
+    from .controllers.main import main_blueprint
     app.register_blueprint(main_blueprint)
+
+
+def _init_blog(app):
+    from .controllers.blog import blog_blueprint
     app.register_blueprint(blog_blueprint)
 
+
+FEATURES = {
+    'openid': _init_openid,
+    'login': _init_login,
+    'principal': _init_principal,
+    'celery': _init_celery,
+    'debug_toolbar': _init_debug_toolbar,
+    'cache': _init_cache,
+    'assets': _init_assets,
+    'admin': _init_admin,
+    'mail': _init_mail,
+    'api': _init_api,
+    'no_sessions': _init_no_sessions,
+    'main': _init_main,
+    'blog': _init_blog,
+}
+
+# what each kind of process sets up, in this order. Celery workers
+# render the digest, which links to blog pages; manage.py commands
+# only need the database, the cache and mail. The api workers serve
+# /api/* alone, without templates, assets, logins or sessions. The
+# async category reads of deploy/aserver.py only use the cache, for
+# the ETags CategoryApi would send.
+PROFILES = {
+    'web': (
+        'openid',
+        'login',
+        'principal',
+        'celery',
+        'debug_toolbar',
+        'cache',
+        'assets',
+        'admin',
+        'mail',
+        'api',
+        'main',
+        'blog'
+    ),
+    'api': ('no_sessions', 'cache', 'api'),
+    'worker': ('celery', 'cache', 'mail', 'blog'),
+    'cli': ('cache', 'mail'),
+    'async': ('no_sessions', 'cache'),
+}
+
+
+def create_app(object_name, profile=None):
+    """
+    An flask application factory, as explained here:
+    http://flask.pocoo.org/docs/patterns/appfactories/
+
+    Arguments:
+        object_name: the python path of the config object,
+                     e.g. project.config.ProdConfig
+        profile: the name of the set of PROFILES to set up, the
+                 config's PROFILE by default
+
+    How long importing webapp and setting up each part took is kept in
+    app.extensions['startup_times'].
+    """
+    started = time.perf_counter()
+
+    app = Flask(__name__)
+    app.config.from_object(object_name)
+    profile = profile or app.config.get('PROFILE', 'web')
+
+    startup_times = OrderedDict()
+    startup_times['import'] = IMPORT_TIME
+
+    db.init_app(app)
+    auth_tokens.init_app(app)
+    password_hasher.init_app(app)
+
+    for name in PROFILES[profile]:
+        feature_started = time.perf_counter()
+        FEATURES[name](app)
+        startup_times[name] = time.perf_counter() - feature_started
+
+    # after cache, it wraps the cache backend
+    metrics.init_app(app)
+
+    startup_times['total'] = time.perf_counter() - started
+    app.extensions['startup_times'] = startup_times
+    app.extensions['profile'] = profile
+
     return app
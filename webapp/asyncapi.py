@@ -0,0 +1,423 @@
+"""
+An asyncio server for the reads of the category API, for clients
+slow enough to tie up a uwsgi worker each, run by deploy/aserver.py.
+
+It answers GET /api/category and /api/category/<id> like CategoryApi
+does, from the same models, keyset pages and marshal fields, through
+aiosqlite or asyncpg, whichever SQLALCHEMY_DATABASE_URI calls for.
+With a replica in SQLALCHEMY_BINDS the reads go there, except for the
+clients webapp.routing keeps on the primary.
+The ETag and Last-Modified come from the tag versions in the shared
+cache, as conditional computes them for CategoryApi, so clients can
+revalidate against either server. Writes, auth and search stay with
+the WSGI app.
+"""
+import abc
+import asyncio
+import functools
+import json
+import os
+import re
+from types import SimpleNamespace
+
+from aiohttp import web
+from flask_restful import marshal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import BadRequest, NotFound
+
+from . import create_app
+from .controllers.rest.category import (
+    category_fields,
+    category_key,
+    category_tags,
+    cursor_headers
+)
+from .conditional import validate
+from .models import User, Category, Item
+from .routing import REPLICA, reads_from_replica
+from .pagination import keyset_page, keyset_query, InvalidCursor
+
+PER_PAGE = 30
+
+# what category_fields reads, selected in one query
+CATEGORY_COLUMNS = (
+    Category.id,
+    Category.title,
+    Category.text_plain,
+    Category.publish_date,
+    User.username
+)
+
+
+class Database(abc.ABC):
+    """
+    Runs SQLAlchemy Core statements on an async driver and returns the
+    rows as dicts keyed by column key, with the values converted the
+    way the column types would for a regular engine
+    """
+    dialect = None
+
+    @abc.abstractmethod
+    async def connect(self):
+        """Opens the connections, once the event loop runs"""
+
+    @abc.abstractmethod
+    async def execute(self, sql, params):
+        """Runs sql, compiled for dialect, and returns the rows"""
+
+    @abc.abstractmethod
+    async def close(self):
+        """Closes the connections connect opened"""
+
+    def compile(self, statement):
+        compiled = statement.compile(dialect=self.dialect)
+
+        params = []
+        for name in compiled.positiontup:
+            bind = compiled.binds[name]
+            value = compiled.params[name]
+
+            process = bind.type.dialect_impl(self.dialect).bind_processor(
+                self.dialect
+            )
+            params.append(process(value) if process else value)
+
+        return compiled.string, params
+
+    async def fetch(self, statement):
+        sql, params = self.compile(statement)
+        rows = await self.execute(sql, params)
+
+        columns = [
+            (
+                column.key,
+                column.type.dialect_impl(self.dialect).result_processor(
+                    self.dialect, None
+                )
+            )
+            for column in statement.inner_columns
+        ]
+
+        return [
+            {
+                key: process(value) if process else value
+                for (key, process), value in zip(columns, row)
+            }
+            for row in rows
+        ]
+
+
+class SQLiteDatabase(Database):
+    """
+    aiosqlite runs every connection on a thread of its own, a few of
+    them are enough since sqlite serializes the reads of a file anyway
+    """
+    dialect = sqlite.dialect()
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.connections = None
+
+    async def connect(self):
+        import aiosqlite
+
+        self.connections = asyncio.Queue()
+        for _ in range(self.size):
+            self.connections.put_nowait(await aiosqlite.connect(self.path))
+
+    async def execute(self, sql, params):
+        connection = await self.connections.get()
+        try:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+        finally:
+            self.connections.put_nowait(connection)
+
+    async def close(self):
+        while not self.connections.empty():
+            await self.connections.get_nowait().close()
+
+
+class PostgresDatabase(Database):
+    dialect = postgresql.dialect(paramstyle='numeric')
+
+    def __init__(self, url, size):
+        self.url = url
+        self.size = size
+        self.pool = None
+
+    async def connect(self):
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(
+            str(self.url), min_size=1, max_size=self.size
+        )
+
+    def compile(self, statement):
+        # asyncpg numbers its parameters $1, $2, ...
+        sql, params = super(PostgresDatabase, self).compile(statement)
+        return re.sub(r':(\d+)', r'$\1', sql), params
+
+    async def execute(self, sql, params):
+        return await self.pool.fetch(sql, *params)
+
+    async def close(self):
+        await self.pool.close()
+
+
+def database_for(uri, size):
+    """
+    Returns the Database for a SQLALCHEMY_DATABASE_URI. A relative
+    sqlite path is taken from the webapp package, as flask_sqlalchemy
+    does.
+    """
+    url = make_url(uri)
+
+    if url.get_backend_name() == 'sqlite':
+        path = url.database
+        if path and not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+
+        return SQLiteDatabase(path or ':memory:', size)
+
+    if url.get_backend_name() == 'postgresql':
+        url.drivername = 'postgresql'
+        return PostgresDatabase(url, size)
+
+    raise ValueError('No async driver for {}'.format(url.drivername))
+
+
+def _categories():
+    return Query(CATEGORY_COLUMNS).outerjoin(User, Category.user)
+
+
+async def _with_tags(database, rows):
+    """
+    Turns category rows into objects category_fields can marshal, with
+    all their tags loaded in one query
+    """
+    tags = {}
+    if rows:
+        statement = Query((Item.id, Item.name, Item.category_id)).filter(
+            Item.category_id.in_([row['id'] for row in rows])
+        ).order_by(Item.id).statement
+
+        for tag in await database.fetch(statement):
+            tags.setdefault(tag['category_id'], []).append(
+                SimpleNamespace(**tag)
+            )
+
+    return [
+        SimpleNamespace(
+            user=SimpleNamespace(username=row.pop('username')),
+            tags=tags.get(row['id'], []),
+            **row
+        )
+        for row in rows
+    ]
+
+
+def _json(data, status=200, headers=None):
+    return web.Response(
+        text=json.dumps(data) + "\n",
+        status=status,
+        headers=headers,
+        content_type='application/json'
+    )
+
+
+def _error(exception):
+    return _json({'message': exception.description}, exception.code)
+
+
+def conditional(handler):
+    """
+    The conditional decorator for the handlers here, which also picks
+    the database they read, as RoutingSession would. Both are decided
+    in a request context of the flask app, whose cache holds the tag
+    versions, and before any await, since flask's context locals can't
+    be shared between coroutines.
+    """
+    @functools.wraps(handler)
+    async def decorated_function(request):
+        with request.app['flask_app'].test_request_context(
+            request.path,
+            method=request.method,
+            query_string=request.query_string,
+            headers=list(request.headers.items())
+        ):
+            etag, last_modified, not_modified = validate(
+                category_key,
+                category_tags
+            )
+
+            if request.app['replica'] and reads_from_replica():
+                request['database'] = request.app['replica']
+            else:
+                request['database'] = request.app['primary']
+
+        headers = {'ETag': '"{}"'.format(etag)}
+        if last_modified:
+            headers['Last-Modified'] = last_modified.strftime(
+                '%a, %d %b %Y %H:%M:%S GMT'
+            )
+
+        if not_modified:
+            return web.Response(status=304, headers=headers)
+
+        response = await handler(request)
+
+        if response.status == 200:
+            response.headers.update(headers)
+            response.headers['Cache-Control'] = 'no-cache'
+
+        return response
+
+    return decorated_function
+
+
+def _argument(request, name):
+    # the same places category_get_parser looks, headers last
+    return request.headers.get(name, request.query.get(name)) or None
+
+
+@conditional
+async def get_category(request):
+    database = request['database']
+
+    category_id = int(request.match_info['category_id'])
+    if not category_id:
+        return await list_categories.__wrapped__(request)
+
+    rows = await database.fetch(
+        _categories().filter(Category.id == category_id).statement
+    )
+    if not rows:
+        return _error(NotFound())
+
+    category, = await _with_tags(database, rows)
+
+    return _json(marshal(category, category_fields))
+
+
+@conditional
+async def list_categories(request):
+    database = request['database']
+
+    args = {
+        name: _argument(request, name)
+        for name in ('page', 'user', 'cursor')
+    }
+    try:
+        page = int(args['page']) if args['page'] else None
+    except ValueError:
+        return _error(BadRequest())
+
+    query = _categories()
+
+    if args['user']:
+        users = await database.fetch(
+            Query((User.id,)).filter_by(username=args['user']).statement
+        )
+        if not users:
+            return _error(NotFound())
+
+        query = query.filter(Category.user_id == users[0]['id'])
+
+    headers = {}
+
+    # old clients page by number, see CategoryApi.get
+    if page:
+        if page < 1:
+            return _error(NotFound())
+
+        rows = await database.fetch(
+            query.order_by(Category.publish_date.desc())
+            .limit(PER_PAGE)
+            .offset((page - 1) * PER_PAGE)
+            .statement
+        )
+        if not rows and page != 1:
+            return _error(NotFound())
+    else:
+        try:
+            statement = keyset_query(
+                query,
+                Category.publish_date,
+                Category.id,
+                cursor=args['cursor'],
+                per_page=PER_PAGE
+            ).statement
+        except InvalidCursor:
+            return _error(BadRequest())
+
+        rows = await database.fetch(statement)
+        categories = keyset_page(
+            [SimpleNamespace(**row) for row in rows],
+            Category.publish_date,
+            Category.id,
+            cursor=args['cursor'],
+            per_page=PER_PAGE
+        )
+        rows = [vars(row) for row in categories.items]
+
+        def build_url(endpoint, **values):
+            query = {
+                key: value for key, value in values.items()
+                if value is not None
+            }
+            url = request.app.router[endpoint].url_for()
+            return str(url.with_query(query))
+
+        headers = cursor_headers(categories, args, build_url)
+
+    categories = await _with_tags(database, rows)
+
+    return _json(marshal(categories, category_fields), headers=headers)
+
+
+def make_app(object_name):
+    """
+    Builds the aiohttp application serving the category reads from
+    the databases and cache of a config object, like create_app's
+    object_name
+    """
+    flask_app = create_app(object_name, profile='async')
+    config = flask_app.config
+    binds = config['SQLALCHEMY_BINDS'] or {}
+
+    app = web.Application()
+    app['flask_app'] = flask_app
+    app['primary'] = database_for(
+        config['SQLALCHEMY_DATABASE_URI'],
+        config['ASYNC_API_POOL_SIZE']
+    )
+    app['replica'] = database_for(
+        binds[REPLICA],
+        config['ASYNC_API_POOL_SIZE']
+    ) if binds.get(REPLICA) else None
+
+    databases = [app['primary']]
+    if app['replica']:
+        databases.append(app['replica'])
+
+    async def connect(app):
+        for database in databases:
+            await database.connect()
+
+    async def close(app):
+        for database in databases:
+            await database.close()
+
+    app.on_startup.append(connect)
+    app.on_cleanup.append(close)
+
+    # named after the flask_restful endpoint, for cursor_headers
+    app.router.add_get('/api/category', list_categories, name='categoryapi')
+    app.router.add_get('/api/category/{category_id:\\d+}', get_category)
+
+    return app
+
@@ -0,0 +1,294 @@
+import functools
+import threading
+import time
+import uuid
+
+from flask import (
+    current_app,
+    g,
+    request,
+    session,
+    has_app_context,
+    has_request_context,
+    copy_current_request_context
+)
+from flask_login import current_user
+from sqlalchemy import event
+from werkzeug.urls import url_encode
+
+from .extensions import cache
+
+
+def _tag_key(tag):
+    return 'tag-version/{}'.format(tag)
+
+
+def _new_version():
+    # the hex timestamp prefix lets conditional GETs derive a
+    # Last-Modified time from the versions alone
+    return '{:x}-{}'.format(int(time.time()), uuid.uuid4().hex[:8])
+
+
+def version_timestamp(version):
+    try:
+        return int(version.split('-', 1)[0], 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+def tag_versions(tags):
+    """
+    Returns the current version of each tag. A tag without a version
+    (never seen, or evicted) gets a fresh one, so entries built before
+    the eviction can never be matched again.
+    """
+    keys = [_tag_key(tag) for tag in tags]
+    versions = list(cache.get_many(*keys)) if keys else []
+
+    for i, version in enumerate(versions):
+        if version is None:
+            version = _new_version()
+            # Cache.add does not pass on whether the key was added
+            if not cache.cache.add(keys[i], version, timeout=0):
+                version = cache.get(keys[i]) or version
+            versions[i] = version
+
+    # webapp.routing keeps reads off the replica while a version the
+    # current context has seen is new
+    timestamps = [version_timestamp(version) for version in versions]
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    if timestamps and has_app_context():
+        g.tags_changed_at = max(
+            [g.get('tags_changed_at', 0)] + timestamps
+        )
+
+    return versions
+
+
+def invalidate(*tags):
+    """
+    Expires every cache entry tagged with any of tags by moving the
+    tag to a new version.
+    """
+    if tags:
+        cache.set_many(
+            {_tag_key(tag): _new_version() for tag in tags},
+            timeout=0
+        )
+
+
+def is_authenticated():
+    authenticated = current_user.is_authenticated
+
+    # our User model defines it as a method, flask_login's anonymous
+    # user as a property
+    if callable(authenticated):
+        authenticated = authenticated()
+
+    return bool(authenticated)
+
+
+def resolve_tags(tags):
+    """
+    Fills the {placeholders} in tags from the view arguments of the
+    current request.
+    """
+    view_args = {}
+    if has_request_context():
+        view_args = request.view_args or {}
+
+    return [tag.format(**view_args) for tag in tags]
+
+
+def request_key(prefix='view', query_args=(), headers=(), vary_on_auth=False):
+    """
+    Builds a callable key_prefix for cache.cached that identifies a
+    response by HTTP method, path and the query_args the view reads.
+    Any other query arguments are ignored, so they can't be used to
+    flood the cache. headers names request headers the view also reads
+    its arguments from. vary_on_auth keeps separate entries for
+    anonymous and logged in visitors.
+    """
+    def make_cache_key():
+        method = 'GET' if request.method == 'HEAD' else request.method
+        args = url_encode(
+            [(name, request.args.get(name, '')) for name in query_args]
+        )
+        key = '{}/{}{}?{}'.format(prefix, method, request.path, args)
+
+        if headers:
+            key += '|' + url_encode(
+                [(name, request.headers.get(name, '')) for name in headers]
+            )
+
+        if vary_on_auth:
+            key += '|auth' if is_authenticated() else '|anon'
+
+        return key
+
+    return make_cache_key
+
+
+def uncacheable():
+    """
+    The unless= hook for cache.cached. Only GET and HEAD are cached,
+    and a request with pending flash messages must render them for
+    this visitor instead of sharing them through the cache.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return True
+
+    return '_flashes' in session
+
+
+def tagged(key_prefix, tags):
+    """
+    Builds a callable key_prefix for cache.cached that mixes the current
+    versions of tags into the key. Tags can use {placeholders} that are
+    filled from the view arguments, e.g. 'Category:{category_id}'.
+
+    key_prefix is handled the same way cache.cached handles it, a
+    string with an optional %s for the request path or a callable.
+    """
+    def make_cache_key():
+        if callable(key_prefix):
+            key = key_prefix()
+        elif '%s' in key_prefix:
+            key = key_prefix % request.path
+        else:
+            key = key_prefix
+
+        versions = tag_versions(resolve_tags(tags))
+
+        return '{}|{}'.format(key, '.'.join(versions))
+
+    return make_cache_key
+
+
+def _run_in_background(func):
+    if has_request_context():
+        target = copy_current_request_context(func)
+    else:
+        app = current_app._get_current_object()
+
+        def target():
+            with app.app_context():
+                func()
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+
+
+def stale_while_revalidate(grace, lock_timeout=30, unless=None,
+                           background=True):
+    """
+    Wraps a function already decorated with cache.cached or
+    cache.memoize. Once its cache_timeout passes, the value is still
+    served for up to grace more seconds while a single caller, the one
+    that wins a lock in the cache, recomputes it. Every other worker
+    keeps serving the stale value instead of piling onto the same
+    recompute.
+
+    background moves the recompute off the winning request as well.
+    unless has the same meaning as for cache.cached.
+    """
+    def decorator(cached):
+        memoized = hasattr(cached, 'delete_memoized')
+        compute = cached.uncached
+
+        @functools.wraps(cached)
+        def decorated_function(*args, **kwargs):
+            if callable(unless) and unless() is True:
+                return compute(*args, **kwargs)
+
+            if memoized:
+                key = cached.make_cache_key(compute, *args, **kwargs)
+            else:
+                key = cached.make_cache_key(*args, **kwargs)
+
+            entry_key = key + '/swr'
+            lock_key = key + '/swr-lock'
+
+            timeout = cached.cache_timeout
+            if timeout is None:
+                timeout = current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+            def store(value):
+                cache.set(
+                    entry_key,
+                    (time.time() + timeout, value),
+                    timeout=timeout + grace
+                )
+
+            def refresh():
+                try:
+                    store(compute(*args, **kwargs))
+                except Exception:
+                    current_app.logger.exception(
+                        'Refreshing %s failed, serving it stale', key
+                    )
+                finally:
+                    cache.delete(lock_key)
+
+            entry = cache.get(entry_key)
+            if entry is not None:
+                fresh_until, value = entry
+
+                if time.time() >= fresh_until and \
+                        cache.cache.add(lock_key, True, timeout=lock_timeout):
+                    if background:
+                        _run_in_background(refresh)
+                    else:
+                        refresh()
+
+                        entry = cache.get(entry_key)
+                        if entry is not None:
+                            value = entry[1]
+
+                return value
+
+            value = compute(*args, **kwargs)
+            store(value)
+
+            return value
+
+        decorated_function.uncached = compute
+        decorated_function.cache_timeout = cached.cache_timeout
+        decorated_function.make_cache_key = cached.make_cache_key
+
+        return decorated_function
+
+    return decorator
+
+
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('cache_tags', set())
+
+    for instance in session.new | session.dirty | session.deleted:
+        cache_tags = getattr(instance, 'cache_tags', None)
+        if cache_tags is not None:
+            tags.update(cache_tags())
+
+
+def _invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+
+    # without an application there is no cache to reach
+    if tags and has_app_context():
+        invalidate(*tags)
+
+
+def _discard_tags(session):
+    session.info.pop('cache_tags', None)
+
+
+def watch_session(session):
+    """
+    Invalidates the cache tags of every model written through session
+    once the transaction commits. Models opt in by defining a
+    cache_tags() method.
+    """
+    event.listen(session, 'after_flush', _collect_tags)
+    event.listen(session, 'after_commit', _invalidate_committed)
+    event.listen(session, 'after_rollback', _discard_tags)
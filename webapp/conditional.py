@@ -0,0 +1,113 @@
+import datetime
+import functools
+import hashlib
+import time
+
+from flask import request, make_response
+from flask_restful.utils import unpack
+from werkzeug.wrappers import BaseResponse
+
+from .caching import (
+    resolve_tags,
+    tag_versions,
+    version_timestamp,
+    uncacheable
+)
+
+
+def _validators(key, tags):
+    versions = tag_versions(resolve_tags(tags))
+
+    etag = hashlib.sha1(
+        '{}|{}'.format(key, '.'.join(versions)).encode('utf-8')
+    ).hexdigest()
+
+    timestamps = [version_timestamp(version) for version in versions]
+    last_modified = None
+
+    # Last-Modified has a one second resolution, a write later in the
+    # current second would not move it, so only the ETag is usable
+    if timestamps and None not in timestamps \
+            and max(timestamps) < int(time.time()):
+        last_modified = datetime.datetime.utcfromtimestamp(max(timestamps))
+
+    return etag, last_modified
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def validate(key, tags):
+    """
+    Returns the ETag and Last-Modified of the current request's
+    response, from key and tags as conditional takes them, and whether
+    the client's copy is still current. For servers that can't wrap
+    the view in conditional, like webapp.asyncapi.
+    """
+    etag, last_modified = _validators(key(), tags)
+
+    return etag, last_modified, _not_modified(etag, last_modified)
+
+
+def conditional(key, tags):
+    """
+    Answers conditional GETs for a view from the cache tags its
+    response depends on. The ETag is derived from key, a callable like
+    the ones request_key builds, and the tag versions. Last-Modified
+    is the newest tag version. Neither needs a query, so a matching
+    If-None-Match or If-Modified-Since gets a 304 without running the
+    view at all.
+
+    Works for template views and for flask_restful resources; put it
+    above cache.cached and marshal_with.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            if uncacheable():
+                return f(*args, **kwargs)
+
+            etag, last_modified, not_modified = validate(key, tags)
+
+            if not_modified:
+                response = make_response('', 304)
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+
+                return response
+
+            rv = f(*args, **kwargs)
+
+            if isinstance(rv, (BaseResponse, str)):
+                response = make_response(rv)
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                response.cache_control.no_cache = True
+
+                return response
+
+            # a flask_restful resource returning data, leave the
+            # serialization to the api and just add the headers
+            data, code, headers = unpack(rv)
+            headers = dict(headers or {})
+            headers['ETag'] = '"{}"'.format(etag)
+            if last_modified:
+                headers['Last-Modified'] = last_modified.strftime(
+                    '%a, %d %b %Y %H:%M:%S GMT'
+                )
+            headers['Cache-Control'] = 'no-cache'
+
+            return data, code, headers
+
+        return decorated_function
+
+    return decorator
@@ -1,10 +1,18 @@
+import base64
+import datetime
+import json
+
+from flask import request
 from flask_admin import BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.contrib.fileadmin import FileAdmin
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_
 
+from webapp.explain import indexed_columns, estimated_rows
 from webapp.extensions import admin_permission
 from webapp.forms import CKTextAreaField
+from webapp.search import match
 
 
 class CustomView(BaseView):
@@ -21,12 +29,244 @@ class CustomView(BaseView):
         return self.render('admin/second_page.html')
 
 
+def _encode_after(sort_value, row_id):
+    is_date = isinstance(sort_value, datetime.datetime)
+    if is_date:
+        sort_value = sort_value.isoformat()
+
+    payload = json.dumps([sort_value, row_id, is_date]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def _decode_after(token):
+    padded = token + '=' * (-len(token) % 4)
+
+    try:
+        sort_value, row_id, is_date = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        )
+        if is_date:
+            sort_value = datetime.datetime.strptime(
+                sort_value,
+                '%Y-%m-%dT%H:%M:%S.%f' if '.' in sort_value
+                else '%Y-%m-%dT%H:%M:%S'
+            )
+    except (ValueError, TypeError):
+        return None
+
+    return sort_value, row_id
+
+
 class CustomModelView(ModelView):
+    """
+    A model list that stays usable on big tables. Pages are fetched
+    after the last row shown, by (sort column, id), instead of with an
+    OFFSET. The row count comes from the database statistics unless
+    an exact one is asked for with ?count=exact. Only indexed columns
+    can be sorted and filtered on.
+
+    Sorting by a nullable column falls back to numbered pages, NULLs
+    have no position to page after.
+    """
+    list_template = 'admin/keyset_list.html'
+    column_default_sort = ('id', True)
+    simple_list_pager = True
+    page_size = 50
+
+    def __init__(self, model, session, *args, **kwargs):
+        indexed = indexed_columns(model.__table__)
+
+        if self.column_filters:
+            self.column_filters = [
+                column for column in self.column_filters
+                if not isinstance(column, str) or column in indexed
+            ]
+
+        super(CustomModelView, self).__init__(
+            model, session, *args, **kwargs
+        )
+
     def is_accessible(self):
         return current_user.is_authenticated() and admin_permission.can()
 
+    def get_sortable_columns(self):
+        indexed = indexed_columns(self.model.__table__)
+        columns = super(CustomModelView, self).get_sortable_columns()
+
+        return {
+            name: column for name, column in columns.items()
+            if name in indexed and name not in self._sortable_joins
+        }
+
+    def _keyset_order(self, sort_column, sort_desc):
+        """
+        Returns the (column, descending) pair the list is ordered by, or
+        None when it can't be paged by key
+        """
+        if sort_column is None:
+            order = list(self._get_default_order())
+            if len(order) != 1 or order[0][1]:
+                return None
+
+            column, _, descending = order[0]
+        else:
+            column = self._sortable_columns.get(sort_column)
+            descending = bool(sort_desc)
+
+        if hasattr(column, 'property'):
+            column = column.property.columns[0]
+
+        if column is None or isinstance(column, list) or \
+                (column.nullable and not column.primary_key):
+            return None
+
+        return column, descending
+
+    def _after(self):
+        token = request.args.get('after')
+        if not token:
+            return None
+
+        return _decode_after(token)
+
+    def _get_list_extra_args(self):
+        # sort, search and filter links start over from the first page
+        view_args = super(CustomModelView, self)._get_list_extra_args()
+        for name in ('after', 'count'):
+            view_args.extra_args.pop(name, None)
+
+        return view_args
+
+    def _apply_sorting(self, query, joins, sort_column, sort_desc):
+        query, joins = super(CustomModelView, self)._apply_sorting(
+            query, joins, sort_column, sort_desc
+        )
+
+        order = self._keyset_order(sort_column, sort_desc)
+        if order is None:
+            return query, joins
+
+        column, descending = order
+        pk = self.model.__table__.c.id
+
+        if column is not pk:
+            query = query.order_by(pk.desc() if descending else pk)
 
-class PostView(CustomModelView):
+        after = self._after()
+        if after is not None:
+            sort_value, row_id = after
+            if descending:
+                query = query.filter(or_(
+                    column < sort_value,
+                    and_(column == sort_value, pk < row_id)
+                ))
+            else:
+                query = query.filter(or_(
+                    column > sort_value,
+                    and_(column == sort_value, pk > row_id)
+                ))
+
+        return query, joins
+
+    def _apply_pagination(self, query, page, page_size):
+        # a cursor replaces the offset
+        if self._after() is not None:
+            page = None
+
+        return super(CustomModelView, self)._apply_pagination(
+            query, page, page_size
+        )
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        _, query = super(CustomModelView, self).get_list(
+            page, sort_column, sort_desc, search, filters,
+            execute=False, page_size=page_size
+        )
+
+        if request.args.get('count') == 'exact':
+            count = query.limit(None).offset(None).order_by(None).count()
+        elif not search and not filters:
+            count = estimated_rows(self.model.__table__)
+        else:
+            count = None
+
+        if execute:
+            query = query.all()
+
+        return count, query
+
+    def render(self, template, **kwargs):
+        if template == self.list_template and 'data' in kwargs:
+            kwargs.update(self._pager_args(**kwargs))
+
+        return super(CustomModelView, self).render(template, **kwargs)
+
+    def _pager_args(self, data, page_size, sort_column, sort_desc, count,
+                    **kwargs):
+        args = request.args.to_dict()
+        for name in ('page', 'after', 'count'):
+            args.pop(name, None)
+
+        sort_name = None
+        if sort_column is not None:
+            sort_name = self._get_column_by_idx(sort_column)[0]
+
+        result = dict(keyset=False, next_url=None, first_url=None)
+
+        order = self._keyset_order(sort_name, sort_desc)
+        if order is not None:
+            result['keyset'] = True
+
+            if request.args.get('after') or request.args.get('page'):
+                result['first_url'] = self.get_url('.index_view', **args)
+
+            if data and len(data) == page_size:
+                column, _ = order
+                last = data[-1]
+                result['next_url'] = self.get_url(
+                    '.index_view',
+                    after=_encode_after(
+                        getattr(last, column.key), last.id
+                    ),
+                    **args
+                )
+
+        # an estimate is only good for a rough idea of the size, it
+        # is not shown as the count and makes no page numbers
+        result['estimated_count'] = None
+        if request.args.get('count') != 'exact':
+            result['estimated_count'] = count
+            result['count'] = None
+            result['exact_count_url'] = self.get_url(
+                '.index_view', count='exact', **args
+            )
+            result['num_pages'] = None
+
+        return result
+
+
+class SearchIndexMixin(object):
+    """
+    Answers the list view search box from the full text index instead
+    of a LIKE scan over column_searchable_list
+    """
+    search_limit = 1000
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        ids = [
+            ref_id for _, ref_id, _ in
+            match(search, [self.model], limit=self.search_limit)
+        ]
+
+        query = query.filter(self.model.id.in_(ids))
+        if count_query is not None:
+            count_query = count_query.filter(self.model.id.in_(ids))
+
+        return query, count_query, joins, count_joins
+
+
+class PostView(SearchIndexMixin, CustomModelView):
     form_overrides = dict(text=CKTextAreaField)
     column_searchable_list = ('text', 'title')
     column_filters = ('publish_date',)
@@ -35,6 +275,10 @@ class PostView(CustomModelView):
     edit_template = 'admin/post_edit.html'
 
 
+class ItemView(SearchIndexMixin, CustomModelView):
+    column_searchable_list = ('text', 'name')
+
+
 class CustomFileAdmin(FileAdmin):
     def is_accessible(self):
         return current_user.is_authenticated() and admin_permission.can()
@@ -1,6 +1,7 @@
 import datetime
 from sqlalchemy import func, text
 from flask import (render_template,
+                   current_app,
                    Blueprint,
                    redirect,
                    url_for,
@@ -9,9 +10,19 @@ from flask import (render_template,
 from flask_login import login_required, current_user
 from flask_principal import Permission, UserNeed
 
+from webapp.caching import (
+    tagged,
+    request_key,
+    uncacheable,
+    stale_while_revalidate
+)
+from webapp.conditional import conditional
 from webapp.extensions import poster_permission, admin_permission, cache
-from webapp.models import db, User, Item, Category
+from webapp.models import db, Item, Category, PopularItem
 from webapp.forms import ItemForm, CategoryForm
+from webapp.metrics import metrics
+from webapp.pagination import keyset_paginate, InvalidCursor
+from webapp.search import search as run_search
 
 blog_blueprint = Blueprint(
     'blog',
@@ -20,36 +31,77 @@ blog_blueprint = Blueprint(
     url_prefix="/blog"
 )
 
+# what each cached page is keyed on, and the models it shows
+home_key = request_key(query_args=('cursor', 'page'))
+home_tags = ['Category', 'PopularItem']
+
+category_key = request_key()
+category_tags = ['Category', 'Category:{category_id}', 'PopularItem']
+
+item_key = request_key()
+item_identifier_key = request_key(query_args=('item_id',))
+item_tags = ['Item', 'Category', 'PopularItem']
+
+search_key = request_key(query_args=('q', 'page'))
+search_tags = ['Category', 'Item']
+
 
-@cache.cached(timeout=7200, key_prefix='sidebar_data')
+@metrics.timed('sidebar')
+@stale_while_revalidate(grace=600)
+@cache.cached(
+    timeout=7200,
+    key_prefix=tagged('sidebar_data', ['Category', 'PopularItem'])
+)
 def sidebar_data():
     recent = Category.query.order_by(
         Category.publish_date.desc()
     ).limit(5).all()
 
-    top_items = db.session.query(Item).from_statement(
-        text('''
-        SELECT * FROM item
-        JOIN category 
-        ON item.category_id = category.id
-    ''')).all()
+    top_items = PopularItem.top(current_app.config['POPULAR_ITEMS_LIMIT'])
 
     return recent, top_items
 
 
 @blog_blueprint.route('/')
 @blog_blueprint.route('/<int:page>')
-@cache.cached(timeout=60)
-def home(page=1):
-
-    categories = Category.query.order_by(
-        Category.publish_date.desc()
-    ).paginate(page, 10, error_out=False)
-
-    if categories.page != page:
+@conditional(home_key, home_tags)
+@stale_while_revalidate(grace=300, unless=uncacheable)
+@cache.cached(
+    timeout=3600,
+    key_prefix=tagged(home_key, home_tags),
+    unless=uncacheable
+)
+def home(page=None):
+    if page is None and 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+
+    if page is None:
+        # keyset pagination, no COUNT and no OFFSET scan
+        query = Category.query
+        try:
+            categories = keyset_paginate(
+                query,
+                Category.publish_date,
+                Category.id,
+                cursor=request.args.get('cursor'),
+                per_page=10
+            )
+        except InvalidCursor:
+            categories = keyset_paginate(
+                query,
+                Category.publish_date,
+                Category.id,
+                per_page=10
+            )
+    else:
         categories = Category.query.order_by(
             Category.publish_date.desc()
-        ).paginate(1, 10, error_out=False)
+        ).paginate(page, 10, error_out=False)
+
+        if categories.page != page:
+            categories = Category.query.order_by(
+                Category.publish_date.desc()
+            ).paginate(1, 10, error_out=False)
 
     recent, top_items = sidebar_data()
 
@@ -62,7 +114,12 @@ def home(page=1):
 
 
 @blog_blueprint.route('/category/<int:category_id>', methods=('GET', 'POST'))
-@cache.cached(timeout=60)
+@conditional(category_key, category_tags)
+@cache.cached(
+    timeout=3600,
+    key_prefix=tagged(category_key, category_tags),
+    unless=uncacheable
+)
 def category(category_id):
     form = ItemForm()
 
@@ -99,9 +156,7 @@ def new_post():
         new_post_model = Category(form.title.data)
         new_post_model.text = form.text.data
         new_post_model.publish_date = datetime.datetime.now()
-        new_post_model.user = User.query.filter_by(
-            username=current_user.username
-        ).one()
+        new_post_model.user_id = current_user.id
 
         db.session.add(new_post_model)
         db.session.commit()
@@ -115,7 +170,7 @@ def new_post():
 def edit_post(id):
     post = Category.query.get_or_404(id)
 
-    permission = Permission(UserNeed(post.user.id))
+    permission = Permission(UserNeed(post.user_id))
 
     # We want admins to be able to edit any post
     if permission.can() or admin_permission.can():
@@ -139,7 +194,12 @@ def edit_post(id):
 
 
 @blog_blueprint.route('/item/<string:item_name>')
-@cache.cached(timeout=60)
+@conditional(item_key, item_tags)
+@cache.cached(
+    timeout=3600,
+    key_prefix=tagged(item_key, item_tags),
+    unless=uncacheable
+)
 def item(item_name):
     item = Item.query.filter_by(name=item_name).first_or_404()
     categories = db.session.query(Category).from_statement(
@@ -159,7 +219,12 @@ def item(item_name):
     )
 
 @blog_blueprint.route('/item/')
-@cache.cached(timeout=60)
+@conditional(item_identifier_key, item_tags)
+@cache.cached(
+    timeout=3600,
+    key_prefix=tagged(item_identifier_key, item_tags),
+    unless=uncacheable
+)
 def item_identifier():
     id = request.args.get('item_id')
     item = Item.query.get_or_404(id)
@@ -178,3 +243,19 @@ def item_identifier():
         recent=recent,
         top_items=top_items
     )
+
+
+@blog_blueprint.route('/search')
+@conditional(search_key, search_tags)
+@cache.cached(
+    timeout=600,
+    key_prefix=tagged(search_key, search_tags),
+    unless=uncacheable
+)
+def search():
+    terms = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results = run_search(terms, page=page, per_page=10)
+
+    return render_template('search.html', results=results)
@@ -1,10 +1,9 @@
-from flask import abort, current_app
+from flask import abort
 from flask_restful import Resource
 
-from webapp.models import User
-from .parsers import user_post_parser
-
-from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
+from webapp.models import db, User
+from webapp.tokens import auth_tokens
+from .parsers import user_post_parser, user_delete_parser
 
 
 class AuthApi(Resource):
@@ -13,7 +12,18 @@ class AuthApi(Resource):
         user = User.query.filter_by(username=args['username']).one()
 
         if user.check_password(args['password']):
-            s = Serializer(current_app.config['SECRET_KEY'], expires_in=604800)
-            return {"token": s.dumps({'id': user.id})}
+            if db.session.is_modified(user):
+                db.session.commit()
+
+            return {"token": auth_tokens.generate(user.id)}
         else:
             abort(401)
+
+    def delete(self):
+        args = user_delete_parser.parse_args()
+
+        if not auth_tokens.verify(args['token']):
+            abort(401)
+
+        auth_tokens.revoke(args['token'])
+        return "", 204
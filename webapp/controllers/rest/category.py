@@ -1,60 +1,136 @@
 import datetime
 
-from flask import abort
+from flask import abort, url_for
 from flask_restful import Resource, fields, marshal_with
+from sqlalchemy.orm import joinedload, selectinload
 
+from webapp.caching import request_key
+from webapp.conditional import conditional
 from webapp.models import db, User, Category, Item
+from webapp.pagination import keyset_paginate, InvalidCursor
+from webapp.tokens import auth_tokens
 from .parsers import (
     category_get_parser,
     category_post_parser,
     category_put_parser,
     category_delete_parser
 )
-from .fields import HTMLField
 
 
 nested_tag_fields = {
     'id': fields.Integer(),
-    'title': fields.String()
+    'title': fields.String(attribute='name')
 }
 
 category_fields = {
     'id': fields.Integer(),
     'author': fields.String(attribute=lambda x: x.user.username),
     'title': fields.String(),
-    'text': HTMLField(),
+    'text': fields.String(attribute='text_plain'),
     'tags': fields.List(fields.Nested(nested_tag_fields)),
     'publish_date': fields.DateTime(dt_format='iso8601')
 }
 
+# the models category_fields reads from
+category_tags = ['Category', 'Item', 'User']
+
+category_key = request_key(
+    prefix='api',
+    query_args=('page', 'user', 'cursor'),
+    headers=('page', 'user', 'cursor')
+)
+
+# loads everything category_fields reads along with the categories, one
+# joined user and one batched query for all the tags of a page, instead
+# of lazy loads per row
+category_load_options = (
+    joinedload(Category.user),
+    selectinload(Category.tags)
+)
+
+
+def cursor_headers(page, args, build_url=url_for):
+    headers = {}
+    links = []
+
+    for rel, cursor in (('next', page.next_cursor),
+                        ('prev', page.prev_cursor)):
+        if cursor is None:
+            continue
+
+        headers['X-{}-Cursor'.format(rel.capitalize())] = cursor
+        links.append('<{}>; rel="{}"'.format(
+            build_url('categoryapi', cursor=cursor, user=args['user']),
+            rel
+        ))
+
+    if links:
+        headers['Link'] = ', '.join(links)
+
+    return headers
+
+
+def add_tags(category, names):
+    """
+    Gives category an item for each of names it doesn't have yet. An
+    item belongs to a single category, so an item of the same name on
+    another category is never moved over, the way appending it would.
+    """
+    existing = set(tag.name for tag in category.tags)
+
+    for name in names:
+        if name not in existing:
+            category.tags.append(Item(name))
+            existing.add(name)
+
 
 class CategoryApi(Resource):
+    @conditional(category_key, category_tags)
     @marshal_with(category_fields)
     def get(self, category_id=None):
         if category_id:
-            category = Category.query.get(category_id)
+            category = Category.query.options(
+                *category_load_options
+            ).get(category_id)
             if not category:
                 abort(404)
 
             return category
         else:
             args = category_get_parser.parse_args()
-            page = args['page'] or 1
 
             if args['user']:
                 user = User.query.filter_by(username=args['user']).first()
                 if not user:
                     abort(404)
 
-                categories = user.categories.order_by(
-                    Category.publish_date.desc()
-                ).paginate(page, 30)
+                query = user.categories
             else:
-                categories = Category.query.order_by(
+                query = Category.query
+
+            query = query.options(*category_load_options)
+
+            # old clients page by number, which costs a COUNT and an
+            # OFFSET scan; everyone else gets keyset pages
+            if args['page']:
+                categories = query.order_by(
                     Category.publish_date.desc()
-                ).paginate(page, 30)
+                ).paginate(args['page'], 30)
+
+                return categories.items
+
+            try:
+                categories = keyset_paginate(
+                    query,
+                    Category.publish_date,
+                    Category.id,
+                    cursor=args['cursor'],
+                    per_page=30
+                )
+            except InvalidCursor:
+                abort(400)
 
-            return categories.items
+            return categories.items, 200, cursor_headers(categories, args)
 
     def post(self, category_id=None):
         if category_id:
@@ -62,25 +138,17 @@ class CategoryApi(Resource):
         else:
             args = category_post_parser.parse_args(strict=True)
 
-            user = User.verify_auth_token(args['token'])
-            if not user:
+            identity = auth_tokens.verify(args['token'])
+            if not identity:
                 abort(401)
 
             new_post = Category(args['title'])
-            new_post.user = user
-            new_post.date = datetime.datetime.now()
+            new_post.user_id = identity.id
+            new_post.publish_date = datetime.datetime.now()
             new_post.text = args['text']
 
-            if args['items']:
-                for item in args['items']:
-                    tag = Item.query.filter_by(title=item).first()
-
-                    # Add the tag if it exists. If not, make a new tag
-                    if tag:
-                        new_post.tags.append(tag)
-                    else:
-                        new_tag = Item(item)
-                        new_post.tags.append(new_tag)
+            if args['tags']:
+                add_tags(new_post, args['tags'])
 
             db.session.add(new_post)
             db.session.commit()
@@ -95,10 +163,10 @@ class CategoryApi(Resource):
             abort(404)
 
         args = category_put_parser.parse_args(strict=True)
-        user = User.verify_auth_token(args['token'])
-        if not user:
+        identity = auth_tokens.verify(args['token'])
+        if not identity:
             abort(401)
-        if user != post.user:
+        if identity.id != post.user_id:
             abort(403)
 
         if args['title']:
@@ -107,16 +175,8 @@ class CategoryApi(Resource):
         if args['text']:
             post.text = args['text']
 
-        if args['items']:
-            for item in args['items']:
-                tag = Item.query.filter_by(title=item).first()
-
-                # Add the tag if it exists. If not, make a new tag
-                if tag:
-                    post.tags.append(tag)
-                else:
-                    new_tag = Item(item)
-                    post.tags.append(new_tag)
+        if args['tags']:
+            add_tags(post, args['tags'])
 
         db.session.add(post)
         db.session.commit()
@@ -131,8 +191,8 @@ class CategoryApi(Resource):
             abort(404)
 
         args = category_delete_parser.parse_args(strict=True)
-        user = User.verify_auth_token(args['token'])
-        if user != post.user:
+        identity = auth_tokens.verify(args['token'])
+        if not identity or identity.id != post.user_id:
             abort(401)
 
         db.session.delete(post)
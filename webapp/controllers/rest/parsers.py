@@ -4,9 +4,18 @@ user_post_parser = reqparse.RequestParser()
 user_post_parser.add_argument('username', type=str, required=True)
 user_post_parser.add_argument('password', type=str, required=True)
 
+user_delete_parser = reqparse.RequestParser()
+user_delete_parser.add_argument(
+    'token',
+    type=str,
+    required=True,
+    help="Auth Token is required to revoke it"
+)
+
 category_get_parser = reqparse.RequestParser()
 category_get_parser.add_argument('page', type=int, location=['args', 'headers'])
 category_get_parser.add_argument('user', type=str, location=['args', 'headers'])
+category_get_parser.add_argument('cursor', type=str, location=['args', 'headers'])
 
 category_post_parser = reqparse.RequestParser()
 category_post_parser.add_argument(
@@ -50,7 +59,8 @@ category_put_parser.add_argument(
 )
 category_put_parser.add_argument(
     'tags',
-    type=str
+    type=str,
+    action='append'
 )
 
 category_delete_parser = reqparse.RequestParser()
@@ -60,3 +70,19 @@ category_delete_parser.add_argument(
     required=True,
     help="Auth Token is required to delete posts"
 )
+
+search_get_parser = reqparse.RequestParser()
+search_get_parser.add_argument(
+    'q',
+    type=str,
+    required=True,
+    location='args',
+    help="Search terms are required"
+)
+search_get_parser.add_argument('page', type=int, default=1, location='args')
+search_get_parser.add_argument(
+    'kind',
+    type=str,
+    choices=('category', 'item'),
+    location='args'
+)
@@ -0,0 +1,63 @@
+from flask import url_for
+from flask_restful import Resource, fields, marshal_with
+
+from webapp.caching import request_key
+from webapp.conditional import conditional
+from webapp.models import Category, Item
+from webapp.search import search
+from .parsers import search_get_parser
+
+search_models = {
+    'category': Category,
+    'item': Item
+}
+
+hit_fields = {
+    'kind': fields.String(),
+    'id': fields.Integer(attribute=lambda x: x.instance.id),
+    'title': fields.String(
+        attribute=lambda x: getattr(x.instance, 'title', None) or x.instance.name
+    ),
+    'excerpt': fields.String(attribute=lambda x: x.instance.excerpt),
+    'rank': fields.Float()
+}
+
+
+def page_headers(results, args):
+    headers = {}
+    links = []
+
+    for rel, exists, page in (('next', results.has_next, results.next_num),
+                              ('prev', results.has_prev, results.prev_num)):
+        if not exists:
+            continue
+
+        headers['X-{}-Page'.format(rel.capitalize())] = str(page)
+        links.append('<{}>; rel="{}"'.format(
+            url_for('searchapi', q=args['q'], kind=args['kind'], page=page),
+            rel
+        ))
+
+    if links:
+        headers['Link'] = ', '.join(links)
+
+    return headers
+
+
+class SearchApi(Resource):
+    @conditional(
+        request_key(prefix='api', query_args=('q', 'page', 'kind')),
+        ['Category', 'Item']
+    )
+    @marshal_with(hit_fields)
+    def get(self):
+        args = search_get_parser.parse_args()
+        page = max(args['page'], 1)
+
+        models = None
+        if args['kind']:
+            models = [search_models[args['kind']]]
+
+        results = search(args['q'], models=models, page=page, per_page=20)
+
+        return results.items, 200, page_headers(results, args)
@@ -0,0 +1,208 @@
+import datetime
+import quopri
+import smtplib
+import tempfile
+from email.message import Message
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import formatdate, make_msgid
+
+from flask import current_app
+
+from .extensions import mail
+from .models import Category
+
+# the rendered digest stays in memory up to this size, and goes to a
+# temporary file past it
+SPOOL_SIZE = 1024 * 1024
+SEND_BUFFER = 64 * 1024
+
+
+class SMTPBatchError(Exception):
+    def __init__(self, batch, error):
+        super(SMTPBatchError, self).__init__(batch, error)
+        self.batch = batch
+        self.error = error
+
+
+class _Counted(object):
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for value in self.iterable:
+            self.count += 1
+            yield value
+
+
+def week_range(today=None):
+    """
+    Returns the first and last day of the ISO week today falls in
+    """
+    today = today or datetime.date.today()
+
+    year, week = today.isocalendar()[0:2]
+    date = datetime.date(year, 1, 1)
+    if date.weekday() > 3:
+        date = date + datetime.timedelta(7 - date.weekday())
+    else:
+        date = date - datetime.timedelta(date.weekday())
+
+    start = date + datetime.timedelta(days=(week - 1) * 7)
+    return start, start + datetime.timedelta(days=6)
+
+
+def week_categories(start, end, chunk_size):
+    """
+    The categories published between start and end, fetched chunk_size
+    rows at a time instead of all at once
+    """
+    return Category.query.filter(
+        Category.publish_date >= start,
+        Category.publish_date < end + datetime.timedelta(days=1)
+    ).order_by(
+        Category.publish_date,
+        Category.id
+    ).yield_per(chunk_size)
+
+
+def render_digest(categories, stream):
+    """
+    Renders digest.html into the binary stream as the categories come
+    in, returns how many categories it rendered
+    """
+    counted = _Counted(categories)
+    template = current_app.jinja_env.get_template('digest.html')
+
+    for chunk in template.generate(categories=counted):
+        stream.write(chunk.encode('utf-8'))
+
+    return counted.count
+
+
+def write_message(body, stream, sender, subject):
+    """
+    Writes a mail with body, a stream of html, as its quoted-printable
+    encoded content into stream
+    """
+    headers = Message(policy=SMTP_POLICY)
+    headers['Subject'] = subject
+    headers['From'] = sender
+    headers['To'] = 'undisclosed-recipients:;'
+    headers['Date'] = formatdate(localtime=True)
+    headers['Message-ID'] = make_msgid()
+    headers['MIME-Version'] = '1.0'
+    headers['Content-Type'] = 'text/html; charset="utf-8"'
+    headers['Content-Transfer-Encoding'] = 'quoted-printable'
+
+    stream.write(headers.as_bytes())
+
+    body.seek(0)
+    quopri.encode(body, stream, quotetabs=False)
+
+
+def send_streamed(smtp, sender, recipients, message):
+    """
+    Sends the mail in the binary stream message to recipients over the
+    open smtp connection, reading it a line at a time rather than
+    handing smtplib the whole message. Returns the refused recipients
+    like smtplib's sendmail does.
+    """
+    smtp.ehlo_or_helo_if_needed()
+
+    code, response = smtp.mail(sender)
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+
+    refused = {}
+    for recipient in recipients:
+        code, response = smtp.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+
+    if len(refused) == len(recipients):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, response = smtp.docmd('data')
+    if code != 354:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, response)
+
+    message.seek(0)
+    buffer = bytearray()
+
+    for line in message:
+        line = line.rstrip(b'\r\n')
+        # a line made of a single dot would end the message
+        if line.startswith(b'.'):
+            buffer += b'.'
+        buffer += line + b'\r\n'
+
+        if len(buffer) >= SEND_BUFFER:
+            smtp.send(bytes(buffer))
+            del buffer[:]
+
+    buffer += b'.\r\n'
+    smtp.send(bytes(buffer))
+
+    code, response = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+
+    return refused
+
+
+def send_digest(recipients, start, end, first_batch=0):
+    """
+    Renders the digest of the week from start to end once and mails
+    it to recipients, in batches of DIGEST_BATCH_SIZE over a single
+    SMTP connection, starting at batch first_batch. Returns how many
+    batches were sent; a failed batch raises SMTPBatchError with its
+    number so it can be resumed from there.
+    """
+    config = current_app.config
+    batch_size = config['DIGEST_BATCH_SIZE']
+
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as body, \
+            tempfile.SpooledTemporaryFile(SPOOL_SIZE) as message:
+        categories = week_categories(start, end, config['DIGEST_CHUNK_SIZE'])
+
+        with current_app.test_request_context(
+            base_url=config['DIGEST_BASE_URL']
+        ):
+            if not render_digest(categories, body):
+                return 0
+
+        write_message(
+            body,
+            message,
+            config['DIGEST_SENDER'],
+            "Weekly Digest"
+        )
+
+        sent = 0
+        with mail.connect() as connection:
+            if connection.host is None:
+                # MAIL_SUPPRESS_SEND
+                return 0
+
+            batches = range(first_batch * batch_size, len(recipients),
+                            batch_size)
+
+            for number, offset in enumerate(batches, first_batch):
+                batch = recipients[offset:offset + batch_size]
+                try:
+                    send_streamed(
+                        connection.host,
+                        config['DIGEST_SENDER'],
+                        batch,
+                        message
+                    )
+                except (smtplib.SMTPException, OSError) as e:
+                    raise SMTPBatchError(number, e)
+
+                sent += 1
+
+        return sent
@@ -0,0 +1,235 @@
+import datetime
+import json
+import re
+from collections import namedtuple
+
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .controllers.rest.category import category_load_options
+from .models import db, roles, User, Role, Category, Item, PopularItem
+from .pagination import encode_cursor, keyset_query
+
+# one line of advice: the query, the tables it reads in full and the
+# plan the database gave for it
+QueryPlan = namedtuple('QueryPlan', ['name', 'full_scans', 'plan'])
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+class UnsupportedDatabase(Exception):
+    pass
+
+
+class Explain(Executable, ClauseElement):
+    def __init__(self, statement, prefix):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return '{} {}'.format(
+        element.prefix,
+        compiler.process(element.statement, **kw)
+    )
+
+
+def indexed_columns(table):
+    """
+    Returns the names of the columns of table an index can look rows
+    up by: the primary key and the leading column of every index and
+    unique constraint
+    """
+    names = set(column.name for column in list(table.primary_key)[:1])
+
+    for index in table.indexes:
+        names.add(list(index.columns)[0].name)
+
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.columns:
+            names.add(list(constraint.columns)[0].name)
+
+    names.update(column.name for column in table.columns if column.unique)
+
+    return names
+
+
+def estimated_rows(table):
+    """
+    Returns the number of rows in table according to the planner
+    statistics, or None when the table was never analyzed. Costs a
+    single catalog lookup, however big the table is.
+    """
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite':
+        analyzed = db.session.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).first()
+        if not analyzed:
+            return None
+
+        row = db.session.execute(
+            'SELECT stat FROM sqlite_stat1 WHERE tbl = :name',
+            dict(name=table.name)
+        ).first()
+        if row is None:
+            return None
+
+        return int(row[0].split()[0])
+
+    if dialect == 'postgresql':
+        rows = db.session.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)',
+            dict(name=table.name)
+        ).scalar()
+    elif dialect == 'mysql':
+        rows = db.session.execute(
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = :name',
+            dict(name=table.name)
+        ).scalar()
+    else:
+        return None
+
+    if rows is None or rows < 0:
+        return None
+
+    return int(rows)
+
+
+def hot_queries():
+    """
+    Returns (name, query) for the queries behind the busiest pages and
+    api calls. The parameters are placeholders, only the plan matters.
+    """
+    cursor = encode_cursor('n', datetime.datetime(2017, 1, 1), 1)
+
+    return [
+        ('blog home', keyset_query(
+            Category.query, Category.publish_date, Category.id
+        )),
+        ('blog home, later page', keyset_query(
+            Category.query, Category.publish_date, Category.id, cursor
+        )),
+        ('blog home, numbered page', Category.query.order_by(
+            Category.publish_date.desc()
+        ).limit(10).offset(10)),
+        ('api category list', keyset_query(
+            Category.query.options(*category_load_options),
+            Category.publish_date,
+            Category.id,
+            cursor,
+            per_page=30
+        )),
+        ('recent categories', Category.query.order_by(
+            Category.publish_date.desc()
+        ).limit(5)),
+        ('categories of a user', Category.query.filter_by(user_id=1)),
+        ('items of a category', Item.query.filter_by(category_id=1)),
+        ('item by name', Item.query.filter_by(name='name').limit(1)),
+        ('popular items', PopularItem.query.order_by(
+            PopularItem.rank
+        ).limit(10)),
+        ('user by name', User.query.filter_by(username='name')),
+        ('roles of a user', Role.query.join(
+            roles, roles.c.role_id == Role.id
+        ).filter(roles.c.user_id == 1)),
+        ('users of a role', User.query.join(
+            roles, roles.c.user_id == User.id
+        ).filter(roles.c.role_id == 1)),
+    ]
+
+
+def _sqlite_plan(statement):
+    rows = db.session.execute(
+        Explain(statement, 'EXPLAIN QUERY PLAN')
+    ).fetchall()
+    plan = [row[-1] for row in rows]
+
+    scans = []
+    for line in plan:
+        match = SQLITE_SCAN.match(line)
+        if match and ' USING ' not in line:
+            scans.append(match.group(1))
+
+    return scans, plan
+
+
+def _postgresql_plan(statement):
+    # with sequential scans priced out the planner still picks one
+    # only when no index can serve the query, on any amount of data
+    db.session.execute('SET LOCAL enable_seqscan = off')
+    rows = db.session.execute(
+        Explain(statement, 'EXPLAIN (FORMAT JSON)')
+    ).fetchall()
+
+    document = rows[0][0]
+    if isinstance(document, str):
+        document = json.loads(document)
+
+    scans, plan = [], []
+    nodes = [document[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        plan.append('{} {}'.format(
+            node['Node Type'], node.get('Relation Name', '')
+        ).strip())
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+
+    return scans, plan
+
+
+def _mysql_plan(statement):
+    rows = db.session.execute(Explain(statement, 'EXPLAIN')).fetchall()
+
+    scans = [row['table'] for row in rows if row['type'] == 'ALL']
+    plan = [
+        '{} {} {}'.format(row['table'], row['type'], row['key'] or '')
+        for row in rows
+    ]
+
+    return scans, plan
+
+
+PLANNERS = {
+    'sqlite': _sqlite_plan,
+    'postgresql': _postgresql_plan,
+    'mysql': _mysql_plan
+}
+
+
+def explain_hot_queries():
+    """
+    Runs EXPLAIN on every query of hot_queries and returns a QueryPlan
+    for each. A full scan of a table is only reported for real tables,
+    not for the subqueries the ORM builds. Raises UnsupportedDatabase
+    on a database without a planner in PLANNERS.
+    """
+    planner = PLANNERS.get(db.engine.dialect.name)
+    if planner is None:
+        raise UnsupportedDatabase(
+            "The index advisor supports {}, not {}".format(
+                ", ".join(sorted(PLANNERS)), db.engine.dialect.name
+            )
+        )
+
+    tables = set(db.metadata.tables)
+    results = []
+
+    try:
+        for name, query in hot_queries():
+            scans, plan = planner(query.statement)
+            results.append(QueryPlan(
+                name,
+                sorted(set(scan for scan in scans if scan in tables)),
+                plan
+            ))
+    finally:
+        db.session.rollback()
+
+    return results
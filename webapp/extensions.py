@@ -1,3 +1,4 @@
+import functools
 from os import getenv
 
 from flask import (
@@ -6,32 +7,70 @@ from flask import (
     url_for,
     session
 )
-from flask_admin import Admin
-from flask_assets import Environment, Bundle
-from flask_bcrypt import Bcrypt
 from flask_cache import Cache
-from flask_celery import Celery
-from flask_debugtoolbar import DebugToolbarExtension
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_oauth import OAuth
-from flask_openid import OpenID
 from flask_principal import Principal, Permission, RoleNeed
 from flask_restful import Api
+from werkzeug.local import LocalProxy
 
 from utils.loadenvironment import load_environment
 
 load_environment()
-bcrypt = Bcrypt()
-oid = OpenID()
-oauth = OAuth()
+
+
+def lazy(factory):
+    """
+    Stands in for the extension factory() returns. The extension, and
+    whatever factory imports, is only built on first use, so a process
+    that never touches it never pays for it.
+    """
+    return LocalProxy(functools.lru_cache(maxsize=None)(factory))
+
+
+def _make_oid():
+    from flask_openid import OpenID
+
+    oid = OpenID()
+    oid.after_login(create_or_login)
+
+    return oid
+
+
+def _make_oauth():
+    from flask_oauth import OAuth
+    return OAuth()
+
+
+def _make_celery():
+    from flask_celery import Celery
+    return Celery()
+
+
+def _make_debug_toolbar():
+    from flask_debugtoolbar import DebugToolbarExtension
+    return DebugToolbarExtension()
+
+
+def _make_assets_env():
+    from flask_assets import Environment
+    return Environment()
+
+
+def _make_admin():
+    from flask_admin import Admin
+    return Admin()
+
+
+oid = lazy(_make_oid)
+oauth = lazy(_make_oauth)
 principals = Principal()
 rest_api = Api()
-celery = Celery()
-debug_toolbar = DebugToolbarExtension()
+celery = lazy(_make_celery)
+debug_toolbar = lazy(_make_debug_toolbar)
 cache = Cache()
-assets_env = Environment()
-admin = Admin()
+assets_env = lazy(_make_assets_env)
+admin = lazy(_make_admin)
 mail = Mail()
 
 admin_permission = Permission(RoleNeed('admin'))
@@ -47,11 +86,10 @@ login_manager.login_message_category = "info"
 
 @login_manager.user_loader
 def load_user(userid):
-    from webapp.models import User
-    return User.query.get(userid)
+    from webapp.identity import load_snapshot
+    return load_snapshot(userid)
 
 
-@oid.after_login
 def create_or_login(resp):
     from webapp.models import db, User
     username = resp.fullname or resp.nickname or resp.email
@@ -70,48 +108,70 @@ def create_or_login(resp):
     return redirect(url_for('blog.home'))
 
 
-facebook = oauth.remote_app(
-    'facebook',
-    base_url='https://graph.facebook.com/',
-    request_token_url=None,
-    access_token_url='/oauth/access_token',
-    authorize_url='https://www.facebook.com/dialog/oauth',
-    consumer_key=getenv('FACEBOOK_CONSUMER_KEY'),
-    consumer_secret=getenv('FACEBOOK_SECRET_KEY'),
-    request_token_params={'scope': 'email'}
-)
+def _make_facebook():
+    facebook = oauth.remote_app(
+        'facebook',
+        base_url='https://graph.facebook.com/',
+        request_token_url=None,
+        access_token_url='/oauth/access_token',
+        authorize_url='https://www.facebook.com/dialog/oauth',
+        consumer_key=getenv('FACEBOOK_CONSUMER_KEY'),
+        consumer_secret=getenv('FACEBOOK_SECRET_KEY'),
+        request_token_params={'scope': 'email'}
+    )
+    facebook.tokengetter(get_facebook_oauth_token)
 
-twitter = oauth.remote_app(
-    'twitter',
-    base_url='https://api.twitter.com/1.1/',
-    request_token_url='https://api.twitter.com/oauth/request_token',
-    access_token_url='https://api.twitter.com/oauth/access_token',
-    authorize_url='https://api.twitter.com/oauth/authenticate',
-    consumer_key=getenv('TWITTER_CONSUMER_KEY'),
-    consumer_secret=getenv('TWITTER_CONSUMER_SECRET')
-)
+    return facebook
+
+
+def _make_twitter():
+    twitter = oauth.remote_app(
+        'twitter',
+        base_url='https://api.twitter.com/1.1/',
+        request_token_url='https://api.twitter.com/oauth/request_token',
+        access_token_url='https://api.twitter.com/oauth/access_token',
+        authorize_url='https://api.twitter.com/oauth/authenticate',
+        consumer_key=getenv('TWITTER_CONSUMER_KEY'),
+        consumer_secret=getenv('TWITTER_CONSUMER_SECRET')
+    )
+    twitter.tokengetter(get_twitter_oauth_token)
+
+    return twitter
 
 
-@facebook.tokengetter
 def get_facebook_oauth_token():
     return session.get('facebook_oauth_token')
 
 
-@twitter.tokengetter
 def get_twitter_oauth_token():
     return session.get('twitter_oauth_token')
 
 
-main_css = Bundle(
-    'css/bootstrap.css',
-    filters='cssmin',
-    output='css/common.css'
-)
+facebook = lazy(_make_facebook)
+twitter = lazy(_make_twitter)
 
-main_js = Bundle(
-    'js/jquery.js',
-    'js/popper.js',
-    'js/bootstrap.js',
-    filters='jsmin',
-    output='js/common.js'
-)
+
+def _make_main_css():
+    from flask_assets import Bundle
+
+    return Bundle(
+        'css/bootstrap.css',
+        filters='cssmin',
+        output='css/common.css'
+    )
+
+
+def _make_main_js():
+    from flask_assets import Bundle
+
+    return Bundle(
+        'js/jquery.js',
+        'js/popper.js',
+        'js/bootstrap.js',
+        filters='jsmin',
+        output='js/common.js'
+    )
+
+
+main_css = lazy(_make_main_css)
+main_js = lazy(_make_main_js)
@@ -8,7 +8,7 @@ from wtforms import (
 )
 from wtforms.validators import DataRequired, Length, EqualTo, URL
 
-from webapp.models import User
+from webapp.models import db, User
 
 
 class CKTextAreaWidget(widgets.TextArea):
@@ -57,6 +57,10 @@ class LoginForm(Form):
             self.username.errors.append('Invalid username or password')
             return False
 
+        # keep a hash upgraded to the current work factor
+        if db.session.is_modified(user):
+            db.session.commit()
+
         return True
 
 
@@ -0,0 +1,131 @@
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+COST = re.compile(r'^\$2[abxy]?\$(\d\d)\$')
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+
+    return value
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password, pw_hash)
+    except ValueError:
+        # not a bcrypt hash at all
+        return False
+
+
+def _in_greenlet():
+    if 'gevent' not in sys.modules:
+        return False
+
+    from greenlet import getcurrent
+    return getcurrent().parent is not None
+
+
+class PasswordHasher(object):
+    """
+    Runs bcrypt away from the request thread.
+
+    In the default 'process' mode hashes are computed by a small process
+    pool, started lazily in each worker so it survives uwsgi's fork. At
+    most PASSWORD_HASH_QUEUE hashes are in flight per worker, further
+    callers wait their turn instead of piling work onto the pool.
+
+    Called from a greenlet, as under deploy/prod.py, waiting on the
+    pool would stall the whole loop, so the wait is handed to one of
+    gevent's native threads and only the calling greenlet is suspended.
+    PASSWORD_HASH_POOL = 'thread' skips the pool and runs bcrypt
+    directly, it releases the GIL while it works.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.mode = 'process'
+        self.workers = os.cpu_count() or 2
+        self._slots = threading.BoundedSemaphore(64)
+
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_POOL', 'process')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 64)
+
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.mode = app.config['PASSWORD_HASH_POOL']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self._slots = threading.BoundedSemaphore(
+            app.config['PASSWORD_HASH_QUEUE']
+        )
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers)
+                self._pool_pid = os.getpid()
+
+            return self._pool
+
+    def _wait(self, func, args):
+        with self._slots:
+            return self._get_pool().submit(func, *args).result()
+
+    def _run(self, func, *args):
+        if self.mode != 'thread':
+            func, args = self._wait, (func, args)
+
+        if _in_greenlet():
+            from gevent import get_hub
+            return get_hub().threadpool.apply(func, args)
+
+        return func(*args)
+
+    def hash(self, password):
+        return self._run(_hash, _to_bytes(password), self.rounds)
+
+    def check(self, pw_hash, password):
+        if not pw_hash:
+            return False
+
+        return self._run(_check, _to_bytes(pw_hash), _to_bytes(password))
+
+    def needs_rehash(self, pw_hash):
+        """
+        True when pw_hash was made with a different work factor than
+        the configured BCRYPT_LOG_ROUNDS
+        """
+        if isinstance(pw_hash, bytes):
+            pw_hash = pw_hash.decode('utf-8')
+
+        match = COST.match(pw_hash or '')
+
+        return match is None or int(match.group(1)) != self.rounds
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,80 @@
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from .caching import tag_versions
+from .extensions import cache
+from .models import User
+
+
+class UserSnapshot(object):
+    """
+    What a request needs to know about the logged in user: the id,
+    the username and the names of the user's roles. It stands in for
+    the User model as flask_login's current_user, is immutable and
+    holds no reference to the session, so it can live in the cache.
+    """
+
+    __slots__ = ('id', 'username', 'role_names')
+
+    def __init__(self, id, username, role_names):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'username', username)
+        object.__setattr__(self, 'role_names', frozenset(role_names))
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role_names)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is immutable')
+
+    def __reduce__(self):
+        return self.__class__, (self.id, self.username, self.role_names)
+
+    def __repr__(self):
+        return '<UserSnapshot {}>'.format(self.username)
+
+    def is_authenticated(self):
+        return True
+
+    def is_active(self):
+        return True
+
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+
+def _snapshot_key(user_id):
+    # a commit touching the user, or any role, moves one of the tags
+    versions = tag_versions(['User:{}'.format(user_id), 'Role'])
+
+    return 'user-snapshot/{}|{}'.format(user_id, '.'.join(versions))
+
+
+def load_snapshot(user_id):
+    """
+    Returns the UserSnapshot of user_id, from the cache when possible,
+    None when there is no such user
+    """
+    key = _snapshot_key(user_id)
+    snapshot = cache.get(key)
+
+    if snapshot is None:
+        user = User.query.options(
+            selectinload(User.roles)
+        ).get(int(user_id))
+
+        if user is None:
+            return None
+
+        snapshot = UserSnapshot.from_user(user)
+        cache.set(
+            key,
+            snapshot,
+            timeout=current_app.config['USER_SNAPSHOT_TIMEOUT']
+        )
+
+    return snapshot
@@ -0,0 +1,577 @@
+import atexit
+import functools
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import (
+    Response,
+    abort,
+    current_app,
+    g,
+    has_request_context,
+    request
+)
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds, in seconds, of the histogram buckets; tasks wait and
+# run far longer than requests
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+METRICS = (
+    ('webapp_request_duration_seconds', 'histogram',
+     'Time spent handling a request'),
+    ('webapp_requests_total', 'counter',
+     'Requests handled, by response status'),
+    ('webapp_sql_statements_total', 'counter',
+     'SQL statements run while handling requests'),
+    ('webapp_sql_seconds_total', 'counter',
+     'Time spent in SQL statements while handling requests'),
+    ('webapp_cache_hits_total', 'counter',
+     'Cache lookups that found a value'),
+    ('webapp_cache_misses_total', 'counter',
+     'Cache lookups that found nothing'),
+    ('webapp_template_renders_total', 'counter',
+     'Templates rendered'),
+    ('webapp_template_seconds_total', 'counter',
+     'Time spent rendering templates'),
+    ('webapp_section_seconds_total', 'counter',
+     'Time spent in the code sections marked with metrics.timed'),
+    ('webapp_task_queue_seconds', 'histogram',
+     'Time from a task being queued, or its eta, to a worker starting it'),
+    ('webapp_task_run_seconds', 'histogram',
+     'Time spent running a task'),
+    ('webapp_tasks_total', 'counter',
+     'Task runs, by how they ended: success, retry or failure'),
+)
+
+HISTOGRAM_BUCKETS = {
+    'webapp_task_queue_seconds': TASK_BUCKETS,
+    'webapp_task_run_seconds': TASK_BUCKETS,
+}
+
+# endpoints that are not worth a label of their own
+IGNORED_ENDPOINTS = ('static', 'metrics')
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in pairs
+    ) + '}'
+
+
+def _format(value):
+    if value == int(value):
+        return str(int(value))
+
+    return repr(value)
+
+
+def dump(snapshot, f):
+    """
+    Writes a Metrics snapshot to the text file f. JSON rather than
+    pickle, reading the files of other processes must not run code
+    from them.
+    """
+    json.dump({
+        kind: [
+            [name, labels, value]
+            for (name, labels), value in entries.items()
+        ]
+        for kind, entries in snapshot.items()
+    }, f)
+
+
+def load(f):
+    """Reads a snapshot dump wrote, with the label tuples restored"""
+    return {
+        kind: {
+            (name, tuple(tuple(pair) for pair in labels)): value
+            for name, labels, value in entries
+        }
+        for kind, entries in json.load(f).items()
+    }
+
+
+def buckets(name):
+    return HISTOGRAM_BUCKETS.get(name, BUCKETS)
+
+
+def quantile(name, histogram, q):
+    """
+    Returns the upper bound of the bucket the q quantile of histogram
+    falls in, None past the last bucket or for an empty histogram
+    """
+    count = histogram[-1]
+    if not count:
+        return None
+
+    for bound, in_bucket in zip(buckets(name), histogram):
+        if in_bucket >= q * count:
+            return bound
+
+    return None
+
+
+def _queued_at(request):
+    """
+    When the task in request could first have started: the time it was
+    queued, or its eta when it was held back until then
+    """
+    times = []
+
+    if request.get('enqueued_at') is not None:
+        times.append(request.get('enqueued_at'))
+
+    if request.eta:
+        eta = request.eta
+        if isinstance(eta, str):
+            from celery.utils.iso8601 import parse_iso8601
+            eta = parse_iso8601(eta)
+        times.append(eta.timestamp())
+
+    return max(times) if times else None
+
+
+def _stamp_enqueued_at(headers=None, **kwargs):
+    # a retry is queued again and gets a new stamp
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running, as another user
+        return True
+
+    return True
+
+
+def _endpoint():
+    if not has_request_context():
+        return None
+
+    return request.endpoint or 'unmatched'
+
+
+class InstrumentedCache(object):
+    """
+    Wraps the backend of a flask_cache.Cache and counts the lookups
+    that hit and miss, anything else goes to the backend untouched
+    """
+
+    def __init__(self, backend, metrics):
+        self._backend = backend
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def get(self, key):
+        value = self._backend.get(key)
+        self._metrics.count_lookups(int(value is not None), 1)
+
+        return value
+
+    def get_many(self, *keys):
+        values = self._backend.get_many(*keys)
+        hits = sum(1 for value in values if value is not None)
+        self._metrics.count_lookups(hits, len(values))
+
+        return values
+
+
+class Metrics(object):
+    """
+    Records per endpoint latency, SQL, cache and template timings and
+    serves them at /metrics in the Prometheus text format.
+
+    Every process keeps its own numbers and writes them, at most every
+    METRICS_FLUSH_INTERVAL seconds, to a file of its own in METRICS_DIR.
+    /metrics adds up the files of every process, so whichever uwsgi
+    worker answers the scrape reports for all of them. Without a
+    METRICS_DIR only the answering process is reported. METRICS_DIR is
+    meant for the processes of one host: when an app starts, it removes
+    the files of processes that are no longer running. A process that
+    ends later still counts until the next start.
+
+    When METRICS_TOKEN is set, /metrics needs it as a bearer token.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.flush_interval = 1.0
+        self._flush_at_exit = False
+
+        self._lock = threading.Lock()
+        self._reset()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_DIR', None)
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('METRICS_TOKEN', None)
+
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.remove_stale()
+            if not self._flush_at_exit:
+                atexit.register(self.flush)
+                self._flush_at_exit = True
+
+        app.before_request_funcs.setdefault(None, []).insert(
+            0, self._start_request
+        )
+        app.after_request(self._end_request)
+        app.teardown_request(self._teardown_request)
+
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._end_render, app)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self._start_statement):
+            event.listen(Engine, 'before_cursor_execute',
+                         self._start_statement)
+            event.listen(Engine, 'after_cursor_execute',
+                         self._end_statement)
+
+        caches = app.extensions.get('cache', {})
+        for key, backend in list(caches.items()):
+            if not isinstance(backend, InstrumentedCache):
+                caches[key] = InstrumentedCache(backend, self)
+
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0
+
+    def _check_pid(self):
+        # a forked worker starts from zero, what the parent counted is
+        # in the parent's file
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_pid()
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self._check_pid()
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # one count per bucket, then the sum and the count
+                histogram = self._histograms[key] = \
+                    [0] * (len(buckets(name)) + 2)
+
+            for i, bound in enumerate(buckets(name)):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def count_lookups(self, hits, lookups):
+        endpoint = _endpoint()
+        if endpoint is None or endpoint in IGNORED_ENDPOINTS:
+            return
+
+        labels = (('endpoint', endpoint),)
+        if hits:
+            self.inc('webapp_cache_hits_total', labels, hits)
+        if lookups - hits:
+            self.inc('webapp_cache_misses_total', labels, lookups - hits)
+
+    def timed(self, section):
+        """
+        Decorates a function to add the time spent in it to the
+        section's total for the endpoint calling it
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def decorated_function(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    endpoint = _endpoint()
+                    if endpoint is not None:
+                        self.inc(
+                            'webapp_section_seconds_total',
+                            (('endpoint', endpoint), ('section', section)),
+                            time.perf_counter() - start
+                        )
+
+            return decorated_function
+
+        return decorator
+
+    def watch_tasks(self):
+        """
+        Stamps the tasks this process queues with the time they were
+        queued, for task_run to tell how long they waited
+        """
+        from celery.signals import before_task_publish
+
+        # connecting is idempotent, receivers are kept by identity
+        before_task_publish.connect(_stamp_enqueued_at, weak=False)
+
+    @contextmanager
+    def task_run(self, task):
+        """
+        Records how long the task being run by the current worker
+        waited in the queue, how long it ran and how it ended
+        """
+        from celery.exceptions import Retry
+
+        labels = (('task', task.name),)
+
+        queued_at = _queued_at(task.request)
+        if queued_at is not None:
+            self.observe(
+                'webapp_task_queue_seconds',
+                labels,
+                max(time.time() - queued_at, 0)
+            )
+
+        start = time.perf_counter()
+        state = 'failure'
+        try:
+            yield
+            state = 'success'
+        except Retry:
+            state = 'retry'
+            raise
+        finally:
+            self.observe(
+                'webapp_task_run_seconds',
+                labels,
+                time.perf_counter() - start
+            )
+            self.inc('webapp_tasks_total', labels + (('state', state),))
+            # a pool child can be replaced at any time, without running
+            # atexit, and tasks are few enough to write every one out
+            self.flush()
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+    def _end_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('metrics_start', None)
+        if start is None or request.endpoint in IGNORED_ENDPOINTS:
+            return
+
+        duration = time.perf_counter() - start
+        endpoint = _endpoint()
+        labels = (('endpoint', endpoint), ('method', request.method))
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+
+        self.observe('webapp_request_duration_seconds', labels, duration)
+        self.inc(
+            'webapp_requests_total',
+            labels + (('status', status),)
+        )
+
+        statements, seconds = g.pop('metrics_sql')
+        if statements:
+            labels = (('endpoint', endpoint),)
+            self.inc('webapp_sql_statements_total', labels, statements)
+            self.inc('webapp_sql_seconds_total', labels, seconds)
+
+        self.flush_if_due()
+
+    def _start_statement(self, conn, cursor, statement, parameters, context,
+                         executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def _end_statement(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        start = conn.info['metrics_start'].pop()
+
+        if has_request_context():
+            sql = g.get('metrics_sql')
+            if sql is not None:
+                sql[0] += 1
+                sql[1] += time.perf_counter() - start
+
+    def _start_render(self, app, template, context):
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def _end_render(self, app, template, context):
+        renders = g.get('metrics_renders')
+        if not renders:
+            return
+
+        endpoint = _endpoint()
+        labels = (('endpoint', endpoint), ('template', template.name))
+        self.inc('webapp_template_renders_total', labels)
+        self.inc(
+            'webapp_template_seconds_total',
+            labels,
+            time.perf_counter() - renders.pop()
+        )
+
+    def _snapshot(self):
+        with self._lock:
+            self._check_pid()
+            return dict(
+                counters=dict(self._counters),
+                histograms={
+                    key: list(value)
+                    for key, value in self._histograms.items()
+                }
+            )
+
+    def _path(self, pid):
+        return os.path.join(self.directory, '{}.metrics'.format(pid))
+
+    def remove_stale(self):
+        """Deletes the files of processes that are no longer running"""
+        for name in os.listdir(self.directory):
+            pid, _, suffix = name.partition('.')
+            if suffix != 'metrics' or not pid.isdigit() or \
+                    _is_running(int(pid)):
+                continue
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # another process starting up got to it first
+                pass
+
+    def flush(self):
+        """Writes this process's numbers to its file in METRICS_DIR"""
+        if not self.directory:
+            return
+
+        snapshot = self._snapshot()
+        self._flushed_at = time.monotonic()
+
+        # written aside and renamed, a reader never sees half a file
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            dump(snapshot, f)
+        os.replace(path, self._path(os.getpid()))
+
+    def flush_if_due(self):
+        if self.directory and \
+                time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """
+        Returns (counters, histograms) added up over every process
+        """
+        if not self.directory:
+            snapshots = [self._snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.metrics'):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        snapshots.append(load(f))
+                except (OSError, ValueError, TypeError):
+                    continue
+
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for key, value in snapshot['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+
+            for key, value in snapshot['histograms'].items():
+                total = histograms.setdefault(key, [0] * len(value))
+                for i, part in enumerate(value):
+                    total[i] += part
+
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+
+        for name, kind, description in METRICS:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+            if kind == 'counter':
+                for key in sorted(k for k in counters if k[0] == name):
+                    lines.append('{}{} {}'.format(
+                        name, _labels(key[1]), _format(counters[key])
+                    ))
+                continue
+
+            for key in sorted(k for k in histograms if k[0] == name):
+                labels = key[1]
+                histogram = histograms[key]
+
+                for bound, count in zip(buckets(name), histogram):
+                    lines.append('{}_bucket{} {}'.format(
+                        name,
+                        _labels(labels, [('le', bound)]),
+                        _format(count)
+                    ))
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(labels, [('le', '+Inf')]),
+                    _format(histogram[-1])
+                ))
+                lines.append('{}_sum{} {}'.format(
+                    name, _labels(labels), _format(histogram[-2])
+                ))
+                lines.append('{}_count{} {}'.format(
+                    name, _labels(labels), _format(histogram[-1])
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''),
+            'Bearer ' + token
+        ):
+            abort(401)
+
+        return Response(
+            self.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+metrics = Metrics()
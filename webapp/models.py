@@ -1,20 +1,23 @@
-from flask import current_app
+import datetime
+import uuid
+
 from flask_login import AnonymousUserMixin
-from flask_sqlalchemy import SQLAlchemy
-from itsdangerous import (
-    TimedJSONWebSignatureSerializer as Serializer,
-    BadSignature,
-    SignatureExpired
-)
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import validates
 
-from .extensions import bcrypt, cache
+from utils.html import strip_tags, make_excerpt
+from .caching import watch_session
+from .hashing import password_hasher
+from .routing import RoutingSQLAlchemy
+from .tokens import auth_tokens
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+watch_session(db.session)
 
 roles = db.Table(
     'role_users',
-    db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('role_id', db.Integer, db.ForeignKey('role.id'))
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), index=True),
+    db.Column('role_id', db.Integer, db.ForeignKey('role.id'), index=True)
 )
 
 
@@ -37,11 +40,29 @@ class User(db.Model):
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
+    def cache_tags(self):
+        # User for the API, which serves every author's username
+        return ['User', 'User:{}'.format(self.id)]
+
+    @property
+    def role_names(self):
+        return frozenset(role.name for role in self.roles)
+
     def set_password(self, password):
-        self.password = bcrypt.generate_password_hash(password)
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        if not password_hasher.check(self.password, password):
+            return False
+
+        # the configured work factor changed since this hash was made,
+        # the caller has to commit for the new hash to stick
+        if password_hasher.needs_rehash(self.password):
+            self.set_password(password)
+            # the same password, the tokens issued with it stay valid
+            self.rehashed = True
+
+        return True
 
     def is_authenticated(self):
         if isinstance(self, AnonymousUserMixin):
@@ -62,19 +83,44 @@ class User(db.Model):
         return str(self.id)
 
     @staticmethod
-    @cache.memoize(60)
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
-
-        try:
-            data = s.loads(token)
-        except SignatureExpired:
-            return None
-        except BadSignature:
+        identity = auth_tokens.verify(token)
+        if identity is None:
             return None
 
-        user = User.query.get(data['id'])
-        return user
+        return User.query.get(identity.id)
+
+
+def _collect_revoked_users(session, flush_context):
+    revoked = session.info.setdefault('revoked_users', set())
+
+    for user in session.deleted:
+        if isinstance(user, User):
+            revoked.add(user.id)
+
+    for user in session.dirty:
+        if not isinstance(user, User):
+            continue
+
+        if inspect(user).attrs.password.history.has_changes() and \
+                not user.__dict__.pop('rehashed', False):
+            revoked.add(user.id)
+
+
+def _revoke_committed(session):
+    for user_id in session.info.pop('revoked_users', ()):
+        auth_tokens.revoke_user(user_id)
+
+
+def _discard_revoked(session):
+    session.info.pop('revoked_users', None)
+
+
+# tokens are verified without loading the user, so the ones of a user
+# that is deleted or gets a new password are revoked instead
+event.listen(db.session, 'after_flush', _collect_revoked_users)
+event.listen(db.session, 'after_commit', _revoke_committed)
+event.listen(db.session, 'after_rollback', _discard_revoked)
 
 
 class Role(db.Model):
@@ -88,16 +134,48 @@ class Role(db.Model):
     def __repr__(self):
         return '<Role {}>'.format(self.name)
 
+    def cache_tags(self):
+        return ['Role']
+
+
+class PlainTextMixin(object):
+    """
+    Keeps a tag free copy of the html text column and a short excerpt
+    of it, worked out once when the text is written rather than on
+    every render or API response.
+    """
+    text_plain = db.Column(db.Text())
+    excerpt = db.Column(db.String(512))
+
+    @validates('text')
+    def update_plain_text(self, key, text):
+        if text is None:
+            self.text_plain = self.excerpt = None
+        else:
+            self.text_plain = strip_tags(text)
+            self.excerpt = make_excerpt(self.text_plain)
+
+        return text
+
+
+class Category(PlainTextMixin, db.Model):
+    # every listing pages through categories newest first
+    __table_args__ = (
+        db.Index('ix_category_publish_date_id', 'publish_date', 'id'),
+    )
 
-class Category(db.Model):
     id = db.Column(db.Integer(), primary_key=True)
     title = db.Column(db.String(255))
     text = db.Column(db.Text())
     publish_date = db.Column(db.DateTime())
-    item = db.relationship(
+    user_id = db.Column(db.Integer(), db.ForeignKey('user.id'), index=True)
+    user = db.relationship(
+        'User',
+        backref=db.backref('categories', lazy='dynamic')
+    )
+    tags = db.relationship(
         'Item',
-        backref='item',
-        lazy='dynamic'
+        backref=db.backref('category', active_history=True)
     )
 
     def __init__(self, title):
@@ -106,19 +184,174 @@ class Category(db.Model):
     def __repr__(self):
         return "<Category '{}'>".format(self.title)
 
+    def cache_tags(self):
+        return ['Category', 'Category:{}'.format(self.id)]
+
 
-class Item(db.Model):
+class Item(PlainTextMixin, db.Model):
     id = db.Column(db.Integer(), primary_key=True)
-    name = db.Column(db.String(255))
+    name = db.Column(db.String(255), index=True)
     text = db.Column(db.Text())
     publish_date = db.Column(db.DateTime())
-    category_id = db.Column(db.Integer(), db.ForeignKey('category.id'))
+    # the category an item moves out of is loaded before it changes,
+    # for cache_tags
+    category_id = db.column_property(
+        db.Column(
+            db.Integer(),
+            db.ForeignKey('category.id'),
+            index=True
+        ),
+        active_history=True
+    )
+
+    def __init__(self, name=None):
+        self.name = name
 
     def __repr__(self):
         return "<Comment '{}'>".format(self.text[:15])
 
+    def cache_tags(self):
+        # moved to another category, the page of the one it left is
+        # stale as well
+        attrs = inspect(self).attrs
+        category_ids = {self.category_id}
+        category_ids.update(attrs.category_id.history.deleted or ())
+        category_ids.update(
+            category.id
+            for category in attrs.category.history.deleted or ()
+            if category is not None
+        )
+
+        return ['Item'] + [
+            'Category:{}'.format(category_id)
+            for category_id in sorted(category_ids - {None})
+        ]
+
+
+class PopularItem(db.Model):
+    """
+    A bounded snapshot of the most popular item names, ranked by the
+    number of categories an item name appears in. It is rebuilt on a
+    schedule by tasks.refresh_popular_items so that readers only ever
+    touch a handful of rows.
+    """
+    id = db.Column(db.Integer(), primary_key=True)
+    rank = db.Column(db.Integer(), index=True)
+    name = db.Column(db.String(255))
+    score = db.Column(db.Integer())
+    refreshed_at = db.Column(db.DateTime())
+
+    def __repr__(self):
+        return "<PopularItem {} '{}'>".format(self.rank, self.name)
+
+    def cache_tags(self):
+        return ['PopularItem']
+
+    @classmethod
+    def top(cls, limit):
+        return cls.query.order_by(cls.rank).limit(limit).all()
+
+    @classmethod
+    def refresh(cls, limit):
+        score = func.count(func.distinct(Item.category_id)).label('score')
+
+        ranked = db.session.query(Item.name, score).filter(
+            Item.name.isnot(None)
+        ).group_by(
+            Item.name
+        ).order_by(
+            score.desc(),
+            func.max(Item.publish_date).desc(),
+            Item.name
+        ).limit(limit).all()
+
+        now = datetime.datetime.now()
+
+        cls.query.delete()
+        for rank, (name, item_score) in enumerate(ranked, start=1):
+            popular = cls()
+            popular.rank = rank
+            popular.name = name
+            popular.score = item_score
+            popular.refreshed_at = now
+            db.session.add(popular)
+
+        db.session.commit()
+
+        return len(ranked)
+
 
 class Reminder(db.Model):
+    """
+    A mail to send once its date has passed. Due reminders are picked
+    up in batches by tasks.dispatch_reminders; a batch is claimed with
+    a single UPDATE so that two workers never send the same reminder.
+    """
+    # the dispatcher only ever looks for unsent reminders that are due
+    __table_args__ = (
+        db.Index('ix_reminder_has_been_sent_date', 'has_been_sent', 'date'),
+    )
+
     id = db.Column(db.Integer(), primary_key=True)
+    date = db.Column(db.DateTime())
+    email = db.Column(db.String(255))
     text = db.Column(db.Text())
-    has_been_sent = db.Column(db.Boolean())
+    has_been_sent = db.Column(db.Boolean(), default=False)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime())
+    # sends the mail server turned down, counted towards max_attempts
+    attempts = db.Column(db.Integer(), default=0)
+
+    def __repr__(self):
+        return "<Reminder '{}'>".format(self.text[:15])
+
+    @classmethod
+    def claim(cls, batch_size, timeout, max_attempts=5):
+        """
+        Marks up to batch_size due reminders as taken and returns them.
+        A claim older than timeout seconds belongs to a worker that
+        died mid batch and is taken over. Reminders the mail server
+        turned down max_attempts times are given up on.
+        """
+        now = datetime.datetime.now()
+        token = uuid.uuid4().hex
+        claimable = db.and_(
+            cls.has_been_sent == False,  # noqa: E712
+            cls.date <= now,
+            cls.attempts < max_attempts,
+            db.or_(
+                cls.claimed_by.is_(None),
+                cls.claimed_at < now - datetime.timedelta(seconds=timeout)
+            )
+        )
+
+        due = db.session.query(cls.id).filter(claimable).order_by(
+            cls.has_been_sent,
+            cls.date
+        ).limit(batch_size).subquery()
+
+        # the conditions are checked again by the UPDATE itself, a row
+        # another worker claimed in the meantime is left alone
+        claimed = cls.query.filter(
+            cls.id.in_(db.session.query(due.c.id)),
+            claimable
+        ).update(
+            dict(claimed_by=token, claimed_at=now),
+            synchronize_session=False
+        )
+        db.session.commit()
+
+        if not claimed:
+            return []
+
+        return cls.query.filter_by(claimed_by=token).order_by(cls.date).all()
+
+    @classmethod
+    def release(cls, reminders):
+        """Gives unsent reminders back to the next dispatcher run"""
+        for reminder in reminders:
+            if not reminder.has_been_sent:
+                reminder.claimed_by = None
+                reminder.claimed_at = None
+
+        db.session.commit()
@@ -0,0 +1,152 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, sort_value, row_id):
+    """
+    Packs a (sort value, id) keyset position into an opaque, url safe
+    token. direction is 'n' for the page after the position and 'p'
+    for the page before it.
+    """
+    if isinstance(sort_value, datetime.datetime):
+        sort_value = sort_value.isoformat()
+
+    payload = json.dumps([direction, sort_value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+
+    try:
+        direction, sort_value, row_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        )
+        sort_value = datetime.datetime.strptime(
+            sort_value,
+            '%Y-%m-%dT%H:%M:%S.%f' if '.' in sort_value
+            else '%Y-%m-%dT%H:%M:%S'
+        )
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+
+    if direction not in ('n', 'p'):
+        raise InvalidCursor(token)
+
+    return direction, sort_value, row_id
+
+
+class KeysetPage(object):
+    """
+    A page of a keyset (seek) paginated query. Mirrors the parts of
+    flask_sqlalchemy's Pagination that the templates use, but never
+    runs a COUNT query, so there are no page numbers.
+    """
+    is_keyset = True
+
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _position(cursor):
+    if cursor:
+        return decode_cursor(cursor)
+
+    return 'n', None, None
+
+
+def keyset_query(query, sort_column, id_column, cursor=None, per_page=10):
+    """
+    Returns the query keyset_paginate runs for a page: per_page + 1
+    rows of query after the position encoded in cursor.
+    """
+    direction, sort_value, row_id = _position(cursor)
+
+    query = query.filter(sort_column.isnot(None))
+
+    if direction == 'n':
+        if sort_value is not None:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.filter(or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > row_id)
+        ))
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    return query.limit(per_page + 1)
+
+
+def keyset_page(rows, sort_column, id_column, cursor=None, per_page=10):
+    """
+    Returns the KeysetPage for the rows the query from keyset_query
+    returned, for callers that run it themselves
+    """
+    direction, sort_value, _ = _position(cursor)
+
+    rows = list(rows)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'p':
+        rows.reverse()
+
+    def position(row, towards):
+        return encode_cursor(
+            towards,
+            getattr(row, sort_column.key),
+            getattr(row, id_column.key)
+        )
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if direction == 'n':
+            if has_more:
+                next_cursor = position(rows[-1], 'n')
+            if sort_value is not None:
+                prev_cursor = position(rows[0], 'p')
+        else:
+            next_cursor = position(rows[-1], 'n')
+            if has_more:
+                prev_cursor = position(rows[0], 'p')
+
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=10):
+    """
+    Returns a KeysetPage of query ordered newest first by
+    (sort_column, id_column), starting after the position encoded in
+    cursor. Each page is a single indexed range scan of per_page + 1
+    rows, however deep it is.
+
+    Rows with a NULL sort_column have no position in the keyset and
+    are left out.
+    """
+    rows = keyset_query(
+        query, sort_column, id_column, cursor, per_page
+    ).all()
+
+    return keyset_page(rows, sort_column, id_column, cursor, per_page)
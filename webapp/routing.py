@@ -0,0 +1,154 @@
+import time
+from contextlib import contextmanager
+
+from flask import (
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request
+)
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+# the SQLALCHEMY_BINDS key of the read replica
+REPLICA = 'replica'
+
+# set on the responses of requests that wrote, holds the time until
+# which that client's reads go to the primary
+STICKY_COOKIE = 'db_primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _sticky():
+    if g.get('db_wrote'):
+        return True
+
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+
+    return until > time.time()
+
+
+def _tags_changed():
+    changed = g.get('tags_changed_at')
+    if changed is None:
+        return False
+
+    # versions have a one second resolution, count from the end of it
+    seconds = current_app.config['REPLICA_STICKY_SECONDS']
+    return changed + 1 + seconds > time.time()
+
+
+def reads_from_replica():
+    """
+    Whether the reads of the current context may see a lagging copy:
+    those of GET requests from clients that didn't just write, and of
+    the tasks run under use_replica.
+
+    Not once the context has looked up a cache tag that changed within
+    REPLICA_STICKY_SECONDS, the replica may not have that write yet,
+    and what is read would be cached or ETagged under the new version
+    for good.
+    """
+    if has_app_context() and _tags_changed():
+        return False
+
+    if has_request_context():
+        return request.method in SAFE_METHODS and not _sticky()
+
+    if has_app_context():
+        return g.get('db_replica', False)
+
+    return False
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Sends the reads of the current app context outside of a request,
+    a celery task for one, to the replica
+    """
+    previous = g.get('db_replica', False)
+    g.db_replica = enabled
+    try:
+        yield
+    finally:
+        g.db_replica = previous
+
+
+class RoutingSession(SignallingSession):
+    """
+    Sends reads to the REPLICA bind where reads_from_replica allows
+    it. Flushes, write statements and every query after a flush, until
+    the transaction ends, go to the primary, so a session always reads
+    its own writes.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        replica = REPLICA in (self.app.config['SQLALCHEMY_BINDS'] or {})
+
+        if not replica or self._flushing or self.info.get('wrote') or \
+                isinstance(clause, UpdateBase) or \
+                not reads_from_replica():
+            return super(RoutingSession, self).get_bind(mapper, clause)
+
+        # models with a bind of their own keep it
+        if mapper is not None and \
+                mapper.persist_selectable.info.get('bind_key') is not None:
+            return super(RoutingSession, self).get_bind(mapper, clause)
+
+        return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+
+
+def _flushed(session, context):
+    session.info['wrote'] = True
+
+
+def _committed(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+
+def _rolled_back(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy with a RoutingSession. A client whose request wrote is
+    sent a cookie that keeps its reads on the primary for
+    REPLICA_STICKY_SECONDS, long enough for the replica to catch up.
+    """
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_scoped_session(self, options=None):
+        session = super(RoutingSQLAlchemy, self).create_scoped_session(
+            options
+        )
+
+        event.listen(session, 'after_flush', _flushed)
+        event.listen(session, 'after_commit', _committed)
+        event.listen(session, 'after_rollback', _rolled_back)
+
+        return session
+
+    def init_app(self, app):
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('db_wrote'):
+                seconds = app.config['REPLICA_STICKY_SECONDS']
+                response.set_cookie(
+                    STICKY_COOKIE,
+                    str(time.time() + seconds),
+                    max_age=seconds,
+                    httponly=True
+                )
+
+            return response
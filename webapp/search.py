@@ -0,0 +1,385 @@
+import logging
+import re
+
+from sqlalchemy import event, inspect, text
+
+from .models import db, Category, Item
+
+INDEX_TABLE = 'search_index'
+
+# every indexed row gets one document id, the model's position in
+# SEARCHABLE is folded into it so a single integer key covers both
+# models and an update or delete is a primary key lookup
+SEARCHABLE = (
+    (Category, 'title'),
+    (Item, 'name'),
+)
+KINDS = 8
+
+logger = logging.getLogger(__name__)
+
+
+DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+        "title, body, tokenize = 'porter unicode61')".format(INDEX_TABLE)
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS {} ("
+        "doc_id BIGINT PRIMARY KEY, title TEXT, body TEXT, "
+        "document TSVECTOR NOT NULL)".format(INDEX_TABLE),
+        "CREATE INDEX IF NOT EXISTS ix_{0}_document ON {0} "
+        "USING GIN (document)".format(INDEX_TABLE)
+    ]
+}
+
+INSERT = {
+    'sqlite':
+        "INSERT INTO {} (rowid, title, body) "
+        "VALUES (:doc_id, :title, :body)".format(INDEX_TABLE),
+    'postgresql':
+        "INSERT INTO {} (doc_id, title, body, document) "
+        "VALUES (:doc_id, :title, :body, "
+        "setweight(to_tsvector('english', coalesce(:title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(:body, '')), 'B'))"
+        .format(INDEX_TABLE)
+}
+
+DELETE = {
+    'sqlite': "DELETE FROM {} WHERE rowid = :doc_id".format(INDEX_TABLE),
+    'postgresql': "DELETE FROM {} WHERE doc_id = :doc_id".format(INDEX_TABLE)
+}
+
+# lower is better for both, titles weigh ten times the body
+MATCH = {
+    'sqlite':
+        "SELECT rowid AS doc_id, bm25({0}, 10.0, 1.0) AS rank FROM {0} "
+        "WHERE {0} MATCH :terms AND rowid % {1} IN :kinds "
+        "ORDER BY rank, rowid LIMIT :limit OFFSET :offset"
+        .format(INDEX_TABLE, KINDS),
+    'postgresql':
+        "SELECT doc_id, -ts_rank(document, query) AS rank "
+        "FROM {0}, plainto_tsquery('english', :terms) query "
+        "WHERE document @@ query AND doc_id % {1} IN :kinds "
+        "ORDER BY rank, doc_id LIMIT :limit OFFSET :offset"
+        .format(INDEX_TABLE, KINDS)
+}
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchHit(object):
+    """
+    A matching Category or Item, kind is its table name. Not a tuple,
+    flask_restful would marshal a tuple as a list of values.
+    """
+    def __init__(self, kind, instance, rank):
+        self.kind = kind
+        self.instance = instance
+        self.rank = rank
+
+
+class SearchPage(object):
+    """
+    One page of ranked hits. There is no total, finding it would mean
+    ranking every match, so only the next page is known to exist.
+    """
+    def __init__(self, terms, hits, page, per_page, has_next):
+        self.terms = terms
+        self.items = hits
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1
+
+
+def _kind(model):
+    for kind, (searchable, _) in enumerate(SEARCHABLE):
+        if searchable is model:
+            return kind
+
+    raise ValueError('{} is not searchable'.format(model.__name__))
+
+
+def doc_id(model, ref_id):
+    return ref_id * KINDS + _kind(model)
+
+
+def _document(instance):
+    model = type(instance)
+    title = getattr(instance, dict(SEARCHABLE)[model])
+
+    return dict(
+        doc_id=doc_id(model, instance.id),
+        title=title,
+        body=instance.text_plain
+    )
+
+
+# the dialects without an index that were already logged
+_unsupported = set()
+
+
+def available(bind):
+    """
+    Whether there is a full text index on the database of bind. On
+    any other, writes don't keep an index and search falls back to
+    LIKE.
+    """
+    name = bind.dialect.name
+    if name in DDL:
+        return True
+
+    if name not in _unsupported:
+        _unsupported.add(name)
+        logger.warning(
+            "No full text search on %s, searching with LIKE", name
+        )
+
+    return False
+
+
+def _dialect(bind):
+    name = bind.dialect.name
+    if name not in DDL:
+        raise SearchUnavailable(
+            "Full text search supports {}, not {}".format(
+                " and ".join(sorted(DDL)), name
+            )
+        )
+
+    return name
+
+
+def _match_terms(dialect, terms):
+    words = re.findall(r'\w+', terms or '')
+    if not words or dialect != 'sqlite':
+        return ' '.join(words)
+
+    # quoted, so user input is never read as fts5 query syntax
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def create_index(bind):
+    if not available(bind):
+        return
+
+    for statement in DDL[_dialect(bind)]:
+        bind.execute(text(statement))
+
+
+def drop_index(bind):
+    if not available(bind):
+        return
+
+    bind.execute(text('DROP TABLE IF EXISTS {}'.format(INDEX_TABLE)))
+
+
+def index(connection, instance):
+    if not available(connection):
+        return
+
+    dialect = _dialect(connection)
+    document = _document(instance)
+
+    connection.execute(text(DELETE[dialect]), doc_id=document['doc_id'])
+    connection.execute(text(INSERT[dialect]), **document)
+
+
+def unindex(connection, instance):
+    if not available(connection):
+        return
+
+    connection.execute(
+        text(DELETE[_dialect(connection)]),
+        doc_id=doc_id(type(instance), instance.id)
+    )
+
+
+def reindex(bind, batch_size=1000):
+    """
+    Rebuilds the whole index, for rows written around the ORM. Raises
+    SearchUnavailable on a database without one.
+    """
+    dialect = _dialect(bind)
+    bind.execute(text('DELETE FROM {}'.format(INDEX_TABLE)))
+
+    for model, title in SEARCHABLE:
+        table = model.__table__
+        columns = [table.c.id, table.c[title], table.c.text_plain]
+        last_id = 0
+
+        while True:
+            rows = bind.execute(
+                db.select(columns).where(
+                    table.c.id > last_id
+                ).order_by(table.c.id).limit(batch_size)
+            ).fetchall()
+
+            if not rows:
+                break
+
+            bind.execute(text(INSERT[dialect]), [
+                dict(doc_id=doc_id(model, row[0]), title=row[1], body=row[2])
+                for row in rows
+            ])
+            last_id = rows[-1][0]
+
+
+def _contains(column, word):
+    return column.contains(word, autoescape=True)
+
+
+def _like_match(terms, models, limit, offset):
+    """
+    match without an index: every word in the title or the text,
+    matches in the title first, then by id
+    """
+    words = [word.lower() for word in re.findall(r'\w+', terms or '')]
+    if not words:
+        return []
+
+    selects = []
+    for model in models:
+        table = model.__table__
+        columns = (
+            db.func.lower(table.c[dict(SEARCHABLE)[model]]),
+            db.func.lower(table.c.text_plain)
+        )
+
+        in_title = db.and_(*[_contains(columns[0], word) for word in words])
+        selects.append(db.select([
+            (table.c.id * KINDS + _kind(model)).label('doc_id'),
+            db.case([(in_title, 0)], else_=1).label('rank')
+        ]).where(db.and_(*[
+            db.or_(*[_contains(column, word) for column in columns])
+            for word in words
+        ])))
+
+    matches = db.union_all(*selects).alias('matches')
+    rows = db.session.execute(
+        db.select([matches.c.doc_id, matches.c.rank]).order_by(
+            matches.c.rank, matches.c.doc_id
+        ).limit(limit).offset(offset)
+    ).fetchall()
+
+    return [
+        (SEARCHABLE[row[0] % KINDS][0], row[0] // KINDS, row[1])
+        for row in rows
+    ]
+
+
+def match(terms, models=None, limit=10, offset=0):
+    """
+    Returns (model, id, rank) for the best matches of terms, best
+    first
+    """
+    models = models or [model for model, _ in SEARCHABLE]
+    session = db.session
+    bind = session.get_bind()
+
+    if not available(bind):
+        return _like_match(terms, models, limit, offset)
+
+    dialect = _dialect(bind)
+
+    terms = _match_terms(dialect, terms)
+    if not terms:
+        return []
+
+    rows = session.execute(
+        text(MATCH[dialect]).bindparams(
+            db.bindparam('kinds', expanding=True)
+        ),
+        dict(
+            terms=terms,
+            kinds=[_kind(model) for model in models],
+            limit=limit,
+            offset=offset
+        )
+    ).fetchall()
+
+    return [
+        (SEARCHABLE[row[0] % KINDS][0], row[0] // KINDS, row[1])
+        for row in rows
+    ]
+
+
+def search(terms, models=None, page=1, per_page=10):
+    """
+    Returns a SearchPage of Category and Item hits for terms, ranked
+    by relevance
+    """
+    matches = match(terms, models, per_page + 1, (page - 1) * per_page)
+    has_next = len(matches) > per_page
+    matches = matches[:per_page]
+
+    ids = {}
+    for model, ref_id, _ in matches:
+        ids.setdefault(model, []).append(ref_id)
+
+    instances = {}
+    for model, model_ids in ids.items():
+        for instance in model.query.filter(model.id.in_(model_ids)):
+            instances[model, instance.id] = instance
+
+    hits = [
+        SearchHit(model.__tablename__, instances[model, ref_id], rank)
+        for model, ref_id, rank in matches
+        if (model, ref_id) in instances
+    ]
+
+    return SearchPage(terms, hits, page, per_page, has_next)
+
+
+def _after_create(target, connection, **kw):
+    create_index(connection)
+
+
+def _before_drop(target, connection, **kw):
+    drop_index(connection)
+
+
+def _changed(instance):
+    state = inspect(instance)
+    title = dict(SEARCHABLE)[type(instance)]
+
+    return any(
+        state.attrs[key].history.has_changes()
+        for key in ('id', title, 'text_plain')
+    )
+
+
+def _after_insert(mapper, connection, instance):
+    index(connection, instance)
+
+
+def _after_update(mapper, connection, instance):
+    if _changed(instance):
+        index(connection, instance)
+
+
+def _after_delete(mapper, connection, instance):
+    unindex(connection, instance)
+
+
+event.listen(db.metadata, 'after_create', _after_create)
+event.listen(db.metadata, 'before_drop', _before_drop)
+
+for searchable, _ in SEARCHABLE:
+    event.listen(searchable, 'after_insert', _after_insert)
+    event.listen(searchable, 'after_update', _after_update)
+    event.listen(searchable, 'after_delete', _after_delete)
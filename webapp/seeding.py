@@ -0,0 +1,205 @@
+import datetime
+import itertools
+import random
+
+from faker import Faker
+from flask import current_app
+from sqlalchemy import func
+
+from utils.html import strip_tags, make_excerpt
+from .caching import invalidate
+from .hashing import password_hasher
+from .models import db, roles, User, Role, Category, Item, PopularItem
+from .search import available, reindex
+
+CHUNK_SIZE = 10000
+
+# Faker is slow next to the inserts, rows are put together from pools
+# of generated text instead of asking Faker for every row
+POOL_SIZE = 1000
+
+# every seeded user can log in with this
+PASSWORD = 'password'
+
+ROLES = ('default', 'poster', 'admin')
+
+
+class TextPool(object):
+    def __init__(self, fake, rng, size=POOL_SIZE):
+        self.rng = rng
+        self.words = sorted(set(fake.words(nb=size)))
+        self.sentences = [fake.sentence() for _ in range(size)]
+        self.paragraphs = [
+            fake.paragraph(nb_sentences=5) for _ in range(size)
+        ]
+        self.names = [fake.user_name() for _ in range(size)]
+
+    def title(self):
+        return self.rng.choice(self.sentences).rstrip('.')
+
+    def html(self, paragraphs):
+        return ''.join(
+            '<p>{}</p>'.format(self.rng.choice(self.paragraphs))
+            for _ in range(paragraphs)
+        )
+
+    def item_name(self, variants):
+        return '{}-{}'.format(
+            self.rng.choice(self.words), self.rng.randint(1, variants)
+        )
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(table, rows, total, progress):
+    """
+    Inserts the rows of an iterable, a committed chunk at a time
+    """
+    rows = iter(rows)
+    done = 0
+
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+        done += len(chunk)
+
+        if progress is not None:
+            progress(table.name, done, total)
+
+
+def _advance_sequences(models):
+    """
+    The rows came with their own ids, moves the postgresql sequences
+    past them so the next insert through the ORM gets a free one
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    quote = db.engine.dialect.identifier_preparer.quote
+    for model in models:
+        table = quote(model.__table__.name)
+        db.session.execute(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "(SELECT coalesce(max(id), 0) + 1 FROM {}), false)".format(table),
+            dict(table=table)
+        )
+
+
+def _with_plain_text(row):
+    row['text_plain'] = strip_tags(row['text'])
+    row['excerpt'] = make_excerpt(row['text_plain'])
+
+    return row
+
+
+def ensure_roles():
+    """Creates the default, poster and admin roles that are missing"""
+    existing = set(name for name, in db.session.query(Role.name))
+
+    for name in ROLES:
+        if name not in existing:
+            role = Role(name)
+            role.description = name
+            db.session.add(role)
+
+    db.session.commit()
+
+    return dict(db.session.query(Role.name, Role.id))
+
+
+def seed(users, categories, items, seed=0, days=3 * 365, progress=None):
+    """
+    Adds users, categories and items of realistic looking data with
+    bulk inserts. Users get the default role, one in twenty is a
+    poster as well. The same counts and seed always give the same
+    rows, on top of whatever the database already holds.
+
+    progress(table, done, total) is called after every committed chunk,
+    total is None when it isn't known up front.
+    """
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    pool = TextPool(fake, rng)
+
+    role_ids = ensure_roles()
+    password = password_hasher.hash(PASSWORD)
+    end = datetime.datetime(2018, 1, 1)
+
+    first_user = _next_id(User)
+    first_category = _next_id(Category)
+    first_item = _next_id(Item)
+
+    user_ids = range(first_user, first_user + users) or \
+        range(1, first_user)
+    category_ids = range(first_category, first_category + categories) or \
+        range(1, first_category)
+
+    def publish_date():
+        return end - datetime.timedelta(seconds=rng.randint(0, days * 86400))
+
+    _insert(User.__table__, (
+        dict(
+            id=user_id,
+            # suffixed with the id, user names are unique
+            username='{}{}'.format(rng.choice(pool.names), user_id),
+            password=password
+        )
+        for user_id in range(first_user, first_user + users)
+    ), users, progress)
+
+    def role_links():
+        for user_id in range(first_user, first_user + users):
+            yield dict(user_id=user_id, role_id=role_ids['default'])
+            if rng.random() < 0.05:
+                yield dict(user_id=user_id, role_id=role_ids['poster'])
+
+    _insert(roles, role_links(), None, progress)
+
+    if user_ids:
+        _insert(Category.__table__, (
+            _with_plain_text(dict(
+                id=category_id,
+                title=pool.title(),
+                text=pool.html(rng.randint(1, 4)),
+                publish_date=publish_date(),
+                user_id=rng.choice(user_ids)
+            ))
+            for category_id in range(
+                first_category, first_category + categories
+            )
+        ), categories, progress)
+
+    if category_ids:
+        # about ten items share a name, like tags do
+        variants = max((items // 10) // len(pool.words), 1)
+
+        _insert(Item.__table__, (
+            _with_plain_text(dict(
+                id=item_id,
+                name=pool.item_name(variants),
+                text=pool.html(1),
+                publish_date=publish_date(),
+                category_id=rng.choice(category_ids)
+            ))
+            for item_id in range(first_item, first_item + items)
+        ), items, progress)
+
+    # the rows went around the ORM, so around the events that keep the
+    # id sequences, the search index, the cache and the planner
+    # statistics up to date
+    _advance_sequences((User, Category, Item))
+    if available(db.session.connection()):
+        reindex(db.session.connection())
+    if db.engine.dialect.name in ('sqlite', 'postgresql'):
+        db.session.execute('ANALYZE')
+    db.session.commit()
+
+    PopularItem.refresh(current_app.config['POPULAR_ITEMS_LIMIT'])
+    invalidate('User', 'Role', 'Category', 'Item', 'PopularItem')
@@ -0,0 +1,290 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from werkzeug.contrib.cache import BaseCache
+
+MAGIC = b'WACACHE1'
+
+# magic, number of sets, ways per set, slot size, access clock
+HEADER = struct.Struct('<8sIIIQ')
+HEADER_SIZE = 64
+
+# key digest, expiry (0 = never), last access, value length
+ENTRY = struct.Struct('<16sdQI4x')
+
+EMPTY = bytes(16)
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    A cache shared by every process on a host that opens the same path,
+    kept in an mmap'd file (on /dev/shm when available) of a fixed size.
+
+    The file is split into fixed size slots grouped into small sets, a
+    key can only live in the set its hash points to and the least
+    recently used slot of the set is evicted to make room. Values that
+    don't fit in a slot are not cached. All operations take an flock on
+    the file, so they are atomic across processes; add() can be used
+    as a lock.
+    """
+
+    def __init__(self, path, size=64 * 1024 * 1024, slot_size=64 * 1024,
+                 ways=8, default_timeout=300):
+        super(SharedMemoryCache, self).__init__(default_timeout)
+
+        slots = (size - HEADER_SIZE) // (ENTRY.size + slot_size)
+        if slots < 1:
+            raise ValueError('size is too small for a single slot')
+
+        self.path = path
+        self.ways = min(ways, slots)
+        self.sets = slots // self.ways
+        self.slot_size = slot_size
+
+        self._entries_offset = HEADER_SIZE
+        self._data_offset = HEADER_SIZE + self.sets * self.ways * ENTRY.size
+        self._size = self._data_offset + self.sets * self.ways * slot_size
+
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._open()
+
+    def _open(self):
+        # flock is held per open file, a forked worker has to open the
+        # file again or it would share its parent's locks
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != self._size:
+                os.ftruncate(self._fd, self._size)
+
+            self._map = mmap.mmap(self._fd, self._size)
+
+            header = HEADER.unpack_from(self._map, 0)
+            if header[:4] != (MAGIC, self.sets, self.ways, self.slot_size):
+                self._reset(0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _reset(self, clock):
+        HEADER.pack_into(
+            self._map, 0, MAGIC, self.sets, self.ways, self.slot_size, clock
+        )
+        length = self._data_offset - self._entries_offset
+        self._map[self._entries_offset:self._data_offset] = bytes(length)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._map.close()
+                os.close(self._fd)
+                self._open()
+
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _tick(self):
+        header = HEADER.unpack_from(self._map, 0)
+        clock = header[4] + 1
+        HEADER.pack_into(self._map, 0, *(header[:4] + (clock,)))
+
+        return clock
+
+    def _digest(self, key):
+        return hashlib.blake2b(
+            key.encode('utf-8'), digest_size=16
+        ).digest()
+
+    def _slots(self, digest):
+        first = (int.from_bytes(digest[:8], 'little') % self.sets) * self.ways
+        return range(first, first + self.ways)
+
+    def _entry(self, slot):
+        return ENTRY.unpack_from(
+            self._map, self._entries_offset + slot * ENTRY.size
+        )
+
+    def _write_entry(self, slot, digest, expires, last_used, length):
+        ENTRY.pack_into(
+            self._map,
+            self._entries_offset + slot * ENTRY.size,
+            digest, expires, last_used, length
+        )
+
+    def _find(self, digest, now):
+        """
+        Returns the slot holding digest, dropping it if it expired.
+        """
+        for slot in self._slots(digest):
+            entry_digest, expires, _, _ = self._entry(slot)
+            if entry_digest == digest:
+                if expires and expires <= now:
+                    self._write_entry(slot, EMPTY, 0, 0, 0)
+                    return None
+
+                return slot
+
+        return None
+
+    def _victim(self, digest, now):
+        """
+        Picks the slot to store digest in: its current slot, a free or
+        expired one, or else the least recently used slot of the set.
+        """
+        victim, oldest = None, None
+
+        for slot in self._slots(digest):
+            entry_digest, expires, last_used, _ = self._entry(slot)
+
+            if entry_digest == digest or entry_digest == EMPTY:
+                return slot
+            if expires and expires <= now:
+                return slot
+            if oldest is None or last_used < oldest:
+                victim, oldest = slot, last_used
+
+        return victim
+
+    def _read(self, key, slot):
+        length = self._entry(slot)[3]
+        offset = self._data_offset + slot * self.slot_size
+        stored_key, value = pickle.loads(self._map[offset:offset + length])
+
+        if stored_key != key:
+            return None
+
+        return value
+
+    def _expires(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0:
+            return time.time() + timeout
+
+        return 0
+
+    def _store(self, key, digest, value, timeout, now):
+        data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+
+        if len(data) > self.slot_size:
+            slot = self._find(digest, now)
+            if slot is not None:
+                self._write_entry(slot, EMPTY, 0, 0, 0)
+
+            return False
+
+        slot = self._victim(digest, now)
+        offset = self._data_offset + slot * self.slot_size
+        self._map[offset:offset + len(data)] = data
+        self._write_entry(
+            slot, digest, self._expires(timeout), self._tick(), len(data)
+        )
+
+        return True
+
+    def get(self, key):
+        digest = self._digest(key)
+
+        with self._locked():
+            slot = self._find(digest, time.time())
+            if slot is None:
+                return None
+
+            entry = self._entry(slot)
+            self._write_entry(slot, entry[0], entry[1], self._tick(), entry[3])
+
+            return self._read(key, slot)
+
+    def has(self, key):
+        digest = self._digest(key)
+
+        with self._locked():
+            return self._find(digest, time.time()) is not None
+
+    def set(self, key, value, timeout=None):
+        digest = self._digest(key)
+
+        with self._locked():
+            return self._store(key, digest, value, timeout, time.time())
+
+    def add(self, key, value, timeout=None):
+        digest = self._digest(key)
+
+        with self._locked():
+            now = time.time()
+            if self._find(digest, now) is not None:
+                return False
+
+            return self._store(key, digest, value, timeout, now)
+
+    def delete(self, key):
+        digest = self._digest(key)
+
+        with self._locked():
+            slot = self._find(digest, time.time())
+            if slot is None:
+                return False
+
+            self._write_entry(slot, EMPTY, 0, 0, 0)
+            return True
+
+    def inc(self, key, delta=1):
+        digest = self._digest(key)
+
+        with self._locked():
+            now = time.time()
+            value, timeout = delta, None
+
+            slot = self._find(digest, now)
+            if slot is not None:
+                value = (self._read(key, slot) or 0) + delta
+                expires = self._entry(slot)[1]
+                timeout = max(expires - now, 1) if expires else 0
+
+            self._store(key, digest, value, timeout, now)
+
+            return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def clear(self):
+        with self._locked():
+            self._reset(HEADER.unpack_from(self._map, 0)[4])
+
+        return True
+
+
+def default_path(name):
+    directory = '/dev/shm'
+    if not os.path.isdir(directory):
+        directory = tempfile.gettempdir()
+
+    return os.path.join(directory, '{}-cache'.format(name))
+
+
+def shared_memory(app, config, args, kwargs):
+    """
+    Flask-Cache factory, use with CACHE_TYPE = 'webapp.shmcache.shared_memory'
+    """
+    kwargs.update(dict(
+        path=config.get('CACHE_SHM_PATH') or default_path(app.import_name),
+        size=config.get('CACHE_SHM_SIZE', 64 * 1024 * 1024),
+        slot_size=config.get('CACHE_SHM_SLOT_SIZE', 64 * 1024)
+    ))
+
+    return SharedMemoryCache(*args, **kwargs)
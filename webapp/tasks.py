@@ -1,12 +1,11 @@
-import datetime
 import smtplib
-from email.mime.text import MIMEText
 
-from flask import render_template
+from flask import current_app
 from flask_mail import Message
 
 from webapp.extensions import celery, mail
-from webapp.models import Category
+from webapp.digest import SMTPBatchError, send_digest, week_range
+from webapp.models import PopularItem
 from .models import Reminder
 
 
@@ -20,64 +19,99 @@ def multiply(x, y):
     return x * y
 
 
-@celery.task(
-    bind=True,
-    ignore_result=True,
-    default_retry_delay=300,
-    max_retries=5
-)
-def remind(self, pk):
-    reminder = Reminder.query.get(pk)
-    msg = MIMEText(reminder.text)
+def reminder_message(reminder):
     msg = Message("Your reminder",
-                  sender="from@example.com",
+                  sender=current_app.config['REMINDER_SENDER'],
                   recipients=[reminder.email])
 
     msg.body = reminder.text
-    mail.send(msg)
+    return msg
+
+
+def _connection_failed(error):
+    """
+    Whether error ended the mail connection, and with it the run.
+    smtplib's errors are OSErrors as well, but apart from a disconnect
+    they are about a single mail.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+
+    return isinstance(error, OSError) and \
+        not isinstance(error, smtplib.SMTPException)
+
+
+@celery.task(ignore_result=True)
+def dispatch_reminders():
+    """
+    Sends every due reminder, a claimed batch at a time, over a single
+    mail connection
+    """
+    config = current_app.config
+    sent = 0
+
+    with mail.connect() as connection:
+        while True:
+            reminders = Reminder.claim(
+                config['REMINDER_BATCH_SIZE'],
+                config['REMINDER_CLAIM_TIMEOUT'],
+                config['REMINDER_MAX_ATTEMPTS']
+            )
+            if not reminders:
+                break
+
+            try:
+                for reminder in reminders:
+                    try:
+                        connection.send(reminder_message(reminder))
+                    except Exception as e:
+                        if _connection_failed(e):
+                            raise
+
+                        # only this mail failed, to build or to be
+                        # accepted, the connection is still good for the
+                        # rest of the batch
+                        reminder.attempts = (reminder.attempts or 0) + 1
+                        current_app.logger.warning(
+                            "Reminder %s failed, attempt %s: %r",
+                            reminder.id, reminder.attempts, e
+                        )
+                        continue
+
+                    reminder.has_been_sent = True
+                    sent += 1
+            finally:
+                Reminder.release(reminders)
+
+    return sent
 
 
 @celery.task(
     bind=True,
     ignore_result=True,
     default_retry_delay=300,
-    max_retries=5
+    max_retries=5,
+    # only reads, celery_runner sends its queries to the replica
+    read_only=True
 )
-def digest(self):
-    # find the start and end of this week
-    year, week = datetime.datetime.now().isocalendar()[0:2]
-    date = datetime.date(year, 1, 1)
-    if (date.weekday() > 3):
-        date = date + datetime.timedelta(7 - date.weekday())
-    else:
-        date = date - datetime.timedelta(date.weekday())
-    delta = datetime.timedelta(days=(week - 1) * 7)
-    start, end = date + delta, date + delta + datetime.timedelta(days=6)
-
-    categories = Category.query.filter(
-        Category.publish_date >= start,
-        Category.publish_date <= end
-    ).all()
-
-    if (len(categories) == 0):
-        return
-
-    msg = MIMEText(render_template("digest.html", categories=categories), 'html')
-
-    msg['Subject'] = "Weekly Digest"
-    msg['From'] = ""
+def digest(self, first_batch=0):
+    start, end = week_range()
 
     try:
-        smtp_server = smtplib.SMTP('localhost')
-        smtp_server.starttls()
-        # smtp_server.login(user, password)
-        smtp_server.sendmail("", [""], msg.as_string())
-        smtp_server.close()
-
-        return
+        send_digest(
+            current_app.config['DIGEST_RECIPIENTS'],
+            start,
+            end,
+            first_batch
+        )
+    except SMTPBatchError as e:
+        # the batches before the failed one already went out
+        self.retry(exc=e.error, kwargs=dict(first_batch=e.batch))
     except Exception as e:
-        self.retry(exc=e)
+        # no connection or no digest, nothing went out of this attempt
+        self.retry(exc=e, kwargs=dict(first_batch=first_batch))
 
 
-def on_reminder_save(mapper, connect, self):
-    remind.apply_async(args=(self.id,), eta=self.date)
+@celery.task(ignore_result=True)
+def refresh_popular_items():
+    return PopularItem.refresh(current_app.config['POPULAR_ITEMS_LIMIT'])
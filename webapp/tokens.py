@@ -0,0 +1,151 @@
+import hashlib
+import os
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from itsdangerous import (
+    TimedJSONWebSignatureSerializer as Serializer,
+    BadSignature,
+    SignatureExpired
+)
+
+from utils.lru import LRUCache
+from .extensions import cache
+
+# what a verified token says about its holder, enough to authorize a
+# write without loading the user
+TokenIdentity = namedtuple('TokenIdentity', ['id', 'issued_at', 'expires_at'])
+
+
+def _token_key(token):
+    return 'revoked-token/' + hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+def _user_key(user_id):
+    return 'revoked-user/{}'.format(user_id)
+
+
+class AuthTokens(object):
+    """
+    Issues and verifies the api auth tokens. Verified tokens are kept
+    in a bounded in-process LRU until they expire, so a token seen
+    before costs neither an HMAC check nor a database query.
+
+    Revocations go to the shared cache so that every worker sees them,
+    and to a local list so they also hold when caching is disabled.
+    """
+
+    def __init__(self, app=None):
+        self.verified = LRUCache()
+        self.revoked = LRUCache()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_TOKEN_EXPIRES', 604800)
+        app.config.setdefault('AUTH_TOKEN_CACHE_SIZE', 10000)
+
+        self.verified.maxsize = app.config['AUTH_TOKEN_CACHE_SIZE']
+        self.revoked.maxsize = app.config['AUTH_TOKEN_CACHE_SIZE']
+
+    def _serializer(self, expires_in=None):
+        return Serializer(current_app.config['SECRET_KEY'], expires_in)
+
+    def generate(self, user_id):
+        s = self._serializer(current_app.config['AUTH_TOKEN_EXPIRES'])
+
+        # the nonce keeps two logins in the same second from sharing a
+        # token, revoking one must not end the other. iat only has
+        # whole seconds, issued tells a login right after revoke_user
+        # from one right before it.
+        token = s.dumps({
+            'id': user_id,
+            'nonce': os.urandom(8).hex(),
+            'issued': time.time()
+        })
+
+        return token.decode('ascii')
+
+    def _is_revoked(self, token, identity):
+        if self.revoked.get(token):
+            return True
+
+        revoked_token, revoked_before = cache.get_many(
+            _token_key(token),
+            _user_key(identity.id)
+        )
+
+        if revoked_token:
+            return True
+
+        revoked_before = max(
+            revoked_before or 0,
+            self.revoked.get(_user_key(identity.id), 0)
+        )
+
+        return identity.issued_at <= revoked_before
+
+    def verify(self, token):
+        """
+        Returns the TokenIdentity of a valid token, None otherwise
+        """
+        identity = self.verified.get(token)
+
+        if identity is None:
+            try:
+                data, header = self._serializer().loads(
+                    token,
+                    return_header=True
+                )
+            except (SignatureExpired, BadSignature):
+                return None
+
+            identity = TokenIdentity(
+                data['id'],
+                data.get('issued', header['iat']),
+                header['exp']
+            )
+            self.verified.set(token, identity)
+
+        if identity.expires_at <= time.time() or \
+                self._is_revoked(token, identity):
+            self.verified.pop(token)
+            return None
+
+        return identity
+
+    def revoke(self, token):
+        """
+        Revokes a single token, for the rest of its lifetime
+        """
+        self.verified.pop(token)
+        self.revoked.set(token, True)
+
+        cache.set(
+            _token_key(token),
+            True,
+            timeout=current_app.config['AUTH_TOKEN_EXPIRES']
+        )
+
+    def revoke_user(self, user_id):
+        """
+        Revokes every token issued to user_id so far
+        """
+        now = time.time()
+        self.revoked.set(_user_key(user_id), now)
+
+        # without an application there is no cache to reach, as when
+        # models are committed with db.app alone
+        if not has_app_context():
+            return
+
+        cache.set(
+            _user_key(user_id),
+            now,
+            timeout=current_app.config['AUTH_TOKEN_EXPIRES']
+        )
+
+
+auth_tokens = AuthTokens()